@@ -150,6 +150,8 @@ def interaction_loop(agent = None, environment = None, options = {}):
 
         # Determine best exploitive action, or explore.
         explored = False
+        simulations = 0
+        hit_rate = 0.0
         if explore and (random.random() < explore_rate):
             # Yes, we're still exploring.
             # Generate a random action to explore.
@@ -167,6 +169,8 @@ def interaction_loop(agent = None, environment = None, options = {}):
                 print("Agent is trying to choose the best action, which may take some time...")
             # end if
             action = agent.search()
+            simulations = agent.search_simulations
+            hit_rate = agent.search_hit_rate
         # end def
 
         # Send the action to the environment.
@@ -181,11 +185,12 @@ def interaction_loop(agent = None, environment = None, options = {}):
         time_taken = datetime.datetime.now() - cycle_start
 
         # Log this cycle.
-        message = "%d, %s, %s, %s, %s, %f, %d, %f, %s, %d" % \
+        message = "%d, %s, %s, %s, %s, %f, %d, %f, %s, %d, %d, %f, %d" % \
                   (cycle, str(observation), str(reward),
                    str(action), str(explored), explore_rate,
                    agent.total_reward, agent.average_reward(),
-                   str(time_taken), agent.model_size())
+                   str(time_taken), agent.model_size(), simulations, hit_rate,
+                   agent.model_statistics()['bytes'])
         print(message)
 
 
@@ -223,9 +228,13 @@ def interaction_loop(agent = None, environment = None, options = {}):
               "average reward: %f" % agent.average_reward()
 
     print(message)
-    
 
-        
+    # Save the agent's model, if asked to. (Default: don't save.)
+    model_filename = str(options.get("ct-save", ""))
+    if model_filename:
+        agent.save_model(model_filename)
+        print("model saved to: %s" % model_filename)
+    # end if
 # end def
 
 def main(argv):
@@ -387,7 +396,8 @@ def main(argv):
 
     # Print an initial message header.
     message = "cycle, observation, reward, action, explored, " + \
-              "explore_rate, total reward, average reward, time, model size"
+              "explore_rate, total reward, average reward, time, model size, simulations, hit rate, " + \
+              "model bytes"
     print(message)
 
     # Try to import an agent module with the given name.
@@ -476,10 +486,11 @@ def main(argv):
     environment = environment_class(options = options)
 
     # Copy environment-dependent configuration options to the options.
-    options["action-bits"] = environment.action_bits()
-    options["observation-bits"] = environment.observation_bits()
-    options["percept-bits"] = environment.percept_bits()
-    options["reward-bits"] = environment.reward_bits()
+    schema = util.EncodingSchema(environment)
+    options["action-bits"] = schema.action_bits
+    options["observation-bits"] = schema.observation_bits
+    options["percept-bits"] = schema.percept_bits
+    options["reward-bits"] = schema.reward_bits
     options["max-action"] = environment.maximum_action()
     options["max-observation"] = environment.maximum_observation()
     options["max-reward"] = environment.maximum_reward()
@@ -35,9 +35,14 @@ class Agent:
          - `maximum_action()`
          - `maximum_reward()`
          - `model_size()`
+         - `model_statistics()`
          - `model_update_action()`
          - `model_update_percept()`
+         - `save_model()`
          - `search()`
+         - `search_hit_rate`
+         - `search_simulations`
+         - `set_environment()`
          - `total_reward`
     """
 
@@ -74,6 +79,14 @@ class Agent:
         # Stores the given configuration options.
         self.options = options
 
+        # The number of simulations run by the last search, for agents that simulate.
+        # Set initially to 0.
+        self.search_simulations = 0
+
+        # The fraction of lookups in the last search that found a shared search node,
+        # for agents that keep a transposition table. Set initially to 0.
+        self.search_hit_rate = 0.0
+
         # The total reward earnt by this agent so far.
         # Set initially to 0.
         self.total_reward = 0
@@ -162,6 +175,23 @@ class Agent:
         return 0
     # end def
 
+    def model_statistics(self):
+        """ Returns a dictionary describing the size of the agent's model, with at least
+            the number of `bytes` it takes.
+
+            WARNING: this method should be overriden by inheriting classes.
+        """
+        return {'bytes': 0}
+    # end def
+
+    def save_model(self, filename):
+        """ Saves the agent's model to the given file.
+
+            WARNING: this method should be overriden by inheriting classes.
+        """
+        pass
+    # end def
+
     def model_update_action(self, action):
         """ Update the agent's environment model with an action from the
             environment.
@@ -192,6 +222,19 @@ class Agent:
         return self.maximum_action()
     # end def
 
+    def set_environment(self, environment):
+        """ Switches the agent to a new environment.
+
+            - `environment`: the environment the agent interacts with from now on.
+
+            NOTE: this method may need to be overriden by inheriting classes,
+                  with this method called using `Agent.set_environment(self, environment)`.
+        """
+
+        assert environment is not None, "A non-null environment is required."
+        self.environment = environment
+    # end def
+
     def reset(self):
         """ Resets the agent.
 
@@ -12,6 +12,7 @@ import copy
 import os
 import random
 import sys
+import time
 
 # Insert the package's parent directory into the system search path, so that this package can be
 # imported when the aixi.py script is run directly from a release archive.
@@ -24,8 +25,17 @@ from six.moves import xrange
 from pyaixi import agent, prediction, util
 
 from pyaixi.agent import update_enum, action_update, percept_update
-from pyaixi.prediction import ctw_context_tree
-from pyaixi.search.monte_carlo_search_tree import MonteCarloSearchNode, mcts_planning
+from pyaixi.prediction import ctw_array_context_tree, ctw_context_tree
+from pyaixi.prediction.ctw_overlay_context_tree import CTWOverlayContextTree
+from pyaixi.search.monte_carlo_search_tree import MonteCarloSearchNode, ParallelSearchPool, TranspositionTable, \
+                                                 decision_node, mcts_planning, parallel_mcts_planning
+
+# The context tree implementations that can be selected with the 'ct-backend' option.
+context_tree_backends = {'object': ctw_context_tree.CTWContextTree,
+                         'array':  ctw_array_context_tree.CTWArrayContextTree}
+
+# The ways of undoing a simulation that can be selected with the 'ct-simulation' option.
+simulation_modes = ('journal', 'overlay')
 
 class MC_AIXI_CTW_Undo:
     """ A class to save details from a MC-AIXI-CTW agent to restore state later.
@@ -42,6 +52,16 @@ class MC_AIXI_CTW_Undo:
         self.total_reward = agent.total_reward
         self.history_size = agent.history_size()
         self.last_update = agent.last_update
+
+        # The count of bits the agent has changed in its context tree, so that reverting
+        # undoes only the bits changed since.
+        self.bits_changed = agent.bits_changed
+
+        # The context tree checkpoint to roll back to, if one has been taken. (See `set_savestate()`.)
+        self.context_tree_checkpoint = None
+
+        # The agent's real context tree, if the simulation runs on an overlay of it.
+        self.context_tree = None
     # end def
 # end class
 
@@ -116,12 +136,84 @@ class MC_AIXI_CTW_Agent(agent.Agent):
             The following options are optional:
              - `learning-period`: the number of cycles the agent should learn for.
                                   Defaults to '0', which is indefinite learning.
+             - `ct-backend`: the context tree implementation to use. Either 'object', which
+                             keeps one Python object per node, or 'array', which keeps all
+                             node state in flat typed arrays. Defaults to 'object'.
+             - `ct-simulation`: how the context tree is restored after each search simulation.
+                                Either 'journal', which records the changes a simulation makes
+                                to the tree and rolls them back, or 'overlay', which runs the
+                                simulation on a copy-on-write overlay of the tree and then throws
+                                the overlay away, leaving the tree itself untouched.
+                                Defaults to 'overlay'.
+             - `ct-max-nodes`: the most nodes the context tree should hold. Checked after each
+                               real update, outside of search.
+                               Defaults to '0', which is no limit.
+             - `ct-pruning`: how the context tree is kept within `ct-max-nodes`. Either 'lru',
+                             which evicts the nodes least recently on a context path, 'low-count',
+                             which evicts the nodes that have seen the fewest symbols, or 'freeze',
+                             which stops the tree learning once it is full.
+                             Defaults to 'lru'.
+             - `ct-load`: the name of a file saved by `save_model()` to start the context tree
+                          from, instead of an empty tree. The tree keeps the node budget it
+                          was saved with. Its depth must be `ct-depth`.
+                          Defaults to '', which starts from an empty tree.
+             - `mc-reuse-decay`: the factor by which the visit counts of the search tree kept from
+                                 the last cycle are scaled before they count towards the next search.
+                                 1 keeps the counts as they are, and 0 discards the tree.
+                                 Defaults to '1'.
+             - `mc-reuse-max-visits`: the most visits the root of a kept search tree may have;
+                                      the visit counts of larger trees are scaled down to fit.
+                                      Defaults to '0', which is no limit.
+             - `mc-workers`: the number of processes to share the simulations of each search
+                             between. With more than one, each process searches independently
+                             and the results at the root are merged (root-parallel search).
+                             The processes are forked at the first search, and kept until the
+                             agent is reset. Root-parallel searches do not keep a search tree for reuse.
+                             Defaults to '1', which searches in this process.
+             - `search-time-ms`: the time, in milliseconds, to spend on each search. When given,
+                                 the search simulates until this time is up, instead of running
+                                 `mc-simulations` simulations. Defaults to '0', which is no time limit.
+             - `search-early-stop`: if '1', the search stops as soon as the remaining simulations
+                                    (or the number the remaining time allows) could no longer change
+                                    which action has the best mean reward. Defaults to '0'.
+             - `mc-widening-constant`: the constant `k` of progressive widening at chance nodes,
+                                       which lets a chance node visited `n` times have at most
+                                       `k * n ** alpha` children, and sends further simulations
+                                       to its existing children. Useful for environments with
+                                       large observation spaces. Defaults to '0', which is no widening.
+             - `mc-widening-exponent`: the exponent `alpha` of progressive widening, between 0 and 1.
+                                       Defaults to '0.5'.
+             - `mc-transposition-size`: the number of search nodes to keep in a transposition table,
+                                        which lets search paths that reach the same model context
+                                        with the same remaining horizon share one decision node.
+                                        The least recently used nodes are dropped first. The table is
+                                        kept between searches only while the model is unchanged, and
+                                        emptied at the start of a search after any real update that
+                                        changed the model, since the statistics of its nodes were
+                                        gathered under an older model. A learning model changes at
+                                        every cycle (actions are learnt even after 'learning-period'),
+                                        so nodes are only kept once the tree is frozen, by the
+                                        'freeze' pruning policy or a loaded frozen model.
+                                        Root-parallel searches always start from empty tables.
+                                        Defaults to '0', which is no transposition table.
+             - `mc-percept-cache`: if '1', each chance node of the search tree caches the model's
+                                   percept bit probabilities, for each sequence of rewards it is
+                                   reached by, and later percepts there are sampled from the cache.
+                                   Within a search the model is then in the same state at every
+                                   visit, so the cache is exact. With a transposition table, it is
+                                   an approximation: a node shared by paths through different model
+                                   states samples from the probabilities of whichever path filled
+                                   the cache. If '0', every percept is sampled from the model.
+                                   Defaults to '1'.
         """
 
         # Sets up the base agent options, which handles getting and setting the
         # learning period, amongst other basic values.
         agent.Agent.__init__(self, environment = environment, options = options)
 
+        # The encoding of the environment's actions and percepts as symbols.
+        self.encoding_schema = util.EncodingSchema(environment)
+
         # The agent's context tree depth.
         # Retrieved from the given options under 'ct-depth'. Mandatory.
         assert 'ct-depth' in options, \
@@ -145,7 +237,27 @@ class MC_AIXI_CTW_Agent(agent.Agent):
         # (CTW) Context tree representing the agent's model of the environment.
         # Created for this instance.
 
-        self.context_tree = ctw_context_tree.CTWContextTree(self.depth,estimate_bits)
+        # Retrieved from the given options under 'ct-backend'. Defaults to 'object'.
+        backend = str(options.get('ct-backend', 'object'))
+        assert backend in context_tree_backends, \
+               "The given context tree backend '%s' is not one of %s." % (backend, sorted(context_tree_backends))
+
+        # The most nodes the context tree may hold, and how it is kept to that.
+        # Retrieved from the given options under 'ct-max-nodes' and 'ct-pruning'.
+        # Default to no limit, and 'lru'.
+        max_nodes = int(options.get('ct-max-nodes', 0))
+        pruning = str(options.get('ct-pruning', 'lru'))
+        assert max_nodes >= 0, "The given 'ct-max-nodes' node budget must not be negative."
+        assert pruning in ctw_context_tree.pruning_policies, \
+               "The given pruning policy '%s' is not one of %s." % (pruning, ctw_context_tree.pruning_policies)
+
+        self.context_tree = context_tree_backends[backend](self.depth, estimate_bits, max_nodes, pruning)
+
+        # How simulations are undone.
+        # Retrieved from the given options under 'ct-simulation'. Defaults to 'overlay'.
+        self.simulation_mode = str(options.get('ct-simulation', 'overlay'))
+        assert self.simulation_mode in simulation_modes, \
+               "The given simulation mode '%s' is not one of %s." % (self.simulation_mode, simulation_modes)
 
         # using the length difference of history size wouldnt work know,
         # as the maximum length of history wouldnt change, all we can do is
@@ -164,8 +276,75 @@ class MC_AIXI_CTW_Agent(agent.Agent):
                "The required 'mc-simulations' Monte Carlo simulations count option is missing from the given options."
         self.mc_simulations = int(options['mc-simulations'])
 
+        # The time budget of each search, in milliseconds, or 0 for none.
+        # Retrieved from the given options under 'search-time-ms'. Defaults to 0.
+        self.search_time_ms = float(options.get('search-time-ms', 0))
+        assert self.search_time_ms >= 0, "The search time must not be negative."
+
+        # Whether to stop searching once the best action is decided.
+        # Retrieved from the given options under 'search-early-stop'. Defaults to 0 (no).
+        self.search_early_stop = bool(int(options.get('search-early-stop', 0)))
+
+        # The number of processes to search with.
+        # Retrieved from the given options under 'mc-workers'. Defaults to 1.
+        self.workers = int(options.get('mc-workers', 1))
+        assert self.workers >= 1, "The number of search processes must be at least 1."
+
+        # The progressive widening parameters `(k, alpha)` of chance nodes, or None for no widening.
+        # Retrieved from the given options under 'mc-widening-constant' and 'mc-widening-exponent'.
+        widening_constant = float(options.get('mc-widening-constant', 0))
+        assert widening_constant >= 0, "The progressive widening constant must not be negative."
+        widening_exponent = float(options.get('mc-widening-exponent', 0.5))
+        assert 0.0 <= widening_exponent <= 1.0, "The progressive widening exponent must be between 0 and 1."
+        self.widening = (widening_constant, widening_exponent) if widening_constant > 0 else None
+
+        # The table through which the search shares decision nodes, or None.
+        # Retrieved from the given options under 'mc-transposition-size'. Defaults to 0 (no table).
+        transposition_size = int(options.get('mc-transposition-size', 0))
+        assert transposition_size >= 0, "The transposition table size must not be negative."
+        self.transpositions = TranspositionTable(transposition_size) if transposition_size > 0 else None
+
+        # The number of real updates that have changed the model's predictions, and its value
+        # when the transposition table was last emptied. The table's nodes are kept while they match.
+        self.model_version = 0
+        self.transposition_version = 0
+
+        # The scaling applied to the visit counts of a search tree kept for the next search.
+        # Retrieved from the given options under 'mc-reuse-decay' and 'mc-reuse-max-visits'.
+        self.reuse_decay = float(options.get('mc-reuse-decay', 1.0))
+        assert 0.0 <= self.reuse_decay <= 1.0, "The search tree reuse decay must be between 0 and 1."
+        self.reuse_max_visits = int(options.get('mc-reuse-max-visits', 0))
+        assert self.reuse_max_visits >= 0, "The search tree reuse visit limit must not be negative."
+
+        # The search tree to start the next search from: the part of the last search tree
+        # that follows the real actions and observations since, or None.
+        self.search_tree = None
+
+        # Whether a search is running, in which case model updates are simulated ones.
+        self.searching = False
+
+        # The worker processes of root-parallel searches, once forked, or None.
+        self.search_pool = None
+
+        # The number of searches so far, which tells search tree caches from earlier searches apart.
+        self.search_count = 0
+
+        # Whether chance nodes cache the model's percept bit probabilities.
+        # Retrieved from the given options under 'mc-percept-cache'. Defaults to 1 (yes).
+        self.percept_caching = bool(int(options.get('mc-percept-cache', 1)))
+
         self.reset()
 
+        # A saved context tree to start from, in place of the empty one.
+        # Retrieved from the given options under 'ct-load'. Defaults to none.
+        model_filename = str(options.get('ct-load', ''))
+        if model_filename:
+            self.context_tree = context_tree_backends[backend].load(model_filename)
+            assert self.context_tree.depth == self.depth, \
+                   "The context tree in '%s' has depth %d, not the 'ct-depth' of %d." % \
+                   (model_filename, self.context_tree.depth, self.depth)
+        # end if
+
         # Saves a state of the agent that allows restoring the savestate.
         self.savestate = MC_AIXI_CTW_Undo(self)
     # end def
@@ -177,7 +356,7 @@ class MC_AIXI_CTW_Agent(agent.Agent):
             - `symbol_list`: the symbol list to decode the action from.
         """
 
-        return util.decode(symbol_list, self.environment.action_bits())
+        return self.encoding_schema.decode_action(symbol_list)
     # end def
 
     def decode_observation(self, symbol_list):
@@ -186,7 +365,7 @@ class MC_AIXI_CTW_Agent(agent.Agent):
             - `symbol_list`: the symbol list to decode the observation from.
         """
 
-        return util.decode(symbol_list, self.environment.observation_bits())
+        return util.decode(symbol_list, self.encoding_schema.observation_bits)
     # end def
 
     def decode_reward(self, symbol_list):
@@ -195,7 +374,7 @@ class MC_AIXI_CTW_Agent(agent.Agent):
             - `symbol_list`: the symbol list to decode the reward from.
         """
 
-        return util.decode(symbol_list, self.environment.reward_bits())
+        return util.decode(symbol_list, self.encoding_schema.reward_bits)
     # end def
 
     def decode_percept(self, symbol_list):
@@ -205,24 +384,8 @@ class MC_AIXI_CTW_Agent(agent.Agent):
             - `symbol_list`: the symbol list to decode the percept from.
         """
 
-        # Check if we've got exactly enough symbols.
-        reward_bits = self.environment.reward_bits()
-        observation_bits = self.environment.observation_bits()
-
-        assert len(symbol_list) >= (reward_bits + observation_bits),\
-               "The given symbol list isn't long enough to contain a percept."
-
-        # Get the reward symbols from the given symbol list, starting with the
-        # reward, then getting the observation from the list after that.
-        reward_symbols      = symbol_list[:reward_bits]
-        observation_symbols = symbol_list[reward_bits:(reward_bits + observation_bits)]
-
-        # Decode the obtained symbols.
-        reward      = self.decode_reward(reward_symbols)
-        observation = self.decode_observation(observation_symbols)
-
-        # Return the decoded percept as a tuple of observation and reward.
-        return (observation, reward)
+        # The reward comes first in the symbol list, followed by the observation.
+        return self.encoding_schema.decode_percept(symbol_list)
     # end def
 
     def encode_action(self, action):
@@ -231,7 +394,7 @@ class MC_AIXI_CTW_Agent(agent.Agent):
             - `action`: the action to encode.
         """
 
-        return util.encode(action, self.environment.action_bits())
+        return self.encoding_schema.encode_action(action)
     # end def
 
     def encode_percept(self, observation, reward):
@@ -241,12 +404,8 @@ class MC_AIXI_CTW_Agent(agent.Agent):
             - `reward`: the reward part of the percept to encode.
         """
 
-        # Add first the encoded reward, then the encoded observation to the list of output symbols.
-        symbol_list  = util.encode(reward, self.environment.reward_bits())
-        symbol_list += util.encode(observation, self.environment.observation_bits())
-
-        # Return the generated list.
-        return symbol_list
+        # The encoded reward comes first, then the encoded observation.
+        return self.encoding_schema.encode_percept(observation, reward)
     # end def
 
     ## Predict future history using CTW.
@@ -257,7 +416,7 @@ class MC_AIXI_CTW_Agent(agent.Agent):
 
         assert self.last_update == percept_update,  "Can only generate an action after a percept update."
 
-        action_bit_count = self.environment.action_bits()
+        action_bit_count = self.encoding_schema.action_bits
         action_bits = self.context_tree.generate_random_symbols(action_bit_count)
         return self.decode_action(action_bits)
     # end def
@@ -269,20 +428,26 @@ class MC_AIXI_CTW_Agent(agent.Agent):
 
         assert self.last_update == action_update,  "Can only generate a percept after an action update."
 
-        percept_bit_count = self.environment.percept_bits()
+        percept_bit_count = self.encoding_schema.percept_bits
         percept_bits = self.context_tree.generate_random_symbols(percept_bit_count)
         return self.decode_percept(percept_bits)
     # end def
 
-    def generate_percept_and_update(self):
+    def generate_percept_and_update(self, percept_cache = None):
         """ Generates a percept (observation, reward), distributed according to the agent's history
             statistics, then updates the context tree with it, and return it.
             THe percept would update parameters the context tree (learning) iff the agent is still learning.
             otherwise, it would only update the history of the context tree.
+
+            - `percept_cache`: a dictionary that caches, for the current model state, the probability
+                               of each percept bit being 1 given the bits before it, or None.
+                               The model must be in the same state at every call made with the
+                               same cache. (See `CTWContextTree.generate_random_symbols_and_update`.)
         """
 
         assert self.last_update == action_update,  "Can only perform a percept update after an action update."
-        percept_symbol = self.context_tree.generate_random_symbols_and_update(self.environment.percept_bits())
+        percept_symbol = self.context_tree.generate_random_symbols_and_update(self.encoding_schema.percept_bits,
+                                                                              percept_cache)
         observation, reward = self.decode_percept(percept_symbol)
         self.bits_changed += len(percept_symbol)
         self.total_reward += reward
@@ -291,6 +456,29 @@ class MC_AIXI_CTW_Agent(agent.Agent):
         return observation, reward
     # end def
 
+    def replay_percept_and_update(self, observation, reward):
+        """ Updates the context tree with the given simulated percept (observation, reward),
+            exactly as `generate_percept_and_update()` does with a percept it generates,
+            and returns it. The search uses this to revisit a percept it sampled before.
+
+            Unlike `model_update_percept()`, this always learns, and counts the bits changed,
+            so that the update is undone like any other simulated one.
+
+            - `observation`: the observation part of the percept.
+            - `reward`: the reward part of the percept.
+        """
+
+        assert self.last_update == action_update,  "Can only perform a percept update after an action update."
+
+        percept_symbols = self.encode_percept(observation, reward)
+        self.context_tree.update(percept_symbols)
+        self.bits_changed += len(percept_symbols)
+        self.total_reward += reward
+        self.last_update = percept_update
+
+        return observation, reward
+    # end def
+
     ## Inquire its model for probability of future.
 
     def action_probability(self, action):
@@ -315,6 +503,15 @@ class MC_AIXI_CTW_Agent(agent.Agent):
         return self.context_tree.predict(self.encode_percept(observation, reward))
     # end def
 
+    def model_context(self):
+        """ Returns the most recent `ct-depth` symbols of the history, most recent first.
+            These are all the context tree predicts from, so they stand for the model's
+            predictive state.
+        """
+
+        return self.context_tree.history.context(self.depth)
+    # end def
+
     def history_size(self):
         """ Returns the length of the stored history for an agent.
         """
@@ -328,7 +525,7 @@ class MC_AIXI_CTW_Agent(agent.Agent):
             NOTE: this is for binary alphabets.
         """
 
-        return max(self.environment.action_bits(), self.environment.percept_bits())
+        return max(self.encoding_schema.action_bits, self.encoding_schema.percept_bits)
     # end def
 
     ## For saving and loading the agent state.
@@ -340,10 +537,21 @@ class MC_AIXI_CTW_Agent(agent.Agent):
         self.age = undo_instance.age
         self.total_reward = undo_instance.total_reward
         self.last_update = undo_instance.last_update
-        difference = self.context_tree.depth  - undo_instance.history_size
-        difference = max(difference,0)
-        self.context_tree.revert(self.bits_changed+difference)
-        self.bits_changed = 0
+
+        if undo_instance.context_tree is not None:
+            # Throw away the overlay the simulation ran on.
+            self.context_tree = undo_instance.context_tree
+            undo_instance.context_tree = None
+        elif undo_instance.context_tree_checkpoint is not None:
+            # Restore the recorded node values, rather than replaying every bit backwards.
+            self.context_tree.rollback(undo_instance.context_tree_checkpoint)
+            undo_instance.context_tree_checkpoint = None
+        else:
+            difference = self.context_tree.depth  - undo_instance.history_size
+            difference = max(difference,0)
+            self.context_tree.revert(self.bits_changed - undo_instance.bits_changed + difference)
+        # end if
+        self.bits_changed = undo_instance.bits_changed
 
         '''
         old_history_size = undo_instance.history_size
@@ -355,8 +563,16 @@ class MC_AIXI_CTW_Agent(agent.Agent):
 
     def set_savestate(self):
         """ Sets a savestate that can later be restored.
+            Depending on the 'ct-simulation' option, either the context tree records its changes
+            from here on, or the agent switches to an overlay of it, until the savestate is restored.
         """
         self.savestate = MC_AIXI_CTW_Undo(self)
+        if self.simulation_mode == 'overlay':
+            self.savestate.context_tree = self.context_tree
+            self.context_tree = CTWOverlayContextTree(self.context_tree)
+        else:
+            self.savestate.context_tree_checkpoint = self.context_tree.checkpoint()
+        # end if
     # end def
 
     def restore_savestate(self):
@@ -369,6 +585,20 @@ class MC_AIXI_CTW_Agent(agent.Agent):
         return self.context_tree.size()
     # end def
 
+    def model_statistics(self):
+        """ Returns the number of nodes in the agent's context tree, in total and at each depth,
+            and an estimate of the bytes they take. See `CTWContextTree.memory_statistics`.
+        """
+        return self.context_tree.memory_statistics()
+    # end def
+
+    def save_model(self, filename):
+        """ Saves the agent's context tree to the given file, from which the 'ct-load' option
+            can start a later agent. See `CTWContextTree.save`.
+        """
+        self.context_tree.save(filename)
+    # end def
+
     def model_update_action(self, action):
         """ Updates the agent's environment model with an action.
 
@@ -384,7 +614,8 @@ class MC_AIXI_CTW_Agent(agent.Agent):
         # Get the symbols that represent this action.
         action_symbols = self.encode_action(action)
 
-        # Update the context tree.
+        # Update the context tree, which learns from the action unless it is frozen.
+        learned = not self.context_tree.frozen
         self.context_tree.update(action_symbols)
 
         self.bits_changed += len(action_symbols)
@@ -392,6 +623,18 @@ class MC_AIXI_CTW_Agent(agent.Agent):
         # Update other properties.
         self.age += 1
         self.last_update = action_update
+
+        # Follow the real action in the kept search tree, keep the model within its budget,
+        # and have the search workers replay the update.
+        if not self.searching:
+            self.reuse_search_tree(action)
+            if self.context_tree.enforce_node_budget() > 0 or learned:
+                self.model_version += 1
+            # end if
+            if self.search_pool is not None:
+                self.search_pool.record(('action', action))
+            # end if
+        # end if
     # end def
 
     def model_update_percept(self, observation, reward):
@@ -414,8 +657,10 @@ class MC_AIXI_CTW_Agent(agent.Agent):
         if ((self.learning_period > 0) and (self.age > self.learning_period)):
             # No. Update, but don't learn.
             self.context_tree.update_history(percept_symbols)
+            learned = False
         else:
-            # Yes. Update and learn.
+            # Yes. Update and learn, unless the tree is frozen.
+            learned = not self.context_tree.frozen
             self.context_tree.update(percept_symbols)
 
             #self.bits_changed += len(percept_symbols)
@@ -425,14 +670,46 @@ class MC_AIXI_CTW_Agent(agent.Agent):
         self.total_reward += reward
         self.last_update = percept_update
 
+        # Follow the real observation in the kept search tree, keep the model within its budget,
+        # and have the search workers replay the update.
+        if not self.searching:
+            self.reuse_search_tree(observation)
+            if self.context_tree.enforce_node_budget() > 0 or learned:
+                self.model_version += 1
+            # end if
+            if self.search_pool is not None:
+                self.search_pool.record(('percept', observation, reward))
+            # end if
+        # end if
     # end def
 
-    def generate_ctw_random_action(self, ctw):
-        ''' Generates a random action.
-        '''
+    def close_search_pool(self):
+        """ Stops the worker processes of root-parallel searches, if there are any.
+            They are forked again at the next search.
+        """
+
+        if self.search_pool is not None:
+            self.search_pool.close()
+            self.search_pool = None
+        # end if
+    # end def
+
+    def generate_ctw_random_action(self, ctw = None):
+        """ Returns a valid action, chosen at random in proportion to the probability the given
+            context tree predicts for its encoding.
+
+            - `ctw`: the context tree to predict with. (Default: the agent's context tree.)
+        """
+
+        assert self.last_update == percept_update,  "Can only generate an action after a percept update."
+
+        if ctw is None:
+            ctw = self.context_tree
+        # end if
         actions = [self.encode_action(action) for action in self.environment.valid_actions]
         action = ctw.generate_random_actions(actions)
         return self.decode_action(action)
+    # end def
 
 
     def playout(self, horizon):
@@ -464,12 +741,66 @@ class MC_AIXI_CTW_Agent(agent.Agent):
         return reward_sum
     # end def
 
+    def reuse_search_tree(self, key):
+        """ Moves the root of the kept search tree to its child for the given real action or
+            observation, discarding the tree if the search never reached that child.
+            Once the root is a decision node again, its visit counts are scaled according to
+            the 'mc-reuse-decay' and 'mc-reuse-max-visits' options.
+
+            - `key`: the action the agent performed, or the observation it received.
+        """
+
+        if self.search_tree is None:
+            return
+        # end if
+
+        self.search_tree = self.search_tree.child(key)
+
+        if self.search_tree is not None and self.search_tree.type == decision_node:
+            factor = self.reuse_decay
+            if self.reuse_max_visits > 0 and self.search_tree.visits * factor > self.reuse_max_visits:
+                factor = self.reuse_max_visits / self.search_tree.visits
+            # end if
+
+            if factor < 1.0:
+                self.search_tree.scale_visits(factor)
+            # end if
+
+            if self.search_tree.visits == 0:
+                self.search_tree = None
+            # end if
+        # end if
+    # end def
+
+    def set_environment(self, environment):
+        """ Switches the agent to a new environment, and works out the encoding of its actions and percepts.
+
+            - `environment`: the environment the agent interacts with from now on.
+        """
+
+        agent.Agent.set_environment(self, environment)
+        self.encoding_schema = util.EncodingSchema(environment)
+
+        # The kept search tree, and any nodes shared with it, were built for the old environment,
+        # and the search workers' copies of the agent still have it.
+        self.search_tree = None
+        self.close_search_pool()
+        if self.transpositions is not None:
+            self.transpositions.clear()
+        # end if
+    # end def
+
     def reset(self):
         """ Resets the agent and clears the context tree.
         """
 
-        # Clears the context tree.
+        # Clears the context tree, the search tree built on it, and the search workers' copies.
         self.context_tree.clear()
+        self.search_tree = None
+        self.close_search_pool()
+        if self.transpositions is not None:
+            self.transpositions.clear()
+        # end if
 
         # Resets the basic agent details: age, total_reward, last_update.
         agent.Agent.reset(self)
@@ -479,7 +810,84 @@ class MC_AIXI_CTW_Agent(agent.Agent):
         """ Returns the best action for this agent as determined using the Monte-Carlo Tree Search
             (predictive UCT).
         """
-        # Use ρUCT to search for the next action.
-        return mcts_planning(self, self.horizon, self.mc_simulations)
+        # With a time budget, simulate until the deadline rather than for a fixed number of simulations.
+        iterations = self.mc_simulations
+        deadline = None
+        if self.search_time_ms > 0:
+            iterations = None
+            deadline = time.time() + self.search_time_ms / 1000.0
+        # end if
+
+        # The model has changed since the last search, so percept caches must be refilled.
+        self.search_count += 1
+
+        # Count the transposition table lookups of this search only. The nodes of earlier searches
+        # are dropped if the model has changed since, since their visits and means were sampled
+        # from an older model, and grafting them into this search would count stale samples as
+        # fresh ones. (A kept search tree is scaled instead; see `reuse_search_tree()`.)
+        if self.transpositions is not None:
+            if self.transposition_version != self.model_version:
+                self.transpositions.clear()
+                self.transposition_version = self.model_version
+            # end if
+            lookups, hits = self.transpositions.lookups, self.transpositions.hits
+        # end if
+
+        if self.workers > 1 and self.search_pool is None:
+            try:
+                self.search_pool = ParallelSearchPool(self, self.workers)
+            except ValueError:
+                # Processes cannot be forked here, so search in this process.
+                self.workers = 1
+            # end try
+        # end if
+
+        if self.workers > 1:
+            # Use root-parallel ρUCT, which starts each worker from an empty tree.
+            root = MonteCarloSearchNode(decision_node)
+            self.search_tree = None
+            self.searching = True
+            try:
+                action = parallel_mcts_planning(self, self.horizon, iterations, self.workers, root,
+                                                deadline, self.search_early_stop, self.widening,
+                                                self.transpositions, self.search_pool)
+            finally:
+                self.searching = False
+                if not self.search_pool.connections:
+                    # The pool closed itself after an interruption; fork a new one next time.
+                    self.search_pool = None
+                # end if
+            # end try
+
+            self.search_simulations = root.visits
+        else:
+            # Continue from the search tree kept from the last search, if there is one.
+            if self.search_tree is None:
+                self.search_tree = MonteCarloSearchNode(decision_node)
+            # end if
+            visits = self.search_tree.visits
+
+            # Use ρUCT to search for the next action.
+            # The agent must leave search mode even if the search is interrupted, or later real
+            # updates would neither follow the kept search tree nor keep the model within its budget.
+            self.searching = True
+            try:
+                action = mcts_planning(self, self.horizon, iterations, self.search_tree,
+                                       deadline, self.search_early_stop, self.widening, self.transpositions)
+            finally:
+                self.searching = False
+            # end try
+
+            # Every simulation visits the root once.
+            self.search_simulations = self.search_tree.visits - visits
+        # end if
+
+        if self.transpositions is not None:
+            lookups = self.transpositions.lookups - lookups
+            hits = self.transpositions.hits - hits
+            self.search_hit_rate = hits / lookups if lookups > 0 else 0.0
+        # end if
+
+        return action
     # end def
 # end class
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the MC-AIXI-CTW agent.
+"""
+
+from pyaixi.agents.mc_aixi_ctw import MC_AIXI_CTW_Agent
+from pyaixi.environments.coin_flip import CoinFlip
+from pyaixi.search.monte_carlo_search_tree import MonteCarloSearchNode, decision_node, parallel_mcts_planning
+import unittest
+import random
+
+
+#an agent on a coin flip environment, after the given number of real cycles.
+def coin_flip_agent(cycles = 4, **options):
+    random.seed(1)
+    environment = CoinFlip({'coin-flip-p': 0.7})
+    agent_options = {'agent-horizon': 3, 'ct-depth': 8, 'mc-simulations': 40}
+    agent_options.update(options)
+    agent = MC_AIXI_CTW_Agent(environment, agent_options)
+    agent.model_update_percept(environment.observation, environment.reward)
+    for cycle in range(cycles):
+        real_cycle(agent)
+    return agent
+
+#one real cycle of the agent: search, act, and receive the percept.
+def real_cycle(agent, action = None):
+    searched = agent.search()
+    if action is None:
+        action = searched
+    observation, reward = agent.environment.perform_action(action)
+    agent.model_update_action(action)
+    agent.model_update_percept(observation, reward)
+    return action, observation
+
+#the state of an agent's model, to compare the search workers' copies with the agent.
+def model_signature(agent, arguments = None):
+    return (agent.age, agent.total_reward, agent.last_update, agent.context_tree.size(),
+            agent.model_context(), round(agent.context_tree.predict([0,1,1]),10))
+
+#the values of an agent's environment that its search reads.
+def environment_signature(agent, arguments = None):
+    return (list(agent.environment.valid_actions), agent.environment.is_finished)
+
+
+class TestSearch(unittest.TestCase):
+
+    #an interrupted search should leave the agent out of search mode, on its real model.
+    def test_interrupted_search(self):
+        for mode in ['journal', 'overlay']:
+            agent = coin_flip_agent(**{'ct-simulation': mode})
+            context_tree = agent.context_tree
+            def interrupted_playout(horizon):
+                raise KeyboardInterrupt()
+            agent.playout = interrupted_playout
+            self.assertRaises(KeyboardInterrupt,agent.search)
+            self.assertFalse(agent.searching,"agent left in search mode")
+            self.assertTrue(agent.context_tree is context_tree,"agent left on a simulation model")
+
+    #root-parallel search should keep one pool of workers, in step with the agent,
+    #and give the root the visit-weighted mean of the merged actions.
+    def test_parallel_search_pool(self):
+        agent = coin_flip_agent(0, **{'mc-workers': 2, 'ct-max-nodes': 30})
+        real_cycle(agent)
+        pool = agent.search_pool
+        self.assertEqual(2,len(pool),"incorrect number of workers")
+        for cycle in range(5):
+            real_cycle(agent)
+            self.assertTrue(agent.search_pool is pool,"pool forked again")
+            for signature in pool.run(model_signature, [None, None]):
+                self.assertEqual(model_signature(agent),signature,"worker out of step")
+
+        #the workers' copies of the environment are not stepped, so they should be given
+        #the values the search reads from the real environment.
+        agent.environment.valid_actions = [1]
+        agent.environment.is_finished = True
+        for signature in pool.run(environment_signature, [None]):
+            self.assertEqual(([1], True),signature,"worker environment out of step")
+        agent.environment.valid_actions = [0, 1]
+        agent.environment.is_finished = False
+
+        root = MonteCarloSearchNode(decision_node)
+        parallel_mcts_planning(agent, agent.horizon, 40, 2, root, pool = pool)
+        statistics = root.action_statistics()
+        mean = sum(visits * mean for action, visits, mean in statistics) / sum(visits for action, visits, mean in statistics)
+        self.assertEqual(40,root.visits,"incorrect visits")
+        self.assertAlmostEqual(mean,root.mean,8,"incorrect root mean")
+
+        agent.reset()
+        self.assertTrue(agent.search_pool is None,"pool kept after reset")
+        self.assertEqual([],pool.processes,"pool not closed")
+
+    #while the model learns, each search should start from an empty transposition table,
+    #so that no node from an earlier search, sampled under an older model, is shared into it.
+    def test_transposition_table_cleared(self):
+        agent = coin_flip_agent(0, **{'mc-transposition-size': 1000, 'agent-horizon': 4})
+        earlier = set()
+        #the nodes of earlier searches, kept alive so that their ids are not reused.
+        kept = []
+        for cycle in range(6):
+            real_cycle(agent)
+            table = agent.transpositions
+            self.assertTrue(len(table) > 0,"transposition table not used")
+            nodes = set(id(node) for node in table.entries.values())
+            self.assertEqual(set(),nodes & earlier,"node from an earlier search kept")
+            earlier |= nodes
+            kept.extend(table.entries.values())
+
+    #once the model is frozen, the transposition table should be kept between searches,
+    #and later searches should find the nodes of earlier ones.
+    def test_transposition_table_kept(self):
+        agent = coin_flip_agent(0, **{'mc-transposition-size': 1000, 'agent-horizon': 4,
+                                      'ct-max-nodes': 20, 'ct-pruning': 'freeze'})
+        while not agent.context_tree.frozen:
+            real_cycle(agent)
+        real_cycle(agent)
+        table = agent.transpositions
+        earlier = dict(table.entries)
+        hits = table.hits
+        for cycle in range(6):
+            real_cycle(agent)
+            for key, node in earlier.items():
+                self.assertTrue(table.entries.get(key) is node,"node from an earlier search dropped")
+            earlier = dict(table.entries)
+        self.assertTrue(table.hits > hits,"no transposition hits")
+
+
+class TestSearchTreeReuse(unittest.TestCase):
+
+    #the visits and mean of every decision node of a search tree.
+    def decision_statistics(self, node):
+        statistics = [(node.visits, node.mean, node.action_statistics())]
+        for action, visits, mean in node.action_statistics():
+            for observation, child in sorted(node.child(action).children.items()):
+                statistics.extend(self.decision_statistics(child))
+        return statistics
+
+    #the kept search tree should be the child reached by the real action and observation,
+    #with its visits scaled by 'mc-reuse-decay' and capped by 'mc-reuse-max-visits'.
+    def test_reuse(self):
+        for options in [{}, {'mc-reuse-decay': 0.5}, {'mc-reuse-max-visits': 6}]:
+            agent = coin_flip_agent(0, **options)
+            reused = 0
+            for cycle in range(8):
+                action = agent.search()
+                tree = agent.search_tree
+                observation, reward = agent.environment.perform_action(action)
+                expected = tree.child(action).child(observation)
+                if expected is not None:
+                    visits = expected.visits
+                    statistics = self.decision_statistics(expected)
+
+                agent.model_update_action(action)
+                agent.model_update_percept(observation, reward)
+                if expected is None:
+                    self.assertTrue(agent.search_tree is None,"tree kept for an unsampled observation")
+                    continue
+
+                factor = options.get('mc-reuse-decay', 1.0)
+                if visits * factor > options.get('mc-reuse-max-visits', visits):
+                    factor = options['mc-reuse-max-visits'] / visits
+                if int(visits * factor) == 0:
+                    self.assertTrue(agent.search_tree is None,"tree kept without visits")
+                    continue
+
+                reused += 1
+                self.assertTrue(agent.search_tree is expected,"incorrect subtree kept")
+                self.assertEqual(int(visits * factor),expected.visits,"incorrect root visits")
+                if 'mc-reuse-max-visits' in options:
+                    self.assertTrue(expected.visits <= options['mc-reuse-max-visits'],"visits not capped")
+                if factor == 1.0:
+                    self.assertEqual(statistics,self.decision_statistics(expected),"tree changed")
+                else:
+                    for action, child_visits, mean in expected.action_statistics():
+                        old = [old_visits for old_action, old_visits, old_mean in statistics[0][2] if old_action == action][0]
+                        self.assertEqual(int(old * factor),child_visits,"incorrect action visits")
+            self.assertTrue(reused > 0,"no search tree was reused")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,14 +1,26 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 """
-Defines an environment for AIXI agents.
+Defines an environment for AIXI agents, and a batch of environments stepped together.
 """
 
 from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import random
 import sys
+
+# Ensure xrange is defined on Python 3.
+from six.moves import xrange
+
+# NumPy is optional: without it, `VecEnvironment` returns lists instead of arrays.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+# end try
+
 from pyaixi import util
 
 class Environment:
@@ -37,8 +49,14 @@ class Environment:
         If true, then there is no more interaction between the agent and environment,
         and the program exits. This can be thought of as the death of the agent.
         Otherwise the interaction continues.
+
+        Environments make their random choices with `self.random`, which is the `random` module
+        unless an instance is given a generator of its own, such as a `random.Random`.
     """
 
+    # The source of the environment's random choices. (See above.)
+    random = random
+
     def __init__(self, options = {}):
         """ Constructs an agent environment.
         """
@@ -165,18 +183,14 @@ class Environment:
         """ Returns the maximum number of bits required to represent an action.
         """
 
-        actions = [util.bits_required(action) for action in self.valid_actions]
-
-        return max(actions)
+        return util.bits_required(self.maximum_action())
     # end def
 
     def observation_bits(self):
         """ Returns the maximum number of bits required to represent an observation.
         """
 
-        observations = [util.bits_required(obs) for obs in self.valid_observations]
-
-        return max(observations)
+        return util.bits_required(self.maximum_observation())
     # end def
 
     def percept_bits(self):
@@ -190,7 +204,7 @@ class Environment:
         """ Returns the maximum number of bits required to represent a reward.
         """
 
-        return util.bits_required(self.reward)
+        return util.bits_required(self.maximum_reward())
     # end def
 
     def perform_action(self, action):
@@ -207,3 +221,195 @@ class Environment:
     # end def
 
 # end class
+
+
+class VecEnvironment:
+    """ A batch of independent copies of an environment, stepped together in one process.
+
+        - `step(actions)` performs one action in each copy, and returns arrays of the new
+          observations and rewards.
+
+        By default, each copy is an instance of the environment with a `random.Random` of its
+        own as `Environment.random`, so that copy `i` behaves exactly as the environment would
+        on its own after `random.seed(seed + i)`, however the copies are stepped, and the global
+        random state is left as it was. `step` is then a loop over the copies, which costs
+        about as much as stepping them directly. (Environments that draw from the `random`
+        module itself, rather than `self.random`, share its one sequence between the copies.)
+
+        With `tabular = True`, the environment is instead compiled to tables (see
+        `pyaixi.environments.tabular`), which suits small finite environments such as
+        `CoinFlip` and `KuhnPoker`, and `step` moves every copy at once with
+        `TabularModel.step`, which is vectorized if NumPy is available. The copies then
+        have the same distribution of percepts as the environment, though not the same
+        sequence for a given seed, and there are no environment instances to index.
+
+        The observations, rewards and finished flags of the copies are kept in the `observations`,
+        `rewards` and `finished` arrays, which are NumPy arrays if NumPy is available,
+        and lists otherwise.
+    """
+
+    def __init__(self, environment_class, count, options = {}, seed = 0, tabular = False):
+        """ Constructs the given number of copies of an environment.
+
+            - `environment_class`: the environment class, such as `CoinFlip`.
+            - `count`: the number of copies.
+            - `options`: the options to construct each copy with. Each copy gets its own
+                         copy of the dictionary, since environments may add their defaults to it.
+            - `seed`: the random seed of the first copy. Copy `i` is seeded with `seed + i`.
+                      With `tabular`, the seed of the whole batch.
+            - `tabular`: whether to step the copies through the environment's compiled tables.
+        """
+
+        assert count > 0, "The number of environment copies must be greater than zero."
+
+        self.count = count
+
+        # The environment's compiled model, and the state of each copy in it, if `tabular`.
+        self.model = None
+        self.states = None
+
+        # The copies, if not `tabular`.
+        self.environments = None
+
+        if tabular:
+            # Imported here, since the tabular module imports this one.
+            from pyaixi.environments import tabular as tabular_module
+
+            self.model = tabular_module.cached_model(environment_class, options)
+
+            # The valid actions, which are the same for every copy.
+            self.valid_actions = list(self.model.actions)
+
+            # A NumPy generator draws the uniforms of a whole step at once.
+            if numpy is not None:
+                self.generator = numpy.random.RandomState(seed)
+                self.action_indices = numpy.full(max(self.model.actions) + 1, -1, dtype = numpy.int64)
+                self.action_indices[self.model.actions] = numpy.arange(len(self.model.actions))
+            else:
+                self.generator = random.Random(seed)
+            # end if
+
+            # The observation, reward and finished flag of each state.
+            self.observation_table = self.array(self.model.observations)
+            self.reward_table = self.array(self.model.rewards)
+            self.finished_table = self.array(self.model.finished, bool)
+
+            self.states = self.array([self.model.sample_initial(uniform) for uniform in self.uniforms()])
+            self.update_percepts()
+            return
+        # end if
+
+        self.environments = []
+        saved_state = random.getstate()
+        for index in xrange(count):
+            # The constructor draws from the `random` module, seeded for this copy; the copy
+            # then continues the sequence with a generator of its own.
+            random.seed(seed + index)
+            environment = environment_class(options = dict(options))
+            environment.random = random.Random()
+            environment.random.setstate(random.getstate())
+            self.environments.append(environment)
+        # end for
+        random.setstate(saved_state)
+
+        # The valid actions, which are the same for every copy.
+        self.valid_actions = list(self.environments[0].valid_actions)
+
+        self.observations = self.array([environment.observation for environment in self.environments])
+        self.rewards = self.array([environment.reward for environment in self.environments])
+        self.finished = self.array([environment.is_finished for environment in self.environments], bool)
+    # end def
+
+    def __getitem__(self, index):
+        """ Returns the copy of the environment at the given index.
+        """
+
+        assert self.environments is not None, "A tabular batch has no environment instances."
+
+        return self.environments[index]
+    # end def
+
+    def __len__(self):
+        """ Returns the number of copies.
+        """
+
+        return self.count
+    # end def
+
+    def array(self, values, dtype = numpy.int64 if numpy is not None else int):
+        """ Returns the given values as a NumPy array of the given type if NumPy is available,
+            and as a list otherwise.
+        """
+
+        if numpy is None:
+            return list(values)
+        # end if
+
+        return numpy.array(values, dtype = dtype)
+    # end def
+
+    def step(self, actions):
+        """ Performs the given actions, one for each copy in order, and returns a tuple of the
+            observations and rewards that follow, as arrays. Copies that are finished are skipped,
+            and keep their last observation and reward.
+
+            The returned arrays are new on each call, so later steps do not change them.
+
+            - `actions`: a sequence of actions, one for each copy.
+        """
+
+        assert len(actions) == self.count, \
+               "Expected %d actions, one for each copy, not %d." % (self.count, len(actions))
+
+        if self.model is not None:
+            # A finished state only leads to itself, so finished copies keep their percepts.
+            if numpy is not None:
+                action_indices = self.action_indices[numpy.asarray(actions)]
+                assert (action_indices >= 0).all(), "Invalid action given."
+            else:
+                action_indices = [self.model.action_indices[action] for action in actions]
+            # end if
+            self.states = self.model.step(self.states, action_indices, self.uniforms())[0]
+            self.update_percepts()
+        else:
+            for index, environment in enumerate(self.environments):
+                if not environment.is_finished:
+                    environment.perform_action(actions[index])
+                # end if
+            # end for
+
+            self.observations = self.array([environment.observation for environment in self.environments])
+            self.rewards = self.array([environment.reward for environment in self.environments])
+            self.finished = self.array([environment.is_finished for environment in self.environments], bool)
+        # end if
+
+        return self.array(self.observations), self.array(self.rewards)
+    # end def
+
+    def uniforms(self):
+        """ Returns a point in [0, 1) for each copy, from the generator of a tabular batch.
+        """
+
+        if numpy is not None:
+            return self.generator.random_sample(self.count)
+        # end if
+
+        return [self.generator.random() for index in xrange(self.count)]
+    # end def
+
+    def update_percepts(self):
+        """ Sets the observations, rewards and finished flags of a tabular batch from the states
+            of its copies.
+        """
+
+        if numpy is not None:
+            self.observations = self.observation_table[self.states]
+            self.rewards = self.reward_table[self.states]
+            self.finished = self.finished_table[self.states]
+        else:
+            self.observations = [self.observation_table[state] for state in self.states]
+            self.rewards = [self.reward_table[state] for state in self.states]
+            self.finished = [self.finished_table[state] for state in self.states]
+        # end if
+    # end def
+# end class
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the batch of environments.
+"""
+
+from pyaixi.environment import VecEnvironment
+from pyaixi.environments.cheese_maze import CheeseMaze
+from pyaixi.environments.coin_flip import CoinFlip
+from pyaixi.environments.extended_tiger import ExtendedTiger
+from pyaixi.environments.kuhn_poker import KuhnPoker
+from pyaixi.environments.pac_man import PacMan
+import unittest
+import random
+
+
+environment_classes = [CoinFlip, ExtendedTiger, KuhnPoker, CheeseMaze, PacMan]
+
+
+class TestVecEnvironment(unittest.TestCase):
+
+    #each copy should behave as an environment seeded on its own, stepped alone.
+    def test_same_as_seeded_environments(self):
+        count, steps, seed = 6, 150, 20
+        for environment_class in environment_classes:
+            random.seed(1)
+            batch = VecEnvironment(environment_class, count, seed = seed)
+            chooser = random.Random(2)
+            actions = [[chooser.choice(batch[index].valid_actions) for index in range(count)] for step in range(steps)]
+
+            batch_percepts = []
+            for step in range(steps):
+                #draws between the steps should not reach the copies.
+                random.random()
+                observations, rewards = batch.step(actions[step])
+                batch_percepts.append(list(zip(list(observations), list(rewards))))
+
+            for index in range(count):
+                random.seed(seed + index)
+                environment = environment_class(options = {})
+                for step in range(steps):
+                    environment.perform_action(actions[step][index])
+                    self.assertEqual((environment.observation, environment.reward),batch_percepts[step][index],
+                                     "%s copy %d differs at step %d" % (environment_class.__name__, index, step))
+
+    #the arrays returned by a step should not change with later steps.
+    def test_fresh_arrays(self):
+        batch = VecEnvironment(CoinFlip, 8, seed = 3)
+        returned = []
+        for step in range(20):
+            observations, rewards = batch.step([1] * 8)
+            returned.append((observations, rewards, list(observations), list(rewards)))
+            self.assertFalse(observations is batch.observations,"internal observations returned")
+            self.assertFalse(rewards is batch.rewards,"internal rewards returned")
+        for observations, rewards, observations_then, rewards_then in returned:
+            self.assertEqual(observations_then,list(observations),"returned observations changed")
+            self.assertEqual(rewards_then,list(rewards),"returned rewards changed")
+
+    #stepping the batch should leave the global random state as it was.
+    def test_random_state_kept(self):
+        for tabular in [False, True]:
+            batch = VecEnvironment(KuhnPoker, 4, tabular = tabular)
+            random.seed(5)
+            state = random.getstate()
+            batch.step([0, 1, 0, 1])
+            self.assertEqual(state,random.getstate(),"random state changed")
+
+    #a tabular batch should give the percepts of a batch of the environment as often,
+    #in fresh arrays.
+    def test_tabular(self):
+        count, steps = 2000, 4
+        for environment_class in [CoinFlip, KuhnPoker]:
+            frequencies = []
+            for tabular in [False, True]:
+                batch = VecEnvironment(environment_class, count, seed = 7, tabular = tabular)
+                self.assertEqual(count,len(batch),"incorrect number of copies")
+                counts = {}
+                for step in range(steps):
+                    actions = [(index + step) % 2 for index in range(count)]
+                    observations, rewards = batch.step(actions)
+                    self.assertFalse(observations is batch.observations,"internal observations returned")
+                    self.assertEqual(list(observations),list(batch.observations),"incorrect observations kept")
+                    for action, observation, reward in zip(actions, list(observations), list(rewards)):
+                        percept = (action, observation, reward)
+                        counts[percept] = counts.get(percept, 0.0) + 1.0 / (count * steps)
+                frequencies.append(counts)
+            for percept in set(frequencies[0]) | set(frequencies[1]):
+                self.assertTrue(abs(frequencies[0].get(percept, 0.0) - frequencies[1].get(percept, 0.0)) < 0.02,
+                                "%s: percept %s" % (environment_class.__name__, percept))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -97,8 +97,8 @@ class CheeseMaze(environment.Environment):
         # Defines the acceptable observation values.
         self.valid_observations = list(cheese_maze_observation_enum.keys())
 
-        # Defines the acceptable reward values.
-        self.valid_rewards = list(cheese_maze_observation_enum.keys())
+        # Defines the acceptable reward values: finding the cheese also earns the reward for the move.
+        self.valid_rewards = [wall, move, move + cheese]
 
         # Initiate the game
         self.clear_restart()
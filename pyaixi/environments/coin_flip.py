@@ -9,7 +9,6 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import os
-import random
 import sys
 
 # Insert the package's parent directory into the system search path, so that this package can be
@@ -100,7 +99,7 @@ class CoinFlip(environment.Environment):
         assert 0.0 <= self.probability and self.probability <= 1.0
 
         # Set an initial percept.
-        self.observation = oHeads if random.random() < self.probability else oTails
+        self.observation = oHeads if self.random.random() < self.probability else oTails
         self.reward = 0
     # end def
 
@@ -114,7 +113,7 @@ class CoinFlip(environment.Environment):
         self.action = action
 
         # Flip the coin, set observation and reward appropriately.
-        if (random.random() < self.probability):
+        if (self.random.random() < self.probability):
             observation = oHeads
             reward = rWin if action == oHeads else rLose
         else:
@@ -11,7 +11,6 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import os
-import random
 import sys
 # Insert the package's parent directory into the system search path, so that this package can be
 # imported when the aixi.py script is run directly from a release archive.
@@ -129,7 +128,7 @@ class ExtendedTiger(environment.Environment):
             elif action == listen:
                 self.reward = normal # Valid action reward.
                 # Randomly decide if the agent heard the tiger correctly.
-                if (random.random() < self.default_probability):
+                if (self.random.random() < self.default_probability):
                     # Heard it correctly.
                     self.observation = self.tiger
                 else: # Heard it incorrectly.
@@ -169,7 +168,7 @@ class ExtendedTiger(environment.Environment):
         self.state = sitting # Agent starts sitting.
         self.observation = void # Agent starts hearing nothing.
         # Randomly initialize tiger location.
-        self.tiger = left if random.randint(0,1) == 1 else right
+        self.tiger = left if self.random.randint(0,1) == 1 else right
 
 #    def print(self):
 #        """ Returns a string indicating the status of the environment.
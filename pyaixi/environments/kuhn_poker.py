@@ -12,7 +12,6 @@ from __future__ import unicode_literals
 
 from pyaixi import environment, util
 import os
-import random
 import sys
 
 # Insert the package's parent directory into the system search path, so that this package can be
@@ -146,7 +145,7 @@ class KuhnPoker(environment.Environment):
         """ Start a new round, reset the players' cards, give new observation.
         """
         # Initialize game state.
-        self.agent_card, self.op_card = random.sample(card_list, 2) # Deal cards.
+        self.agent_card, self.op_card = self.random.sample(card_list, 2) # Deal cards.
         self.agent_wins_showdown = self.agent_card > self.op_card
         self.op_action_1 = op_pass # Opponent always passes first turn.
 
@@ -176,7 +175,7 @@ class KuhnPoker(environment.Environment):
                 self.reward = zeroChips
 
         elif self.action == agent_bet and self.op_action_1 == op_pass: # Opponent passed, agent betted.
-            if (self.op_card == q and random.random() < self.default_probability) or self.op_card == k:
+            if (self.op_card == q and self.random.random() < self.default_probability) or self.op_card == k:
                 self.op_action_2 = op_bet # Opponent bets again.
             else:
                 self.op_action_2 = op_pass # Opponent folds.
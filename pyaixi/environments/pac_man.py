@@ -10,9 +10,10 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import os
-import random
 import sys
-import numpy as np
+
+from array import array
+from collections import deque
 
 # Insert the package's parent directory into the system search path, so that this package can be
 # imported when the aixi.py script is run directly from a release archive.
@@ -47,6 +48,18 @@ direction = {
 
 direction_list = [[1,0],[-1,0],[0,-1],[0,1]]
 
+#the observation bits for a ghost and for a pellet in sight in each direction,
+#in the order of direction_list
+ghost_sight_bits = [pacman_ghost_observation_enum.gTopWall, pacman_ghost_observation_enum.gDownWall,
+                    pacman_ghost_observation_enum.gLeftWall, pacman_ghost_observation_enum.gRightWall]
+pellet_sight_bits = [pacman_sight_observation_enum.sTop, pacman_sight_observation_enum.sDown,
+                     pacman_sight_observation_enum.sLeft, pacman_sight_observation_enum.sRight]
+
+#the distances at which pellets can be smelt, and their observation bits. As in the
+#original scan, the distance is the number of rows, and the bits are 2**(d + smell_constant).
+smell_distances = [2,3,4]
+smell_bits = [2**(d + smell_constant) for d in smell_distances]
+
 #define the rules for getting reward
 rule = {
         "movement": -1,
@@ -60,6 +73,338 @@ rule = {
 #how much we need to add at most, in order to make the finial reward to be non-negative
 compensate = sum([abs(v) for v in rule.values() if v < 0])
 
+#the distance to a cell that cannot be reached, in PacManLayout.distances
+unreachable = 0xFFFF
+
+#the parsed layouts, keyed by the path of the layout file. (See load_layout.)
+layout_cache = dict()
+
+
+def load_layout(layout):
+    
+    """ 
+        returns the parsed layout of the given file, from
+        layout_cache if the file has not been modified since
+        it was parsed, and parsing it into the cache otherwise.
+   
+    Parameters
+    ----------
+    layout : string
+        the name of file that contains the map, relative to this module
+  
+    Returns
+    -------
+    PacManLayout
+        the parsed layout
+    
+    """
+    
+    #the path reading is based on the notes on stackoverflow
+    #link: https://stackoverflow.com/questions/50499/how-do-i-get-the-path-and-name-of-the-file-that-is-currently-executing
+    
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), layout)
+    mtime = os.path.getmtime(path)
+    
+    template = layout_cache.get(path)
+    
+    if template is None or template.mtime != mtime:
+        
+        template = PacManLayout(path, mtime)
+        layout_cache[path] = template
+    
+    return template
+
+
+class PacManLayout(object):
+    
+    ''' The parsed form of a layout file, shared by every game that uses it.
+        It is never changed once parsed: each game copies grid, and then
+        generates its pellets on the free cells.
+        
+        Attributes
+        ----------
+        
+        mtime : float
+            the modification time of the layout file when it was parsed
+        
+        rows : int
+            denotes the number of rows in the layout
+        
+        cols : int
+            denotes the number of columns in the layout
+        
+        grid : ((str))
+            the map without pellets and monsters
+        
+        magic_channel : dict()
+            the equivalent locations, as in PacMan.magic_channel
+        
+        free_cells : ((int,int))
+            the locations that may hold a pellet, in row order
+        
+        pacman : (int,int)
+            the starting location of pacman
+        
+        power_pill : ((int,int))
+            the locations of the power pills
+        
+        monster : ((str,(int,int)))
+            the names and starting locations of the monsters, in row order
+        
+        wall_observations, sight_masks, pellet_sight_masks, smell_masks :
+            the observation tables, as in PacMan
+        
+        neighbours : ((int,int))
+            for each cell, the open cells one move away, through the magic
+            channels, in the order of direction_list
+        
+        distances : (array)
+            for each open cell, the length of the shortest path from it to
+            every cell, or unreachable
+    '''
+    
+    
+    def __init__(self,path,mtime):
+        
+        """ 
+            parse the layout file at the given path, and
+            precompute its observation tables.
+       
+        Parameters
+        ----------
+        path : string
+            the path of the layout file
+        
+        mtime : float
+            the modification time of the layout file
+      
+        Returns
+        -------
+        None
+        
+        """
+        
+        self.mtime = mtime
+        self.magic_channel = dict()
+        
+        grid = []
+        
+        with open(path) as f:
+            for line in f.read().splitlines():
+                if "!" in line:
+                    a,b = line.strip().split("!")
+                    self.magic_channel[eval(a)] = eval(b)
+                    continue
+                
+                grid.append(list(line))
+        
+        self.rows = len(grid)
+        self.cols = len(grid[0])
+        
+        self.free_cells = []
+        self.power_pill = []
+        self.monster = []
+        
+        for x,line in enumerate(grid):
+            for y,char in enumerate(line):
+                if char == " ":
+                    self.free_cells.append((x,y))
+                elif char == "P":
+                    self.pacman = (x,y)
+                elif char == "S":
+                    self.power_pill.append((x,y))
+                elif char.isalpha():
+                    #keep only the walls on the map
+                    self.monster.append((char,(x,y)))
+                    grid[x][y] = " "
+        
+        self.grid = tuple(tuple(line) for line in grid)
+        self.free_cells = tuple(self.free_cells)
+        self.power_pill = tuple(self.power_pill)
+        self.monster = tuple(self.monster)
+        
+        self.build_observation_tables()
+        self.build_distance_tables()
+    
+    
+    def build_distance_tables(self):
+        
+        """ 
+            precompute the moves from every open cell, and the shortest
+            path distance between every pair of cells, taking the walls and
+            the magic channels into account, by a breadth first search from
+            each open cell. Cells are numbered row * cols + column.
+       
+        Parameters
+        ----------
+        None
+      
+        Returns
+        -------
+        None
+        
+        """
+        
+        rows, cols, layout = self.rows, self.cols, self.grid
+        
+        self.neighbours = [()] * (rows * cols)
+        
+        for x in range(rows):
+            
+            for y in range(cols):
+                
+                if layout[x][y] == "%":
+                    continue
+                
+                neighbours = []
+                
+                for m_x,m_y in direction_list:
+                    new_x,new_y = x + m_x,y + m_y
+                    
+                    if (new_x,new_y) in self.magic_channel:
+                        
+                        new_x,new_y = self.magic_channel[new_x,new_y]
+                    
+                    if layout[new_x][new_y] != "%":
+                        neighbours.append((new_x,new_y))
+                
+                self.neighbours[x * cols + y] = tuple(neighbours)
+        
+        self.neighbours = tuple(self.neighbours)
+        self.distances = [None] * (rows * cols)
+        
+        for x in range(rows):
+            
+            for y in range(cols):
+                
+                if layout[x][y] == "%":
+                    continue
+                
+                distance = array('H', [unreachable]) * (rows * cols)
+                distance[x * cols + y] = 0
+                queue = deque([(x,y)])
+                
+                while queue:
+                    c_x,c_y = queue.popleft()
+                    d = distance[c_x * cols + c_y] + 1
+                    
+                    for new_x,new_y in self.neighbours[c_x * cols + c_y]:
+                        
+                        if distance[new_x * cols + new_y] == unreachable:
+                            distance[new_x * cols + new_y] = d
+                            queue.append((new_x,new_y))
+                
+                self.distances[x * cols + y] = distance
+        
+        self.distances = tuple(self.distances)
+    
+    
+    def build_observation_tables(self):
+        
+        """ 
+            precompute the parts of the observations that only depend on the walls
+            of the layout, for every cell: the wall observation, the line of sight in
+            each direction, and the cells within smelling distance. Cells are numbered
+            row * cols + column, and sets of cells are bitmasks of those numbers, so that
+            PacMan.calculate_observation only needs a few bitmask operations.
+       
+        Parameters
+        ----------
+        None
+      
+        Returns
+        -------
+        None
+        
+        """
+        
+        rows, cols, layout = self.rows, self.cols, self.grid
+        
+        def is_wall(x,y):
+            return layout[x][y] == "%"
+        
+        self.wall_observations = [0] * (rows * cols)
+        self.sight_masks = [None] * (rows * cols)
+        self.pellet_sight_masks = [None] * (rows * cols)
+        self.smell_masks = [None] * (rows * cols)
+        
+        for x in range(rows):
+            
+            for y in range(cols):
+                
+                if is_wall(x,y):
+                    continue
+                
+                cell = x * cols + y
+                
+                #the walls next to the cell, through the magic channels
+                for key,l in direction.items():
+                    new_x,new_y = x + l[0],y + l[1]
+                    
+                    if (new_x,new_y) in self.magic_channel:
+                        
+                        new_x,new_y = self.magic_channel[new_x,new_y]
+                    
+                    if is_wall(new_x,new_y):
+                        self.wall_observations[cell] += 2**(int(key))
+                
+                #the cells in sight in each direction, up to the first wall
+                #or the edge of the map
+                sight = []
+                
+                for m_x,m_y in direction_list:
+                    mask = 0
+                    new_x,new_y = x + m_x,y + m_y
+                    
+                    while 0 <= new_x < rows and 0 <= new_y < cols and not is_wall(new_x,new_y):
+                        mask |= 1 << (new_x * cols + new_y)
+                        new_x,new_y = new_x + m_x,new_y + m_y
+                    
+                    sight.append(mask)
+                
+                #looking right includes the cell itself
+                sight[3] |= 1 << cell
+                self.sight_masks[cell] = sight
+                
+                #the original scan looks for pellets above the cell from the cell itself
+                #up to the row numbered by the offset of the first wall above it
+                pellet_sight = list(sight)
+                pellet_sight[0] = 0
+                offset = 0
+                
+                while x + offset < rows and not is_wall(x + offset,y):
+                    offset += 1
+                
+                for new_x in range(x,offset):
+                    pellet_sight[0] |= 1 << (new_x * cols + y)
+                
+                self.pellet_sight_masks[cell] = pellet_sight
+                
+                #the open cells at each smelling distance, in rows
+                smell = []
+                
+                for d in smell_distances:
+                    mask = 0
+                    
+                    for new_x in set([x - d,x + d]):
+                        
+                        if 0 <= new_x < rows:
+                            
+                            for new_y in range(cols):
+                                
+                                if not is_wall(new_x,new_y):
+                                    mask |= 1 << (new_x * cols + new_y)
+                    
+                    smell.append(mask)
+                
+                self.smell_masks[cell] = smell
+        
+        self.wall_observations = tuple(self.wall_observations)
+        self.sight_masks = tuple(self.sight_masks)
+        self.pellet_sight_masks = tuple(self.pellet_sight_masks)
+        self.smell_masks = tuple(self.smell_masks)
+
+
 class PacMan(environment.Environment):
         
     ''' Pacman
@@ -99,6 +444,26 @@ class PacMan(environment.Environment):
         layout : [[]]
             denotes the game map
                 
+        wall_observations : [int]
+            the wall observation of each cell, indexed by row * cols + column.
+            
+        sight_masks : [[int]]
+            for each cell, a bitmask of the cells in the wall-bounded line of sight
+            in each direction of direction_list. Looking right includes the cell itself.
+            
+        pellet_sight_masks : [[int]]
+            the cells in which pellets are seen from each cell, in each direction of
+            direction_list. Only looking up differs from sight_masks.
+            
+        smell_masks : [[int]]
+            for each cell, a bitmask of the open cells in the rows at each of smell_distances.
+            
+        pellets : int
+            a bitmask of the cells that hold a pellet.
+        
+        layout_template : PacManLayout
+            the parsed layout the game was loaded from.
+        
         monster : dict()
             used to store the current location of monster.
             The key is name of monster, and the value is location of monster
@@ -177,7 +542,7 @@ class PacMan(environment.Environment):
         
         """        
         
-        if x == ' ' and default_probability > random.random():
+        if x == ' ' and default_probability > self.random.random():
             
             return "*"
         
@@ -190,7 +555,10 @@ class PacMan(environment.Environment):
         """ 
             loading the user defined layout of map, and 
             generate the pellets. And setting the number of 
-            rows and columns to the attribute
+            rows and columns to the attribute.
+            The layout is parsed once and then taken from
+            layout_cache, so only the pellets are generated
+            on each restart.
        
         Parameters
         ----------
@@ -204,32 +572,29 @@ class PacMan(environment.Environment):
         
         """          
         
-        pacMan_map = []
-        sep = '/' if '/' in PROJECT_ROOT else ''''\''''
-        import inspect
+        self.layout_template = load_layout(layout)
+        
+        self.rows = self.layout_template.rows
+        self.cols = self.layout_template.cols
+        self.magic_channel = dict(self.layout_template.magic_channel)
+        self.wall_observations = self.layout_template.wall_observations
+        self.sight_masks = self.layout_template.sight_masks
+        self.pellet_sight_masks = self.layout_template.pellet_sight_masks
+        self.smell_masks = self.layout_template.smell_masks
+        self.neighbours = self.layout_template.neighbours
+        self.distances = self.layout_template.distances
         
-        #the path reading is based on the notes on stackoverflow
-        #link: https://stackoverflow.com/questions/50499/how-do-i-get-the-path-and-name-of-the-file-that-is-currently-executing
+        pacMan_map = [list(line) for line in self.layout_template.grid]
+        self.pellets = 0
         
-        path = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))) + sep + layout
+        for x,y in self.layout_template.free_cells:
             
-        with open(path) as f:
-            lines = f.readlines()
-            for line in lines:
-                if "!" in line:
-                    a,b = line.strip().split("!")
-                    a = eval(a)
-                    b = eval(b)
-                    self.magic_channel[a] = b
-                    continue
-                    
-                line = list(map(self.random_pellets,line))
-                line.remove("\n")
-                self.pellets_remaining += line.count("*")
-                pacMan_map.append(line) 
+            pacMan_map[x][y] = self.random_pellets(pacMan_map[x][y])
+            
+            if pacMan_map[x][y] == "*":
+                self.pellets |= 1 << (x * self.cols + y)
+                self.pellets_remaining += 1
         
-        self.rows = len(pacMan_map)
-        self.cols = len(pacMan_map[0])
         return pacMan_map
     
     
@@ -237,11 +602,8 @@ class PacMan(environment.Environment):
         
         """ 
             collecting the location information of 
-            monster and power pill, and preprocessing the
-            map. In order to, only keep the walls and
-            pellet on the concrete reprensentation of map.
-            For the sake of performing action and movement
-            of monster.
+            pacman, monster and power pill from the
+            layout template.
             
        
         Parameters
@@ -254,34 +616,12 @@ class PacMan(environment.Environment):
         
         """     
         
-        row = 0
+        #the layout template already keeps only the walls on the map
+        template = self.layout_template
         
-        for line in self.layout:
-            
-            col = 0
-            
-            for char in line:
-                
-                if char =="P":
-                    self.pacman = [row,col]
-                    
-                elif char == "S":
-                    
-                    self.power_pill.append([row,col])
-                
-                elif char.isalpha():
-                    
-                    self.monster[char] = [row,col]
-                    
-                
-                col+=1
-                
-            row+=1
-            
-        for name,positon in self.monster.items():
-            #make the layout clean
-            x,y = positon
-            self.layout[x][y] = " "
+        self.pacman = list(template.pacman)
+        self.power_pill = [list(location) for location in template.power_pill]
+        self.monster = dict((name,list(location)) for name,location in template.monster)
             
         
         
@@ -364,6 +704,7 @@ class PacMan(environment.Environment):
             
             self.reward += rule["pellet"]
             self.layout[x][y] = " "
+            self.pellets &= ~(1 << (x * self.cols + y))
             self.pellets_remaining -= 1
         
         elif on_map == "%":
@@ -399,8 +740,8 @@ class PacMan(environment.Environment):
                 
                 while self.layout[m_x][m_y] == "%" and [m_x,m_y] not in self.monster.values():
                 
-                    m_x = random.randint(0,self.rows-1)
-                    m_y = random.randint(0,self.cols-1)
+                    m_x = self.random.randint(0,self.rows-1)
+                    m_y = self.random.randint(0,self.cols-1)
                     
                 self.monster[name] =[m_x,m_y]
                 
@@ -478,124 +819,33 @@ class PacMan(environment.Environment):
         None
         
         '''
-                
-        observation = 0
-        
+
         p_x, p_y = self.pacman
-        
-        # using numpy arrarys are benefits in different ways 
-        # of indexing
-        layout = np.array(self.layout)
-        shadow_layout = np.array(self.layout)
-        
+        cell = p_x * self.cols + p_y
         
         #calculate the obervations for wall
-        for key,l in direction.items():
-            x,y = l
-            new_x,new_y = p_x+x,p_y+y
-            
-            if (new_x,new_y) in self.magic_channel:
-                
-                new_x,new_y = self.magic_channel[new_x,new_y]
-            
-            if self.layout[new_x][new_y] == "%":
-                # the relation of them 2**?, because of the the mathmatical
-                # coincidence
-                observation += 2**(int(key))
-                
-        #calculate the obervations for monster    
+        observation = self.wall_observations[cell]
         
-        for name,l in self.monster.items():
-            x,y = l
-            shadow_layout[x,y] = name
-          
+        #calculate the obervations for monster and for pellets in sight.
+        ghosts = 0
+        for m_x,m_y in self.monster.values():
+            ghosts |= 1 << (m_x * self.cols + m_y)
         
-        if self.monster_names.intersection(shadow_layout[p_x,p_y:]):
-            #right,including at same position
-            for name in self.monster_names.intersection(shadow_layout[p_x,p_y:]):
-                m_x,m_y = self.monster[name]
-                #no wall in the sight
-                if "%" not in shadow_layout[p_x,p_y:m_y]:
-                    observation+= pacman_ghost_observation_enum.gRightWall
-                    break
-        
-        if self.monster_names.intersection(shadow_layout[p_x,:p_y]):
-            #left
+        for mask,ghost_bit in zip(self.sight_masks[cell],ghost_sight_bits):
             
-            for name in self.monster_names.intersection(shadow_layout[p_x,:p_y]):
-                m_x,m_y = self.monster[name]
-                #no wall in the sight
-                if "%" not in shadow_layout[p_x,m_y:p_y]:
-                    observation+= pacman_ghost_observation_enum.gLeftWall
-                    break
+            if ghosts & mask:
+                observation += ghost_bit
         
-        if self.monster_names.intersection(shadow_layout[:p_x,p_y]):
-            #down
-            for name in self.monster_names.intersection(shadow_layout[:p_x,p_y]):
-                m_x,m_y = self.monster[name]
-                #no wall in the sight
-                if "%" not in shadow_layout[m_x:p_x,p_y]:
-                    observation+= pacman_ghost_observation_enum.gDownWall
-                    break
+        for mask,pellet_bit in zip(self.pellet_sight_masks[cell],pellet_sight_bits):
             
-        if self.monster_names.intersection(shadow_layout[p_x+1:,p_y]):
-            #top
-            for name in self.monster_names.intersection(shadow_layout[p_x+1:,p_y]):
-                m_x,m_y = self.monster[name]
-                #no wall in the sight
-                if "%" not in shadow_layout[p_x+1:m_x,p_y]:
-                    observation+= pacman_ghost_observation_enum.gTopWall
-                    break
-        
-        #calculate the observations for pellets in smelling.        
-        distance = [2,3,4]
-        
-        smelles = set()
+            if self.pellets & mask:
+                observation += pellet_bit
         
-        for x,line in enumerate(self.layout):
+        #calculate the observations for pellets in smelling.
+        for mask,smell_bit in zip(self.smell_masks[cell],smell_bits):
             
-            for y,symbol in enumerate(self.layout[x]):
-                
-                d = abs(p_x - x) + abs(p_y - p_y)
-                
-                if d in distance and symbol == "*":
-                    distance.remove(d)
-                    smelles.add(d)
-        
-        for d in smelles:
-            
-            observation+=2**(d+smell_constant)
-            
-        #calculate the observations for pellets in sight.
-        
-        
-        if len(np.where(layout[p_x,p_y:]=="%")[0]) == 0:
-            #right
-            if '*' in layout[p_x,p_y:]:
-                observation+= pacman_sight_observation_enum.sRight
-        
-        elif '*' in layout[p_x,p_y :p_y+np.where(layout[p_x,p_y:]=="%")[0][0]]:
-            #right
-            observation+= pacman_sight_observation_enum.sRight
-            
-        
-        if len(np.where(layout[p_x,:p_y]=="%")[0]) == 0:
-            #left
-            if '*' in layout[p_x,:p_y]:
-                observation+= pacman_sight_observation_enum.sLeft
-        
-        elif '*' in layout[p_x, np.where(layout[p_x,:p_y]=="%")[0][-1]:p_y]:
-            #left
-            observation+= pacman_sight_observation_enum.sLeft
-            
-            
-        if '*' in layout[np.where(layout[:p_x,p_y]=="%")[0][-1]:p_x,p_y]:
-            #down
-            observation+= pacman_sight_observation_enum.sDown
-        
-        if '*' in layout[p_x:np.where(layout[p_x:,p_y]=="%")[0][0],p_y]:
-            #top
-            observation+= pacman_sight_observation_enum.sTop
+            if self.pellets & mask:
+                observation += smell_bit
         
         #calculate the observations of power pill effect.
         if self.super_pacman:
@@ -615,7 +865,10 @@ class PacMan(environment.Environment):
                 1.They move initially at random, until there is a Manhattan 
                 distance of 5 between them and PacMan
                 
-                2. No pairs of monster could stay in the same location
+                2. Then they chase PacMan, or flee from it under a power pill,
+                along the shortest path through the maze
+                
+                3. No pairs of monster could stay in the same location
         
         Parameters
         ----------
@@ -628,11 +881,23 @@ class PacMan(environment.Environment):
         '''
         
         p_x,p_y = self.pacman
+        cols = self.cols
+        
+        # the distances of every cell from pacman, along the maze
+        pacman_distance = self.distances[p_x * cols + p_y]
+        
+        # the number of monsters on each cell
+        occupancy = dict()
+        for m_x,m_y in self.monster.values():
+            occupancy[m_x * cols + m_y] = occupancy.get(m_x * cols + m_y, 0) + 1
         
         for name,position in self.monster.items():
             
             x,y = position
             
+            # the cells taken by the other monsters
+            occupancy[x * cols + y] -= 1
+            
             # calculate the Manhattan distance between pacman and the current monster
             distance = abs(p_x - x) + abs(p_y - y)
             
@@ -641,18 +906,15 @@ class PacMan(environment.Environment):
                 new_x = 0
                 new_y = 0
                 
-                coordinates = list(self.monster.values())
-                coordinates.remove([x,y])
-                
                 #can not move the locations of other monster
-                while self.layout[new_x][new_y] == "%" and [new_x,new_y] not in coordinates:
+                while self.layout[new_x][new_y] == "%" and not occupancy.get(new_x * cols + new_y):
                     
                     # perform random actions
                     # also, the monster has certain chance 
                     # that stay in the orginal 
                     # postion
                     
-                    index = random.choices(range(5))[0]
+                    index = self.random.choices(range(5))[0]
                     
                     if index == 4:
                         new_x = x
@@ -669,50 +931,37 @@ class PacMan(environment.Environment):
                 
                 self.monster[name] = [new_x,new_y]
                 
-            else:
+            elif not (self.super_pacman and self.super_pacman_time % 2 == 0):
                 
                 #under power pill, monster move every 2 steps.
                 
-                if self.super_pacman and self.super_pacman_time % 2 == 0:
-                    
-                    continue
-                
-                # move towards the pacman
+                # move towards the pacman, along the shortest path through the maze.
+                # When the pacman is under the power pill,
+                # monster move as far as possible.
+                # If it is not,
+                # the monster move as close as possible.
+                # Ties go to the first move in direction_list.
                 
-                valid_actions = []
+                best = None
                 
-                #consider all of the possible movements
-                for m_x,m_y in direction_list:
+                for new_x,new_y in self.neighbours[x * cols + y]:
                     
-                    new_x = x+m_x
-                    new_y = y+m_y
+                    if occupancy.get(new_x * cols + new_y):
+                        continue
                     
-                    if (new_x,new_y) in self.magic_channel:
-            
-                        new_x,new_y = self.magic_channel[new_x,new_y]
-                        
-                    coordinates = list(self.monster.values())
-                    coordinates.remove([x,y])
+                    d = pacman_distance[new_x * cols + new_y]
                     
-                    if self.layout[new_x][new_y] != "%"  and [new_x,new_y] not in coordinates:
-                        
-                        valid_actions.append([[new_x,new_y],abs(p_x - new_x) + abs(p_y - new_y)])
-                        
-                        
+                    if best is None or (d > best[1] if self.super_pacman else d < best[1]):
+                        best = [[new_x,new_y],d]
+                
                 # if no movement is avalible
                 # stay in the orginal postion
-                if valid_actions == []:
+                if best is not None:
                     
-                    continue
-                
-                # when the pacman is under the power pill,
-                # monster move as far as possible.
-                # If it is not,
-                # the monster move as close as possible.
-                
-                fun = max if self.super_pacman else min
-                
-                self.monster[name] = fun(valid_actions,key = lambda x : x[1])[0]
+                    self.monster[name] = best[0]
+            
+            x,y = self.monster[name]
+            occupancy[x * cols + y] = occupancy.get(x * cols + y, 0) + 1
     
     def print(self):
         
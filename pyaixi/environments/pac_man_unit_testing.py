@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the Pac-Man environment.
+"""
+
+from pyaixi.environments import pac_man
+from pyaixi.environments.pac_man import PacMan, direction, smell_constant
+from pyaixi.environments.pac_man import pacman_ghost_observation_enum, pacman_sight_observation_enum
+from pyaixi.environments.pac_man import pacman_power_observation_enum
+import unittest
+import os
+import random
+import shutil
+import tempfile
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+#a game that computes its observations with the calculate_observation that PacMan had
+#before the observation tables, unchanged.
+class ScanningObservationPacMan(PacMan):
+
+    def calculate_observation(self):
+        
+        '''
+        The observations are calculate according to the rules blow
+        
+            1.only receives a 4-bit observation describing the wall configuration at 
+            its current location.
+        
+            2.only 4-bit observations indicating whether a ghost is visible (via direct line of sight) 
+            in each of the four cardinal directions. 
+        
+            3.In addition, the location of the food pellets is unknown except for a 3-bit observation that
+            indicates whether food can be smelt within a Manhattan distance of 2, 3 or 4 
+            from PacMan’s location, 
+        
+            4. another 4-bit observation indicating whether there is food in its direct line of sight. 
+        
+            5. final single bit indicates whether PacMan is under the effects of a power pill.
+            
+        Then we can calculate the oberserbations using the enumerations we defined before
+        
+        Parameters
+        ----------
+        None
+        
+        Returns
+        -------
+        None
+        
+        '''
+                
+        observation = 0
+        
+        p_x, p_y = self.pacman
+        
+        # using numpy arrarys are benefits in different ways 
+        # of indexing
+        layout = np.array(self.layout)
+        shadow_layout = np.array(self.layout)
+        
+        
+        #calculate the obervations for wall
+        for key,l in direction.items():
+            x,y = l
+            new_x,new_y = p_x+x,p_y+y
+            
+            if (new_x,new_y) in self.magic_channel:
+                
+                new_x,new_y = self.magic_channel[new_x,new_y]
+            
+            if self.layout[new_x][new_y] == "%":
+                # the relation of them 2**?, because of the the mathmatical
+                # coincidence
+                observation += 2**(int(key))
+                
+        #calculate the obervations for monster    
+        
+        for name,l in self.monster.items():
+            x,y = l
+            shadow_layout[x,y] = name
+          
+        
+        if self.monster_names.intersection(shadow_layout[p_x,p_y:]):
+            #right,including at same position
+            for name in self.monster_names.intersection(shadow_layout[p_x,p_y:]):
+                m_x,m_y = self.monster[name]
+                #no wall in the sight
+                if "%" not in shadow_layout[p_x,p_y:m_y]:
+                    observation+= pacman_ghost_observation_enum.gRightWall
+                    break
+        
+        if self.monster_names.intersection(shadow_layout[p_x,:p_y]):
+            #left
+            
+            for name in self.monster_names.intersection(shadow_layout[p_x,:p_y]):
+                m_x,m_y = self.monster[name]
+                #no wall in the sight
+                if "%" not in shadow_layout[p_x,m_y:p_y]:
+                    observation+= pacman_ghost_observation_enum.gLeftWall
+                    break
+        
+        if self.monster_names.intersection(shadow_layout[:p_x,p_y]):
+            #down
+            for name in self.monster_names.intersection(shadow_layout[:p_x,p_y]):
+                m_x,m_y = self.monster[name]
+                #no wall in the sight
+                if "%" not in shadow_layout[m_x:p_x,p_y]:
+                    observation+= pacman_ghost_observation_enum.gDownWall
+                    break
+            
+        if self.monster_names.intersection(shadow_layout[p_x+1:,p_y]):
+            #top
+            for name in self.monster_names.intersection(shadow_layout[p_x+1:,p_y]):
+                m_x,m_y = self.monster[name]
+                #no wall in the sight
+                if "%" not in shadow_layout[p_x+1:m_x,p_y]:
+                    observation+= pacman_ghost_observation_enum.gTopWall
+                    break
+        
+        #calculate the observations for pellets in smelling.        
+        distance = [2,3,4]
+        
+        smelles = set()
+        
+        for x,line in enumerate(self.layout):
+            
+            for y,symbol in enumerate(self.layout[x]):
+                
+                d = abs(p_x - x) + abs(p_y - p_y)
+                
+                if d in distance and symbol == "*":
+                    distance.remove(d)
+                    smelles.add(d)
+        
+        for d in smelles:
+            
+            observation+=2**(d+smell_constant)
+            
+        #calculate the observations for pellets in sight.
+        
+        
+        if len(np.where(layout[p_x,p_y:]=="%")[0]) == 0:
+            #right
+            if '*' in layout[p_x,p_y:]:
+                observation+= pacman_sight_observation_enum.sRight
+        
+        elif '*' in layout[p_x,p_y :p_y+np.where(layout[p_x,p_y:]=="%")[0][0]]:
+            #right
+            observation+= pacman_sight_observation_enum.sRight
+            
+        
+        if len(np.where(layout[p_x,:p_y]=="%")[0]) == 0:
+            #left
+            if '*' in layout[p_x,:p_y]:
+                observation+= pacman_sight_observation_enum.sLeft
+        
+        elif '*' in layout[p_x, np.where(layout[p_x,:p_y]=="%")[0][-1]:p_y]:
+            #left
+            observation+= pacman_sight_observation_enum.sLeft
+            
+            
+        if '*' in layout[np.where(layout[:p_x,p_y]=="%")[0][-1]:p_x,p_y]:
+            #down
+            observation+= pacman_sight_observation_enum.sDown
+        
+        if '*' in layout[p_x:np.where(layout[p_x:,p_y]=="%")[0][0],p_y]:
+            #top
+            observation+= pacman_sight_observation_enum.sTop
+        
+        #calculate the observations of power pill effect.
+        if self.super_pacman:
+            
+            observation += pacman_power_observation_enum.underEffect
+            
+        return observation
+
+#the open cells of a game's map.
+def open_cells(game):
+    return [(x,y) for x in range(game.rows) for y in range(game.cols) if game.layout[x][y] != "%"]
+
+#a game whose monsters chase by Manhattan distance, by putting it into the distance tables.
+class ManhattanPacMan(PacMan):
+    def load(self, layout):
+        pacMan_map = PacMan.load(self, layout)
+        self.distances = [[abs(x - c_x) + abs(y - c_y) for c_x in range(self.rows) for c_y in range(self.cols)]
+                          for x in range(self.rows) for y in range(self.cols)]
+        return pacMan_map
+
+#a game whose monsters move as they did before the distance tables, by Manhattan distance.
+class ScanningPacMan(PacMan):
+    def movement_monster(self):
+        p_x,p_y = self.pacman
+        for name,position in self.monster.items():
+            x,y = position
+            if abs(p_x - x) + abs(p_y - y) > 5:
+                new_x = 0
+                new_y = 0
+                coordinates = list(self.monster.values())
+                coordinates.remove([x,y])
+                while self.layout[new_x][new_y] == "%" and [new_x,new_y] not in coordinates:
+                    index = random.choices(range(5))[0]
+                    if index == 4:
+                        new_x = x
+                        new_y = y
+                    else:
+                        m_x,m_y = pac_man.direction_list[index]
+                        new_x = x+m_x
+                        new_y = y+m_y
+                    if (new_x,new_y) in self.magic_channel:
+                        new_x,new_y = self.magic_channel[new_x,new_y]
+                self.monster[name] = [new_x,new_y]
+            else:
+                if self.super_pacman and self.super_pacman_time % 2 == 0:
+                    continue
+                valid_actions = []
+                for m_x,m_y in pac_man.direction_list:
+                    new_x = x+m_x
+                    new_y = y+m_y
+                    if (new_x,new_y) in self.magic_channel:
+                        new_x,new_y = self.magic_channel[new_x,new_y]
+                    coordinates = list(self.monster.values())
+                    coordinates.remove([x,y])
+                    if self.layout[new_x][new_y] != "%" and [new_x,new_y] not in coordinates:
+                        valid_actions.append([[new_x,new_y],abs(p_x - new_x) + abs(p_y - new_y)])
+                if valid_actions == []:
+                    continue
+                fun = max if self.super_pacman else min
+                self.monster[name] = fun(valid_actions,key = lambda x : x[1])[0]
+
+
+class TestObservation(unittest.TestCase):
+
+    def setUp(self):
+        if np is None:
+            self.skipTest("NumPy is not available")
+
+    #the observation tables should give the original scanned observation from every cell,
+    #whatever the pellets, ghosts and power pill effect around it.
+    def test_tables_same_as_scan(self):
+        random.seed(1)
+        for trial in range(20):
+            game = PacMan()
+            cells = open_cells(game)
+            for x,y in cells:
+                game.pacman = [x,y]
+                for name,location in zip(sorted(game.monster), random.sample(cells, len(game.monster))):
+                    game.monster[name] = list(location)
+                game.super_pacman = random.random() < 0.5
+                self.assertEqual(ScanningObservationPacMan.calculate_observation(game),game.calculate_observation(),
+                                 "incorrect observation at %s" % ((x,y),))
+
+    #and along a game, as pellets are eaten and the game restarts.
+    def test_game_same_as_scan(self):
+        random.seed(2)
+        game = PacMan()
+        for step in range(3000):
+            game.perform_action(random.choice(game.valid_actions))
+            self.assertEqual(ScanningObservationPacMan.calculate_observation(game),game.observation,
+                             "incorrect observation")
+
+
+class TestMonsterMovement(unittest.TestCase):
+
+    #with Manhattan distances in the tables, the monsters should move as they did
+    #before the tables, along the same seeded game.
+    def test_same_as_scanning(self):
+        trajectories = []
+        for game_class in [ScanningPacMan, ManhattanPacMan]:
+            random.seed(4)
+            actions = random.Random(5)
+            game = game_class()
+            trajectory = []
+            for step in range(8000):
+                reward, observation = game.perform_action(actions.choice(game.valid_actions))
+                trajectory.append((reward, observation, list(game.pacman), sorted(game.monster.items()),
+                                   game.super_pacman_time))
+            trajectories.append(trajectory)
+        self.assertTrue(any(time > 0 for reward, observation, pacman, monster, time in trajectories[0]),
+                        "no power pill eaten")
+        for step in range(8000):
+            self.assertEqual(trajectories[0][step],trajectories[1][step],"trajectory differs at step %d" % step)
+
+    #the distance tables should hold the lengths of the shortest paths through the maze.
+    def test_maze_distances(self):
+        game = PacMan()
+        cols = game.cols
+        for x,y in open_cells(game):
+            distance = game.distances[x * cols + y]
+            self.assertEqual(0,distance[x * cols + y],"incorrect distance to itself")
+            for c_x,c_y in open_cells(game):
+                d = distance[c_x * cols + c_y]
+                neighbours = [distance[n_x * cols + n_y] for n_x,n_y in game.neighbours[c_x * cols + c_y]]
+                self.assertTrue(d != pac_man.unreachable,"open cell unreachable")
+                self.assertTrue(all(abs(d - n) <= 1 for n in neighbours),"distance not along a path")
+                if (c_x,c_y) != (x,y):
+                    self.assertTrue(d - 1 in neighbours,"distance not of a shortest path")
+
+
+class TestLayout(unittest.TestCase):
+
+    #a layout should be parsed again once its file has been modified.
+    def test_cache_invalidated(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, "layout.txt")
+        try:
+            shutil.copy(os.path.join(os.path.dirname(pac_man.__file__), pac_man.layout_txt), path)
+            template = pac_man.load_layout(path)
+            self.assertTrue(pac_man.load_layout(path) is template,"unmodified layout parsed again")
+
+            with open(path) as f:
+                lines = f.read().splitlines()
+            #wall in the cell above the power pill at (3,1).
+            lines[2] = lines[2][:1] + "%" + lines[2][2:]
+            with open(path, "w") as f:
+                f.write("\n".join(lines) + "\n")
+            os.utime(path, (template.mtime + 10, template.mtime + 10))
+
+            modified = pac_man.load_layout(path)
+            self.assertFalse(modified is template,"modified layout not parsed again")
+            self.assertEqual("%",modified.grid[2][1],"stale layout")
+            self.assertEqual(" ",template.grid[2][1],"parsed layout changed")
+            self.assertEqual(template.wall_observations[3 * template.cols + 1] +
+                             pac_man.pacman_wall_observations_enum.wDownWall,
+                             modified.wall_observations[3 * modified.cols + 1],"stale observation tables")
+            self.assertTrue(pac_man.load_layout(path) is modified,"layout not cached again")
+        finally:
+            pac_man.layout_cache.pop(path, None)
+            shutil.rmtree(directory)
+
+    #games should share the parsed layout, across restarts too, but nothing they change.
+    def test_restart_shares_layout(self):
+        random.seed(3)
+        template = pac_man.load_layout(pac_man.layout_txt)
+        grid = [list(line) for line in template.grid]
+        first, second = PacMan(), PacMan()
+        self.assertTrue(first.layout_template is template,"layout parsed again")
+        self.assertTrue(second.layout_template is template,"layout parsed again")
+        self.assertFalse(first.layout is second.layout,"games share a map")
+
+        restarts = 0
+        for step in range(3000):
+            remaining = first.pellets_remaining
+            first.perform_action(random.choice(first.valid_actions))
+            first.magic_channel[(0,0)] = (1,1)
+            #pellets are only put back by a restart.
+            if first.pellets_remaining > remaining:
+                restarts += 1
+        first.restart()
+        self.assertTrue(restarts > 0,"the game never restarted")
+        self.assertTrue(first.layout_template is template,"layout parsed again on restart")
+
+        #the other game, and the parsed layout, are as they were.
+        self.assertEqual(grid,[list(line) for line in template.grid],"parsed layout changed")
+        self.assertFalse((0,0) in template.magic_channel,"parsed magic channels changed")
+        self.assertEqual(list(template.pacman),second.pacman,"pacman moved in the other game")
+        self.assertEqual(dict((name,list(location)) for name,location in template.monster),second.monster,
+                         "monsters moved in the other game")
+        self.assertEqual([list(location) for location in template.power_pill],second.power_pill,
+                         "power pills eaten in the other game")
+        for x,y in template.free_cells:
+            self.assertEqual((second.pellets >> (x * second.cols + y)) & 1 == 1,second.layout[x][y] == "*",
+                             "pellets eaten in the other game")
+
+
+if __name__ == '__main__':
+    unittest.main()
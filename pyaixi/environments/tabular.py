@@ -0,0 +1,669 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Defines a compiler from small finite-state environments to explicit tables,
+and an environment that steps by looking the tables up.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import bisect
+import copy
+import inspect
+import os
+import random
+import sys
+
+# Insert the package's parent directory into the system search path, so that this package can be
+# imported when the aixi.py script is run directly from a release archive.
+PROJECT_ROOT = os.path.realpath(os.path.join(os.pardir, os.pardir))
+sys.path.insert(0, PROJECT_ROOT)
+
+# Ensure xrange is defined on Python 3.
+from six.moves import xrange
+
+# NumPy is optional: without it, the tensors are nested lists and batches are stepped one by one.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+# end try
+
+from pyaixi import environment
+
+# The attributes of an environment that are not part of its state: the options it was made with,
+# and the last action, which every environment overwrites before reading it.
+ignored_attributes = frozenset(['options', 'action'])
+
+# The compiled models, keyed by the environment class and the options. (See `cached_model()`.)
+model_cache = {}
+
+
+def freeze(value):
+    """ Returns a hashable copy of the given value, turning dictionaries, lists and sets
+        into (sorted) tuples and frozen sets, recursively.
+    """
+
+    if isinstance(value, dict):
+        return tuple(sorted([(key, freeze(item)) for key, item in value.items()],
+                            key = lambda pair: repr(pair[0])))
+    elif isinstance(value, (list, tuple)):
+        return tuple([freeze(item) for item in value])
+    elif isinstance(value, (set, frozenset)):
+        return frozenset([freeze(item) for item in value])
+    # end if
+
+    return value
+# end def
+
+
+class UniformDraw:
+    """ A symbolic draw of `random.random()` while compiling an environment.
+
+        The draw is a subinterval of [0, 1) that it is known to lie in. Each comparison
+        with a number that falls inside the interval is a branch point: the brancher picks
+        a side, and the interval shrinks to it. Any other use of the draw is an error,
+        since the outcome would depend on its exact value.
+    """
+
+    def __init__(self, brancher):
+        """ Constructs a draw known only to lie in [0, 1).
+
+            - `brancher`: the `RandomBrancher` that picks the outcome of each comparison.
+        """
+
+        self.brancher = brancher
+        self.low = 0.0
+        self.high = 1.0
+    # end def
+
+    def below(self, threshold):
+        """ Returns whether the draw is below the given threshold, branching if that is
+            still undecided.
+        """
+
+        threshold = float(threshold)
+        if threshold <= self.low:
+            return False
+        elif threshold >= self.high:
+            return True
+        # end if
+
+        width = self.high - self.low
+        if self.brancher.choose([(threshold - self.low) / width, (self.high - threshold) / width]) == 0:
+            self.high = threshold
+            return True
+        # end if
+
+        self.low = threshold
+        return False
+    # end def
+
+    # The draw is continuous, so strict and non-strict comparisons have the same probability.
+    def __lt__(self, other):
+        return self.below(other)
+    # end def
+
+    def __le__(self, other):
+        return self.below(other)
+    # end def
+
+    def __gt__(self, other):
+        return not self.below(other)
+    # end def
+
+    def __ge__(self, other):
+        return not self.below(other)
+    # end def
+
+    def __float__(self):
+        raise TypeError("A random draw can only be compared with a number when compiling an environment.")
+    # end def
+
+    def __bool__(self):
+        raise TypeError("A random draw can only be compared with a number when compiling an environment.")
+    # end def
+
+    __nonzero__ = __bool__
+# end class
+
+
+class RandomBrancher:
+    """ Stands in for the `random` module while compiling an environment, so that every
+        random choice the environment makes becomes a branch point.
+
+        One run follows a script of choices, given as indices into the possible outcomes
+        of each branch point, and takes the first outcome once the script runs out. It
+        records the outcomes it could have taken and the probability of the path it took,
+        so that `enumerate_outcomes` can run every other path too.
+    """
+
+    def __init__(self, script):
+        """ Constructs a brancher that follows the given script of choices.
+
+            - `script`: a list of outcome indices, one for each of the first branch points.
+        """
+
+        self.script = script
+        self.choices = []
+        self.counts = []
+        self.probability = 1.0
+    # end def
+
+    def choose(self, probabilities):
+        """ Returns the index of the outcome taken at a branch point with the given outcome
+            probabilities. Outcomes with a probability of zero are never taken.
+        """
+
+        possible = [index for index, probability in enumerate(probabilities) if probability > 0]
+        position = len(self.choices)
+        choice = self.script[position] if position < len(self.script) else 0
+
+        self.choices.append(choice)
+        self.counts.append(len(possible))
+        self.probability *= probabilities[possible[choice]]
+
+        return possible[choice]
+    # end def
+
+    # The parts of the `random` module used by the environments.
+    def random(self):
+        return UniformDraw(self)
+    # end def
+
+    def randrange(self, start, stop = None, step = 1):
+        values = range(start, stop, step) if stop is not None else range(start)
+        return values[self.choose([1.0 / len(values)] * len(values))]
+    # end def
+
+    def randint(self, low, high):
+        return self.randrange(low, high + 1)
+    # end def
+
+    def choice(self, sequence):
+        return sequence[self.choose([1.0 / len(sequence)] * len(sequence))]
+    # end def
+
+    def sample(self, population, count):
+        pool = list(population)
+        return [pool.pop(self.choose([1.0 / len(pool)] * len(pool))) for index in xrange(count)]
+    # end def
+
+    def shuffle(self, items):
+        items[:] = self.sample(items, len(items))
+    # end def
+
+    def __getattr__(self, name):
+        # Any other part of the `random` module, such as `gauss`, cannot be enumerated.
+        raise AttributeError("random.%s cannot be used when compiling an environment." % name)
+    # end def
+# end class
+
+
+def enumerate_outcomes(function, modules, environment_class):
+    """ Returns a list of (probability, result) pairs, one for each way the random choices
+        made by calling `function` can fall, with the `random` module replaced by a
+        `RandomBrancher` in the given modules, and as the environment class's `random`.
+
+        - `function`: a function of no arguments. It is called once for each outcome, so
+                      it must start from the same state each time.
+        - `modules`: the modules whose global `random` the function draws from.
+        - `environment_class`: the class of the environment, whose instances draw from
+                               `Environment.random`.
+    """
+
+    # The class's own `random`, if it has one, to put back afterwards.
+    own_random = environment_class.__dict__.get('random')
+
+    outcomes = []
+    scripts = [[]]
+    while len(scripts) > 0:
+        script = scripts.pop()
+        brancher = RandomBrancher(script)
+
+        for module in modules:
+            module.random = brancher
+        # end for
+        environment_class.random = brancher
+        try:
+            result = function()
+        finally:
+            for module in modules:
+                module.random = random
+            # end for
+            if own_random is None:
+                del environment_class.random
+            else:
+                environment_class.random = own_random
+            # end if
+        # end try
+
+        outcomes.append((brancher.probability, result))
+
+        # Queue every path that leaves this one at a branch point the script did not decide.
+        for position in xrange(len(script), len(brancher.choices)):
+            for alternative in xrange(1, brancher.counts[position]):
+                scripts.append(brancher.choices[:position] + [alternative])
+            # end for
+        # end for
+    # end while
+
+    return outcomes
+# end def
+
+
+class TabularModel:
+    """ The explicit model of a finite-state environment, found by `compile_environment`.
+
+        The states are numbered from zero. Each state includes the observation and reward the
+        environment gives on entering it, so these are functions of the state alone:
+
+         - `initial`: the (state, probability) pairs of the initial state distribution.
+         - `successors[state][action]`: the (state, probability) pairs the state can move to
+           under the action, where actions are indices into `actions`.
+         - `observations[state]`, `rewards[state]` and `finished[state]`: the observation,
+           reward and finished flag of the state, which are also kept together in `percepts[state]`.
+         - `snapshots[state]`: the attributes of the environment in the state.
+
+        `transition_tensor`, `observation_tensor` and `reward_tensor` return the same model
+        as dense arrays, for exact planning.
+    """
+
+    def __init__(self, actions, valid_observations, valid_rewards):
+        """ Constructs an empty model over the given action, observation and reward values.
+        """
+
+        self.actions = list(actions)
+        self.action_indices = dict([(action, index) for index, action in enumerate(self.actions)])
+        self.valid_observations = list(valid_observations)
+        self.valid_rewards = list(valid_rewards)
+
+        self.state_indices = {}
+        self.snapshots = []
+        self.observations = []
+        self.rewards = []
+        self.finished = []
+        self.percepts = []
+
+        self.initial = []
+        self.successors = []
+
+        # The (cumulative probabilities, states) pair of each distribution, for inverse-CDF sampling.
+        self.initial_table = None
+        self.tables = []
+
+        # The tables padded to the same length as NumPy arrays, built the first time a batch
+        # is stepped with NumPy.
+        self.batch_tables = None
+    # end def
+
+    def __len__(self):
+        """ Returns the number of states.
+        """
+
+        return len(self.snapshots)
+    # end def
+
+    def add_state(self, attributes):
+        """ Returns the index of the state with the given environment attributes, adding it
+            if it is new.
+        """
+
+        key = freeze(dict([(name, value) for name, value in attributes.items()
+                           if name not in ignored_attributes]))
+        state = self.state_indices.get(key)
+        if state is not None:
+            return state
+        # end if
+
+        state = len(self.snapshots)
+        self.state_indices[key] = state
+        self.snapshots.append(dict([(name, copy.deepcopy(value)) for name, value in attributes.items()
+                                    if name not in ignored_attributes]))
+        self.observations.append(attributes['observation'])
+        self.rewards.append(attributes['reward'])
+        self.finished.append(bool(attributes.get('is_finished', False)))
+        self.percepts.append((self.observations[-1], self.rewards[-1], self.finished[-1]))
+
+        return state
+    # end def
+
+    def cumulate(self, distribution):
+        """ Returns the cumulative probabilities and states of the given (state, probability)
+            pairs, merging repeated states and ordering them by state.
+        """
+
+        merged = {}
+        for state, probability in distribution:
+            merged[state] = merged.get(state, 0.0) + probability
+        # end for
+
+        states = sorted(merged.keys())
+        cumulative = []
+        total = 0.0
+        for state in states:
+            total += merged[state]
+            cumulative.append(total)
+        # end for
+
+        return cumulative, states
+    # end def
+
+    def finish(self):
+        """ Builds the sampling tables once all the distributions are known.
+        """
+
+        self.initial_table = self.cumulate(self.initial)
+        self.initial = list(zip(self.initial_table[1], differences(self.initial_table[0])))
+
+        self.tables = []
+        for state in xrange(len(self)):
+            tables = [self.cumulate(distribution) for distribution in self.successors[state]]
+            self.tables.append(tables)
+            self.successors[state] = [list(zip(states, differences(cumulative))) for cumulative, states in tables]
+        # end for
+    # end def
+
+    def sample_initial(self, uniform):
+        """ Returns the initial state at the given point in [0, 1) of the initial distribution.
+        """
+
+        cumulative, states = self.initial_table
+        return states[min(bisect.bisect_right(cumulative, uniform), len(states) - 1)]
+    # end def
+
+    def next_state(self, state, action, uniform):
+        """ Returns the state that follows the given state and action index, at the given point
+            in [0, 1) of the distribution of next states.
+        """
+
+        cumulative, states = self.tables[state][action]
+        return states[min(bisect.bisect_right(cumulative, uniform), len(states) - 1)]
+    # end def
+
+    def step(self, states, actions, uniforms):
+        """ Returns the next states, observations and rewards of a batch of states, as arrays
+            if NumPy is available, and as lists otherwise.
+
+            - `states`: a sequence of states.
+            - `actions`: a sequence of action indices, one for each state.
+            - `uniforms`: a sequence of points in [0, 1), one for each state, such as those
+                          from `random.random()`.
+
+            Each next state is the one `next_state` would give.
+        """
+
+        if numpy is None:
+            next_states = [self.next_state(state, action, uniform)
+                           for state, action, uniform in zip(states, actions, uniforms)]
+            return next_states, [self.observations[state] for state in next_states], \
+                   [self.rewards[state] for state in next_states]
+        # end if
+
+        if self.batch_tables is None:
+            self.build_batch_tables()
+        # end if
+        cumulative, successors, last, observations, rewards = self.batch_tables
+
+        states, actions = numpy.asarray(states), numpy.asarray(actions)
+        indices = (cumulative[states, actions] <= numpy.asarray(uniforms)[:, None]).sum(axis = 1)
+
+        # Guard against the last cumulative probability rounding to just below one.
+        indices = numpy.minimum(indices, last[states, actions])
+
+        next_states = successors[states, actions, indices]
+        return next_states, observations[next_states], rewards[next_states]
+    # end def
+
+    def build_batch_tables(self):
+        """ Builds the sampling tables as NumPy arrays for `step`, padding each distribution
+            to the length of the longest. The padding has a cumulative probability above one,
+            so that it is never sampled.
+        """
+
+        size, actions = len(self), len(self.actions)
+        width = max([len(states) for tables in self.tables for cumulative, states in tables])
+
+        cumulative = numpy.full((size, actions, width), 2.0)
+        successors = numpy.zeros((size, actions, width), dtype = numpy.int64)
+        last = numpy.zeros((size, actions), dtype = numpy.int64)
+        for state, tables in enumerate(self.tables):
+            for action, (probabilities, states) in enumerate(tables):
+                cumulative[state, action, :len(states)] = probabilities
+                successors[state, action, :len(states)] = states
+                last[state, action] = len(states) - 1
+            # end for
+        # end for
+
+        self.batch_tables = (cumulative, successors, last,
+                             numpy.array(self.observations), numpy.array(self.rewards))
+    # end def
+
+    def transition_tensor(self):
+        """ Returns the transition probabilities, indexed by state, action index and next state.
+        """
+
+        size = len(self)
+        if numpy is not None:
+            tensor = numpy.zeros((size, len(self.actions), size))
+        else:
+            tensor = [[[0.0] * size for action in self.actions] for state in xrange(size)]
+        # end if
+
+        for state in xrange(size):
+            for action, distribution in enumerate(self.successors[state]):
+                for next_state, probability in distribution:
+                    tensor[state][action][next_state] = probability
+                # end for
+            # end for
+        # end for
+
+        return tensor
+    # end def
+
+    def observation_tensor(self):
+        """ Returns the observation given on entering each state.
+        """
+
+        return numpy.array(self.observations) if numpy is not None else list(self.observations)
+    # end def
+
+    def reward_tensor(self):
+        """ Returns the reward given on entering each state.
+        """
+
+        return numpy.array(self.rewards) if numpy is not None else list(self.rewards)
+    # end def
+# end class
+
+
+def differences(cumulative):
+    """ Returns the probabilities of the given cumulative probabilities.
+    """
+
+    return [high - low for low, high in zip([0.0] + cumulative[:-1], cumulative)]
+# end def
+
+
+def compile_environment(environment_class, options = {}, max_states = 100000):
+    """ Returns a `TabularModel` of the given environment, found by trying every random outcome
+        of its constructor, and of every action in every state it can reach.
+
+        The environment must keep all its state in instance attributes, and draw from
+        `Environment.random` or the module-level `random` of its own module, using only
+        comparisons of `random.random()` with numbers, `randint`, `randrange`, `choice`,
+        `sample` and `shuffle`.
+
+        - `environment_class`: the environment class, such as `KuhnPoker`.
+        - `options`: the options to construct the environment with.
+        - `max_states`: the number of states to give up after, since the state space might
+                        not be finite.
+
+        Environments that break these rules are rejected: a `ValueError` is raised if there
+        are more than `max_states` states, an `AttributeError` if another `random` function
+        is used, and a `TypeError` if a draw of `random.random()` is used other than in a
+        comparison.
+    """
+
+    modules = []
+    for cls in inspect.getmro(environment_class):
+        module = sys.modules.get(cls.__module__)
+        if getattr(module, 'random', None) is random and module not in modules:
+            modules.append(module)
+        # end if
+    # end for
+
+    instances = enumerate_outcomes(lambda: environment_class(options = dict(options)), modules, environment_class)
+    environment_instance = instances[0][1]
+
+    model = TabularModel(environment_instance.valid_actions, environment_instance.valid_observations,
+                         environment_instance.valid_rewards)
+    model.initial = [(model.add_state(instance.__dict__), probability) for probability, instance in instances]
+
+    def perform(snapshot, action):
+        """ Performs the action in the environment instance, from the given state, and returns
+            the state that follows.
+        """
+
+        options = environment_instance.options
+        environment_instance.__dict__.clear()
+        environment_instance.__dict__.update(copy.deepcopy(snapshot))
+        environment_instance.options = options
+        environment_instance.perform_action(action)
+        return model.add_state(environment_instance.__dict__)
+    # end def
+
+    state = 0
+    while state < len(model):
+        if len(model) > max_states:
+            raise ValueError("The environment has more than %d states." % max_states)
+        # end if
+
+        snapshot = model.snapshots[state]
+        if model.finished[state]:
+            # Finished environments take no more actions.
+            model.successors.append([[(state, 1.0)] for action in model.actions])
+        else:
+            model.successors.append([[(next_state, probability) for probability, next_state in
+                                      enumerate_outcomes(lambda: perform(snapshot, action), modules,
+                                                         environment_class)]
+                                     for action in model.actions])
+        # end if
+
+        state += 1
+    # end while
+
+    model.finish()
+
+    return model
+# end def
+
+
+def cached_model(environment_class, options = {}):
+    """ Returns the `TabularModel` of the given environment with the given options, compiling it
+        on the first call for them, for `TabularEnvironment` and tabular `VecEnvironment` batches.
+    """
+
+    key = (environment_class, freeze(options))
+    model = model_cache.get(key)
+    if model is None:
+        model = compile_environment(environment_class, options)
+        model_cache[key] = model
+    # end if
+
+    return model
+# end def
+
+
+def environment_module_class(environment_title):
+    """ Returns the environment class in the environment module with the given name, looking in
+        the `pyaixi.environments` package first, in the same way as `aixi.py`.
+    """
+
+    try:
+        module = __import__("pyaixi.environments." + environment_title, globals(), locals(), [environment_title], 0)
+    except ImportError:
+        module = __import__(environment_title, globals(), locals(), [environment_title], 0)
+    # end try
+
+    for name, obj in inspect.getmembers(module):
+        if hasattr(obj, "__bases__") and 'Environment' in [cls.__name__ for cls in obj.__bases__]:
+            return obj
+        # end if
+    # end for
+
+    raise ValueError("The module '%s' has no environment class." % environment_title)
+# end def
+
+
+class TabularEnvironment(environment.Environment):
+    """ An environment that steps through a `TabularModel` by table lookup: each action draws
+        one number from `self.random.random()`, and takes the next state at that point of the
+        cumulative distribution of next states.
+
+        It has the same distribution of percepts as the environment it was compiled from,
+        though not the same sequence for a given random seed.
+
+        Domain characteristics: those of the compiled environment.
+    """
+
+    def __init__(self, options = {}, model = None):
+        """ Construct a tabular environment from the given model, or from the given options.
+
+             - `options`: a dictionary of named options and their values.
+             - `model`: the `TabularModel` to step through.
+
+            The following option in `options` is required if no model is given:
+
+             - `tabular-environment`: the name of the environment module to compile, such as
+               `kuhn_poker`. It is compiled with the other options, once for each set of options.
+        """
+
+        # Set up the base environment.
+        environment.Environment.__init__(self, options = options)
+
+        if model is None:
+            assert 'tabular-environment' in options, \
+                   "The 'tabular-environment' option is required to compile an environment."
+
+            model = cached_model(environment_module_class(str(options['tabular-environment'])), options)
+        # end if
+        self.model = model
+
+        # Defines the acceptable action, observation and reward values.
+        self.valid_actions = list(model.actions)
+        self.valid_observations = list(model.valid_observations)
+        self.valid_rewards = list(model.valid_rewards)
+
+        self.enter(model.sample_initial(self.random.random()))
+    # end def
+
+    def enter(self, state):
+        """ Moves to the given state, and takes its observation, reward and finished flag.
+        """
+
+        self.state = state
+        self.observation, self.reward, self.is_finished = self.model.percepts[state]
+    # end def
+
+    def perform_action(self, action):
+        """ Receives the agent's action and calculates the new environment percept.
+        """
+
+        assert self.is_valid_action(action)
+        self.action = action
+
+        # Look the next state up directly, since this is the whole of the step.
+        cumulative, states = self.model.tables[self.state][self.model.action_indices[action]]
+        if len(states) == 1:
+            # Deterministic steps draw no random number.
+            self.enter(states[0])
+        else:
+            self.enter(states[min(bisect.bisect_right(cumulative, self.random.random()), len(states) - 1)])
+        # end if
+
+        return self.observation, self.reward
+    # end def
+# end class
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the compiler from environments to tables.
+"""
+
+from pyaixi.environment import Environment
+from pyaixi.environments.cheese_maze import CheeseMaze
+from pyaixi.environments.coin_flip import CoinFlip
+from pyaixi.environments.extended_tiger import ExtendedTiger
+from pyaixi.environments.kuhn_poker import KuhnPoker
+from pyaixi.environments.tabular import TabularEnvironment, compile_environment
+import unittest
+import pickle
+import random
+
+
+environment_classes = [CoinFlip, ExtendedTiger, KuhnPoker, CheeseMaze]
+
+#the largest difference allowed between a probability and its frequency in the samples.
+tolerance = 0.06
+
+#an environment with one observation and reward.
+class SimpleEnvironment(Environment):
+    def __init__(self, options = {}):
+        Environment.__init__(self, options = options)
+        self.valid_actions = [0, 1]
+        self.valid_observations = [0, 1]
+        self.valid_rewards = [0, 1]
+        self.observation = 0
+        self.reward = 0
+    def perform_action(self, action):
+        self.action = action
+        return self.observation, self.reward
+
+#draws from a random function that cannot be enumerated.
+class GaussEnvironment(SimpleEnvironment):
+    def perform_action(self, action):
+        self.observation = 0 if random.gauss(0, 1) < 0 else 1
+        return self.observation, self.reward
+
+#uses a draw of random.random() as a number.
+class ScaledDrawEnvironment(SimpleEnvironment):
+    def perform_action(self, action):
+        self.observation = int(random.random() * 2)
+        return self.observation, self.reward
+
+#has a state that grows without bound.
+class CountingEnvironment(SimpleEnvironment):
+    def __init__(self, options = {}):
+        SimpleEnvironment.__init__(self, options = options)
+        self.count = 0
+    def perform_action(self, action):
+        self.count += 1
+        return self.observation, self.reward
+
+#the frequency of each state of a model in the given number of calls to a function
+#that returns environment attributes.
+def state_frequencies(model, function, samples):
+    frequencies = {}
+    for sample in range(samples):
+        state = model.add_state(function())
+        frequencies[state] = frequencies.get(state, 0.0) + 1.0 / samples
+    return frequencies
+
+
+class TestCompileEnvironment(unittest.TestCase):
+
+    def assertDistribution(self, distribution, frequencies, message):
+        self.assertAlmostEqual(1.0,sum(probability for state, probability in distribution),9,
+                               "probabilities do not sum to one")
+        for state in set(dict(distribution)) | set(frequencies):
+            self.assertTrue(abs(dict(distribution).get(state, 0.0) - frequencies.get(state, 0.0)) < tolerance,
+                            "%s: state %d" % (message, state))
+
+    #the initial states and the states after each action should follow the distributions
+    #of the live environment, restored to each state of the model.
+    def test_same_as_environment(self):
+        random.seed(1)
+        for environment_class in environment_classes:
+            model = compile_environment(environment_class)
+            size = len(model)
+            environment = environment_class(options = {})
+
+            frequencies = state_frequencies(model, lambda: environment_class(options = {}).__dict__, 1000)
+            self.assertDistribution(model.initial,frequencies,"%s initial" % environment_class.__name__)
+
+            #pickled copies of the snapshots, which are quicker to copy from than deepcopy.
+            snapshots = [pickle.dumps(snapshot) for snapshot in model.snapshots]
+
+            def perform(state, action):
+                options = environment.options
+                environment.__dict__.clear()
+                environment.__dict__.update(pickle.loads(snapshots[state]))
+                environment.options = options
+                environment.perform_action(model.actions[action])
+                return environment.__dict__
+
+            for state in range(size):
+                if model.finished[state]:
+                    continue
+                for action in range(len(model.actions)):
+                    frequencies = state_frequencies(model, lambda: perform(state, action), 600)
+                    self.assertDistribution(model.successors[state][action],frequencies,"%s state %d action %d" %
+                                            (environment_class.__name__, state, action))
+            self.assertEqual(size,len(model),"%s reached a state not in the model" % environment_class.__name__)
+
+    #a tabular environment should give the percepts of the live environment as often.
+    def test_tabular_environment(self):
+        for environment_class, title in [(CoinFlip, 'coin_flip'), (KuhnPoker, 'kuhn_poker')]:
+            random.seed(2)
+            frequencies = []
+            for environment in [environment_class(options = {}),
+                                TabularEnvironment(options = {'tabular-environment': title})]:
+                counts = {}
+                for step in range(6000):
+                    action = environment.valid_actions[step % len(environment.valid_actions)]
+                    percept = (action,) + tuple(environment.perform_action(action))
+                    counts[percept] = counts.get(percept, 0.0) + 1.0 / 6000
+                frequencies.append(counts)
+            for percept in set(frequencies[0]) | set(frequencies[1]):
+                self.assertTrue(abs(frequencies[0].get(percept, 0.0) - frequencies[1].get(percept, 0.0)) < 0.03,
+                                "%s: percept %s" % (environment_class.__name__, percept))
+
+    #environments that break the compiler's rules should be rejected.
+    def test_unsupported_rejected(self):
+        self.assertRaises(AttributeError,compile_environment,GaussEnvironment)
+        self.assertRaises(TypeError,compile_environment,ScaledDrawEnvironment)
+        self.assertRaises(ValueError,compile_environment,CountingEnvironment,{},50)
+        self.assertEqual(1,len(compile_environment(SimpleEnvironment)),"incorrect number of states")
+        #the random module is put back after a rejection.
+        self.assertTrue(random.gauss is not None and isinstance(random.random(), float),"random module not restored")
+
+
+if __name__ == '__main__':
+    unittest.main()
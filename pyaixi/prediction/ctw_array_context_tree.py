@@ -0,0 +1,692 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Defines an array-backed context tree for the Context Tree Weighting algorithm.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import math
+import random
+import sys
+
+from array import array
+
+from pyaixi.prediction.ctw_context_tree import BitHistory, CTWContextTree, file_arrays, log_half, map_tree_file
+
+# The index used to mark a missing child.
+no_child = -1
+
+class CTWArrayContextTree(CTWContextTree):
+    """ An action-conditional context tree that keeps all of its node state in flat typed arrays.
+
+        The mathematics are exactly those of `CTWContextTreeNode`, but instead of one Python
+        object per node, every node is an integer id that indexes into the following arrays:
+
+        - `child0`, `child1`: the id of the child reached by a context bit of 0 or 1,
+          or `no_child` if that child does not exist.
+
+        - `count0`, `count1`: the number of zeros and ones in the history subsequence
+          relevant to the node.
+
+        - `log_kt`: the KT estimate of the block log probability of the node.
+
+        - `log_probability`: the weighted log probability of the node.
+
+        - `log_folded`: the summed weighted log probabilities of the node's evicted children.
+
+        - `node_depths`: the depth of the node, by which the tree counts its nodes per level.
+
+        - `visited`: the tree's clock when the node was last on the context path of an update,
+          for trees that prune by 'lru'.
+
+        The root node always has the id 0. Ids of deleted nodes are kept on a free list
+        and reused by later node allocations, so the arrays only grow when the tree does.
+
+        The class keeps the public interface of `CTWContextTree`, so an agent can switch
+        between the two implementations without any other changes.
+
+        While a checkpoint is active, nodes removed by `revert()` are only unlinked from
+        their parent, so that `rollback()` can link them back. Their ids are released once
+        the last checkpoint is committed.
+
+        A tree returned by `load()` uses `memoryview`s of the memory-mapped file in place of
+        the node arrays, until it first needs to grow them.
+    """
+
+    def __init__(self, depth, estimate_size = None, max_nodes = 0, pruning = 'lru'):
+        """ Create an array-backed context tree of specified maximum depth.
+
+            - `depth`: the maximum depth of the context tree.
+            - `estimate_size`: the number of history bits needed on top of `depth`.
+            - `max_nodes`: the most nodes the tree should hold, or 0 for no limit.
+            - `pruning`: how the tree is kept within `max_nodes`. (See `CTWContextTree.__init__`.)
+        """
+
+        CTWContextTree.__init__(self, depth, estimate_size, max_nodes, pruning)
+
+        # Replace the node object created by the base class with the node arrays.
+        self.clear()
+    # end def
+
+    def allocate_node(self, depth):
+        """ Returns the id of a new, empty node at the given depth.
+        """
+
+        if self.free_nodes:
+            node = self.free_nodes.pop()
+            self.child0[node] = no_child
+            self.child1[node] = no_child
+            self.count0[node] = 0
+            self.count1[node] = 0
+            self.log_kt[node] = 0.0
+            self.log_probability[node] = 0.0
+            self.log_folded[node] = 0.0
+            self.node_depths[node] = depth
+            self.visited[node] = 0
+        else:
+            if isinstance(self.log_kt, memoryview):
+                self.copy_mapped_arrays()
+            # end if
+
+            node = len(self.log_kt)
+            self.child0.append(no_child)
+            self.child1.append(no_child)
+            self.count0.append(0)
+            self.count1.append(0)
+            self.log_kt.append(0.0)
+            self.log_probability.append(0.0)
+            self.log_folded.append(0.0)
+            self.node_depths.append(depth)
+            self.visited.append(0)
+        # end if
+
+        self.tree_size += 1
+        self.depth_sizes[depth] += 1
+
+        return node
+    # end def
+
+    def child(self, node, bit):
+        """ Returns the id of the child of the given node reached by the given context bit,
+            or None if there is no such child.
+        """
+
+        child = self.child1[node] if bit else self.child0[node]
+        return child if child != no_child else None
+    # end def
+
+    def clear(self):
+        """ Clears the entire context tree including all nodes and history.
+        """
+
+        if self.journal is not None:
+            self.journal.append(('clear', {'history': self.history, 'child0': self.child0,
+                                           'child1': self.child1, 'count0': self.count0,
+                                           'count1': self.count1, 'log_kt': self.log_kt,
+                                           'log_probability': self.log_probability,
+                                           'log_folded': self.log_folded,
+                                           'node_depths': self.node_depths,
+                                           'visited': self.visited, 'free_nodes': self.free_nodes,
+                                           'tree_size': self.tree_size,
+                                           'depth_sizes': self.depth_sizes, 'frozen': self.frozen}))
+            self.journaled_nodes = set()
+        # end if
+
+        # Reset the history.
+        self.history = BitHistory(self.size_of_history)
+
+        # The node arrays, holding only the root node.
+        self.child0 = array('i', [no_child])
+        self.child1 = array('i', [no_child])
+        self.count0 = array('I', [0])
+        self.count1 = array('I', [0])
+        self.log_kt = array('d', [0.0])
+        self.log_probability = array('d', [0.0])
+        self.log_folded = array('d', [0.0])
+        self.node_depths = array('H', [0])
+        self.visited = array('L', [0])
+
+        # Ids of deleted nodes, which can be reused.
+        self.free_nodes = []
+
+        # The root node id, and the size of this tree, in total and at each depth.
+        self.root = 0
+        self.tree_size = 1
+        self.depth_sizes = [1] + [0] * self.depth
+        self.frozen = False
+
+        # Reset the context.
+        self.context = []
+    # end def
+
+    def copy_mapped_arrays(self):
+        """ Replaces the memory-mapped node arrays of a loaded tree with copies that can grow.
+        """
+
+        for name, typecode in file_arrays:
+            setattr(self, name, array(typecode, getattr(self, name).tobytes()))
+        # end for
+    # end def
+
+    def end_journal(self):
+        """ Stops recording changes, releasing the ids of the nodes unlinked since the
+            last time the tree was cleared.
+        """
+
+        if self.journal is not None:
+            for entry in reversed(self.journal):
+                if len(entry) == 5:
+                    continue
+                elif entry[0] == 'clear':
+                    break
+                elif entry[0] == 'unlink':
+                    self.free_nodes.append(entry[3])
+                # end if
+            # end for
+        # end if
+
+        CTWContextTree.end_journal(self)
+    # end def
+
+    def eviction_key(self, node):
+        """ Returns the value by which the given node is chosen for eviction.
+            See `CTWContextTree.eviction_key`.
+        """
+
+        if self.pruning == 'lru':
+            return self.visited[node]
+        # end if
+
+        return self.count0[node] + self.count1[node]
+    # end def
+
+    def folded_log_probability(self, node):
+        """ Returns the summed weighted log probabilities of the children evicted from the
+            given node. See `CTWContextTreeNode.log_folded`.
+        """
+
+        return self.log_folded[node]
+    # end def
+
+    def free_node(self, node):
+        """ Releases the given node id so that it can be reused.
+        """
+
+        self.free_nodes.append(node)
+        self.tree_size -= 1
+        self.depth_sizes[self.node_depths[node]] -= 1
+    # end def
+
+    def journal_node(self, node):
+        """ Records the current values of the given node in the undo journal,
+            unless they have been recorded since the newest checkpoint.
+        """
+
+        if node not in self.journaled_nodes:
+            self.journaled_nodes.add(node)
+            self.journal.append((node, self.count0[node], self.count1[node],
+                                 self.log_kt[node], self.log_probability[node]))
+        # end if
+    # end def
+
+    @classmethod
+    def load(cls, filename):
+        """ Returns a context tree loaded from a file written by `CTWContextTree.save()`.
+
+            The node arrays are memory-mapped rather than read, so loading takes time independent
+            of the size of the tree, and processes that load the same file share its pages until
+            they change them. The mapping is copy-on-write: the file itself is never changed.
+
+            - `filename`: the name of the file to load.
+        """
+
+        values = map_tree_file(filename)
+        tree = cls(values['depth'], values['size_of_history'] - values['depth'],
+                   values['max_nodes'], values['pruning'])
+
+        for name, typecode in file_arrays:
+            setattr(tree, name, values[name])
+        # end for
+        tree.visited = array('L', [0]) * values['node_count']
+        tree.tree_size = values['node_count']
+        tree.depth_sizes = list(values['depth_sizes'])
+        tree.history.extend(bytearray(values['history']))
+        tree.frozen = values['frozen']
+
+        return tree
+    # end def
+
+    def memory_statistics(self):
+        """ Returns a dictionary of the size of the tree. See `CTWContextTree.memory_statistics`.
+
+            The byte count is that of the node arrays, including the ids on the free list.
+        """
+
+        arrays = [self.child0, self.child1, self.count0, self.count1, self.log_kt,
+                  self.log_probability, self.log_folded, self.node_depths, self.visited]
+        size = sum([len(values) * values.itemsize for values in arrays]) + sys.getsizeof(self.free_nodes)
+
+        return {'nodes': self.tree_size, 'depth_sizes': list(self.depth_sizes), 'bytes': size}
+    # end def
+
+    def node_depth(self, node):
+        """ Returns the depth of the given node.
+        """
+
+        return self.node_depths[node]
+    # end def
+
+    def node_values(self, node):
+        """ Returns the symbol counts and cached log probabilities of the given node,
+            as a tuple `(zeros, ones, log_kt, log_probability)`.
+        """
+
+        return (self.count0[node], self.count1[node], self.log_kt[node], self.log_probability[node])
+    # end def
+
+    def predict(self, symbol_list):
+        """ Returns the conditional probability of a symbol (or a list of symbols), considering the history.
+
+            See `CTWContextTree.predict`.
+        """
+
+        if isinstance(symbol_list, int):
+            symbol_list = [symbol_list]
+        else:
+            symbol_list = list(symbol_list)
+        # end if
+
+        difference = self.depth - len(self.history)
+        if difference > 0:
+            self.update([random.randint(0, 1) for i in range(difference)])
+        # end if
+
+        h = self.log_probability[self.root]
+        if len(symbol_list) == 1:
+            hy = self.predicted_log_probability(int(symbol_list[0]))
+        else:
+            hy = self.predicted_log_probability_of_list(symbol_list)
+        # end if
+
+        return math.exp(hy - h)
+    # end def
+
+    def predicted_log_probability(self, symbol):
+        """ Returns the weighted log probability the root node would have after an update
+            with the given symbol, without changing the tree.
+            See `CTWContextTree.predicted_log_probability`.
+        """
+
+        child0, child1 = self.child0, self.child1
+        count0, count1 = self.count0, self.count1
+        log_kt, log_probability = self.log_kt, self.log_probability
+
+        # Find the existing nodes on the context path.
+        bits = self.history.context(self.depth)
+        path = [self.root]
+        node = self.root
+        for bit in bits:
+            node = child1[node] if bit else child0[node]
+            if node == no_child:
+                break
+            # end if
+            path.append(node)
+        # end for
+
+        # Nodes below the deepest existing node would be new, with probability 1/2.
+        log_p = log_half
+
+        # Walk back up, recomputing each existing node with its updated child.
+        for index in range(len(path) - 1, -1, -1):
+            node = path[index]
+            a = count0[node]
+            b = count1[node]
+            node_log_kt = log_kt[node] + math.log(((b if symbol else a) + 0.5) / (a + b + 1))
+
+            if index == self.depth:
+                log_p = node_log_kt
+            else:
+                children = log_p + self.log_folded[node]
+                sibling = child0[node] if bits[index] else child1[node]
+                if sibling != no_child:
+                    children += log_probability[sibling]
+                # end if
+
+                a, b = (node_log_kt, children) if node_log_kt > children else (children, node_log_kt)
+                log_p = log_half + a + math.log(1 + math.exp(b - a))
+            # end if
+        # end for
+
+        return log_p
+    # end def
+
+    def predicted_log_probability_of_list(self, symbol_list):
+        """ Returns the weighted log probability the root node would have after an update
+            with the given list of symbols, without changing the tree.
+            See `CTWContextTree.predicted_log_probability_of_list`.
+        """
+
+        child0, child1 = self.child0, self.child1
+        scratch = {}
+
+        # The current context, most recent symbol first.
+        window = list(self.history.context(self.depth))
+
+        for symbol in symbol_list:
+            symbol = int(symbol)
+
+            # Walk the context path once. Missing nodes are keyed by (parent key, context bit).
+            key = node = self.root
+            path = [(key, node)]
+            for bit in window:
+                child = no_child
+                if node != no_child:
+                    child = child1[node] if bit else child0[node]
+                # end if
+                key = child if child != no_child else (key, bit)
+                node = child
+                path.append((key, node))
+            # end for
+
+            # Compute the would-be values from the leaf to the root.
+            for index in range(len(path) - 1, -1, -1):
+                key, node = path[index]
+                state = scratch.get(key)
+                if state is None:
+                    if node == no_child:
+                        state = [0, 0, 0.0, 0.0]
+                    else:
+                        state = [self.count0[node], self.count1[node],
+                                 self.log_kt[node], self.log_probability[node]]
+                    # end if
+                    scratch[key] = state
+                # end if
+
+                a, b = state[0], state[1]
+                state[2] += math.log(((b if symbol else a) + 0.5) / (a + b + 1))
+                state[symbol] += 1
+
+                if index == len(path) - 1:
+                    state[3] = state[2]
+                else:
+                    children = self.log_folded[node] if node != no_child else 0.0
+                    for bit, bit_children in ((0, child0), (1, child1)):
+                        child = bit_children[node] if node != no_child else no_child
+                        child_key = child if child != no_child else (key, bit)
+                        if child_key in scratch:
+                            children += scratch[child_key][3]
+                        elif child != no_child:
+                            children += self.log_probability[child]
+                        # end if
+                    # end for
+
+                    a, b = (state[2], children) if state[2] > children else (children, state[2])
+                    state[3] = log_half + a + math.log(1 + math.exp(b - a))
+                # end if
+            # end for
+
+            window.insert(0, symbol)
+            del window[self.depth:]
+        # end for
+
+        return scratch[self.root][3] if scratch else self.log_probability[self.root]
+    # end def
+
+    def revert(self, symbol_count = 1):
+        """ Restores the context tree to its state prior to a specified number of updates.
+
+            - `symbol_count`: the number of updates (symbols) to revert. (Default of 1.)
+        """
+
+        assert len(self.history) >= symbol_count, "Cannot revert, symbol_count bigger than the length of history"
+
+        # A frozen tree was only updated in its history.
+        if self.frozen:
+            self.revert_history(symbol_count)
+            return None
+        # end if
+
+        difference = len(self.history) - symbol_count
+
+        # As in `CTWContextTree.revert`, a revert back into the first `depth` bits of history
+        # discards the tree and keeps only the history.
+        if difference < self.depth:
+            history = self.history
+            history.truncate(difference + 1)
+            self.clear()
+            self.history = history
+
+            return None
+        # end if
+
+        child0, child1 = self.child0, self.child1
+        count0, count1 = self.count0, self.count1
+        log_kt = self.log_kt
+
+        for step in range(symbol_count):
+            bit = self.history.pop()
+
+            self.update_context()
+            context = self.context
+
+            # Revert from the leaf to the root, because of the dependency relationships.
+            for index in range(len(context) - 1, -1, -1):
+                node = context[index]
+
+                # Remove the child on the context path once it no longer holds any symbols.
+                if index + 1 < len(context):
+                    child = context[index + 1]
+                    if count0[child] + count1[child] == 0:
+                        bit_of_child = 0 if child0[node] == child else 1
+                        if bit_of_child:
+                            child1[node] = no_child
+                        else:
+                            child0[node] = no_child
+                        # end if
+
+                        if self.journal is not None:
+                            self.journal.append(('unlink', node, bit_of_child, child))
+                            self.tree_size -= 1
+                            self.depth_sizes[index + 1] -= 1
+                        else:
+                            self.free_node(child)
+                        # end if
+                    # end if
+                # end if
+
+                if self.journal is not None:
+                    self.journal_node(node)
+                # end if
+
+                a = count0[node]
+                b = count1[node]
+                if bit:
+                    b = max(0, b - 1)
+                    count1[node] = b
+                else:
+                    a = max(0, a - 1)
+                    count0[node] = a
+                # end if
+
+                log_kt[node] -= math.log(((b if bit else a) + 0.5) / (a + b + 1))
+                self.update_log_probability(node)
+            # end for
+        # end for
+    # end def
+
+    def remove_child(self, node, bit):
+        """ Removes the child of the given node reached by the given context bit, along with
+            its descendants, folds its weighted probability into the node, releases their ids,
+            and returns them.
+        """
+
+        children = self.child1 if bit else self.child0
+        removed = []
+        stack = [children[node]]
+        self.log_folded[node] += self.log_probability[stack[0]]
+        children[node] = no_child
+        while stack:
+            child = stack.pop()
+            removed.append(child)
+            for grandchild in (self.child0[child], self.child1[child]):
+                if grandchild != no_child:
+                    stack.append(grandchild)
+                # end if
+            # end for
+            self.free_node(child)
+        # end while
+
+        return removed
+    # end def
+
+    def undo(self, entry):
+        """ Undoes the change recorded in the given journal entry.
+        """
+
+        if len(entry) == 5:
+            # The previous values of a node.
+            node = entry[0]
+            self.count0[node] = entry[1]
+            self.count1[node] = entry[2]
+            self.log_kt[node] = entry[3]
+            self.log_probability[node] = entry[4]
+        elif entry[0] == 'link':
+            # A created node: remove it.
+            children = self.child1 if entry[2] else self.child0
+            children[entry[1]] = no_child
+            self.free_node(entry[3])
+        elif entry[0] == 'unlink':
+            # A removed node: put it back.
+            children = self.child1 if entry[2] else self.child0
+            children[entry[1]] = entry[3]
+            self.tree_size += 1
+            self.depth_sizes[self.node_depths[entry[3]]] += 1
+        else:
+            # A cleared tree: restore the previous node arrays and history.
+            self.__dict__.update(entry[1])
+        # end if
+    # end def
+
+    def update(self, symbol_list):
+        """ Updates the context tree with a new (binary) symbol, or a list of symbols.
+
+            - `symbol_list`: the symbol (or list of symbols) with which to update the tree.
+        """
+
+        if isinstance(symbol_list, int):
+            symbol_list = [symbol_list]
+        else:
+            symbol_list = list(symbol_list)
+        # end if
+
+        # A frozen tree no longer learns.
+        if self.frozen:
+            self.update_history([int(bit) for bit in symbol_list])
+            return None
+        # end if
+
+        for bit in symbol_list:
+            bit = int(bit)
+
+            # Not enough history for a full context yet: only record the bit.
+            if len(self.history) < self.depth:
+                self.update_history(bit)
+                continue
+            # end if
+
+            # Creating the context nodes can replace the node arrays of a loaded tree.
+            self.update_context()
+            count0, count1 = self.count0, self.count1
+            log_kt = self.log_kt
+
+            if self.track_visits:
+                self.clock += 1
+                for node in self.context:
+                    self.visited[node] = self.clock
+                # end for
+            # end if
+
+            # Update from the leaf to the root, because of the dependency relationships.
+            for node in reversed(self.context):
+                if self.journal is not None:
+                    self.journal_node(node)
+                # end if
+
+                a = count0[node]
+                b = count1[node]
+                log_kt[node] += math.log(((b if bit else a) + 0.5) / (a + b + 1))
+                if bit:
+                    count1[node] = b + 1
+                else:
+                    count0[node] = a + 1
+                # end if
+                self.update_log_probability(node)
+            # end for
+
+            self.update_history(bit)
+        # end for
+    # end def
+
+    def update_context(self):
+        """ Calculates the ids of the nodes that correspond to the current context,
+            and stores them in `context` in order from root to leaf.
+
+            Creates the nodes if they do not exist.
+        """
+
+        child0, child1 = self.child0, self.child1
+
+        node = self.root
+        context = [node]
+
+        for bit in self.history.context(self.depth):
+            children = child1 if bit else child0
+            child = children[node]
+            if child == no_child:
+                child = self.allocate_node(len(context))
+
+                # Allocating can replace the node arrays of a loaded tree.
+                child0, child1 = self.child0, self.child1
+                children = child1 if bit else child0
+                children[node] = child
+
+                # A new node needs no recorded values: undoing its creation removes it.
+                if self.journal is not None:
+                    self.journal.append(('link', node, bit, child))
+                    self.journaled_nodes.add(child)
+                # end if
+            # end if
+            context.append(child)
+            node = child
+        # end for
+
+        self.context = context
+    # end def
+
+    def update_log_probability(self, node):
+        """ Recalculates the weighted log probability of the given node.
+            See `CTWContextTreeNode.update_log_probability`.
+        """
+
+        c0 = self.child0[node]
+        c1 = self.child1[node]
+
+        if c0 == no_child and c1 == no_child and self.log_folded[node] == 0.0:
+            self.log_probability[node] = self.log_kt[node]
+        else:
+            children = self.log_folded[node]
+            if c0 != no_child:
+                children += self.log_probability[c0]
+            # end if
+            if c1 != no_child:
+                children += self.log_probability[c1]
+            # end if
+
+            a, b = sorted([self.log_kt[node], children], reverse = True)
+            self.log_probability[node] = log_half + a + math.log(1 + math.exp(b - a))
+        # end if
+    # end def
+# end class
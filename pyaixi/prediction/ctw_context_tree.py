@@ -9,24 +9,167 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import math
+import mmap
 import random
+import struct
+import sys
+
+from array import array
 
 # Ensure xrange is defined on Python 3.
 from six.moves import xrange
-from collections import deque
-from copy import deepcopy
+
+# NumPy is optional: it is only needed for `CTWContextTree.percept_distribution()`.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+# end try
 
 # The value ln(0.5).
 # This value is used often in computations and so is made a constant for efficiency reasons.
 log_half = math.log(0.5)
 
-'''
-I do not maintain the tree size exactly,
-because when the depth get larger.
-Calculating the tree size
-is horible.
+# The ways a context tree with a node budget can be kept within it. (See `CTWContextTree.enforce_node_budget()`.)
+pruning_policies = ('lru', 'low-count', 'freeze')
+
+# The file format of saved context trees. (See `CTWContextTree.save()`.)
+# A file starts with a header of the magic bytes, the format version, flags (`file_frozen`
+# and `file_little_endian`), the index of the pruning policy, the tree depth, the length
+# of the saved history window, the node count, the node budget and the history capacity.
+file_magic = b'PYAIXICT'
+file_version = 1
+file_header = struct.Struct('<8sIIIIIQQQ4x')
+file_frozen = 1
+file_little_endian = 2
+
+# The node arrays of a saved tree, with their typecodes, in the order they are stored:
+# widest items first, so that every array starts on a multiple of its item size.
+# Nodes are numbered breadth first from the root, which is node 0; missing children are -1.
+file_arrays = (('log_kt', 'd'), ('log_probability', 'd'), ('log_folded', 'd'),
+               ('child0', 'i'), ('child1', 'i'), ('count0', 'I'), ('count1', 'I'),
+               ('node_depths', 'H'))
+
+
+def map_tree_file(filename):
+    """ Maps a file saved by `CTWContextTree.save()` into memory, and returns a dictionary of its
+        header values and of read-only views of its arrays, which are not copied until changed.
+        The views are `memoryview`s of a copy-on-write mapping, so changes to them are private to
+        this process and never written back to the file.
+
+        - `filename`: the name of the file to load.
+    """
+
+    with open(filename, 'rb') as tree_file:
+        mapping = mmap.mmap(tree_file.fileno(), 0, access = mmap.ACCESS_COPY)
+    # end with
+
+    magic, version, flags, pruning, depth, history_length, node_count, max_nodes, history_size = \
+        file_header.unpack_from(mapping, 0)
+    assert magic == file_magic, "The file '%s' is not a saved context tree." % filename
+    assert version == file_version, \
+           "The file '%s' has format version %d, not %d." % (filename, version, file_version)
+    assert bool(flags & file_little_endian) == (sys.byteorder == 'little'), \
+           "The file '%s' was saved on a machine of another byte order." % filename
+
+    values = {'depth': depth, 'frozen': bool(flags & file_frozen), 'max_nodes': max_nodes,
+              'node_count': node_count, 'pruning': pruning_policies[pruning],
+              'size_of_history': history_size}
+
+    view = memoryview(mapping)
+    offset = file_header.size
+    values['depth_sizes'] = view[offset:offset + 8 * (depth + 1)].cast('Q')
+    offset += 8 * (depth + 1)
+    for name, typecode in file_arrays:
+        size = node_count * array(typecode).itemsize
+        values[name] = view[offset:offset + size].cast(typecode)
+        offset += size
+    # end for
+    values['history'] = view[offset:offset + history_length]
+
+    return values
+# end def
+
+
+def random_choice_by_log_probability(items, log_probabilities):
+    """ Returns one of the given items, chosen at random in proportion to the exponential of
+        its log probability. The probabilities need not sum to 1.
+
+        - `items`: the items to choose from.
+        - `log_probabilities`: the log probability of each item, in the same order.
+    """
+
+    # Scale by the most likely item, so that the weights cannot all underflow.
+    highest = max(log_probabilities)
+    weights = [math.exp(log_probability - highest) for log_probability in log_probabilities]
+
+    pick = random.random() * sum(weights)
+    for item, weight in zip(items, weights):
+        pick -= weight
+        if pick < 0:
+            return item
+        # end if
+    # end for
+
+    return items[-1]
+# end def
+
+
+def sample_symbols_and_update(tree, symbol_count, cache = None):
+    """ Returns the given number of symbols, each sampled from the tree's prediction given the
+        ones before it, and updates the tree with each symbol as it is sampled.
+
+        - `tree`: the context tree (or overlay) to sample from and update.
+        - `symbol_count`: the number of symbols to generate.
+        - `cache`: a dictionary that caches, for the tree's current state, the probability of
+                   each symbol being 1 given the symbols sampled before it, or None.
+                   The symbols before are keyed as an integer with a leading 1 bit.
+                   Entries are only predicted by the tree when missing, so the tree must be in
+                   the same state at every call made with the same cache.
+    """
+
+    sample = []
+    prefix = 1
+    for index in xrange(symbol_count):
+        # By the chain rule, sampling each symbol given the ones before it samples the
+        # sequence from its probability given the history.
+        if cache is None:
+            probability = tree.predict(1)
+        else:
+            probability = cache.get(prefix)
+            if probability is None:
+                probability = cache[prefix] = tree.predict(1)
+            # end if
+        # end if
+        symbol = 1 if probability >= random.random() else 0
+        tree.update(symbol)
+        sample.append(symbol)
+        prefix = (prefix << 1) | symbol
+    # end for
+
+    return sample
+# end def
+
+
+def sequence_trie(symbol_lists):
+    """ Returns the given symbol lists arranged into a trie of nested dictionaries.
+        Each dictionary maps the next symbol (0 or 1) to the trie below it, and None to the
+        indices of the lists that end there.
+
+        - `symbol_lists`: the symbol lists (or strings of '0' and '1').
+    """
+
+    trie = {}
+    for index, symbol_list in enumerate(symbol_lists):
+        node = trie
+        for symbol in symbol_list:
+            node = node.setdefault(int(symbol), {})
+        # end for
+        node.setdefault(None, []).append(index)
+    # end for
 
-'''
+    return trie
+# end def
 
 class CTWContextTreeNode:
     """ The CTWContextTreeNode class represents a node in an action-conditional context tree.
@@ -97,8 +240,11 @@ class CTWContextTreeNode:
 
     # Instance methods.
 
-    def __init__(self, tree = None):
+    def __init__(self, tree = None, depth = 0):
         """ Construct a node of the context tree.
+
+            - `tree`: the tree the node belongs to, if any.
+            - `depth`: the depth of the node in that tree. (The root is at depth 0.)
         """
 
         # The children of this node.
@@ -107,6 +253,9 @@ class CTWContextTreeNode:
         # The tree object associated with this node.
         self.tree = tree
 
+        # The depth of this node in its tree, by which the tree counts its nodes per level.
+        self.depth = depth
+
         # The cached KT estimate of the block log probability for this node.
         # This value is computed only when the node is changed by the update or revert methods.
         self.log_kt = 0.0
@@ -117,14 +266,23 @@ class CTWContextTreeNode:
 
         # The count of the symbols in the history subsequence relevant to this node.
         self.symbol_count = {0: 0, 1: 0}
+
+        # The summed weighted log probabilities of the children that were evicted by pruning.
+        # Part of the children's term of the weighted probability, so that evicting a subtree
+        # leaves the probabilities of the nodes above it unchanged.
+        self.log_folded = 0.0
+
+        # The tree's clock when this node was last on the context path of an update.
+        # Only kept by trees that prune by 'lru'.
+        self.visited = 0
     # end def
 
     def is_leaf_node(self):
         """ Return True if the node is a leaf node, False otherwise.
         """
 
-        # If this node has no children, it's a leaf node.
-        return self.children == {}
+        # If this node has no children, and never had any evicted, it's a leaf node.
+        return self.children == {} and self.log_folded == 0.0
     # end def
 
     def log_kt_multiplier(self, symbol):
@@ -180,13 +338,19 @@ class CTWContextTreeNode:
         # we will get inaccurate probability for each of non-leaf node.
         # because the leaf node is the base case for our recursive appraoch 
         # of calculating probability.
-        if symbol in self.children:
-            
-            child = self.children[symbol]
+        # The child on the reverted context path is keyed by its context bit, not by the
+        # reverted symbol, so check both: an empty child left behind would otherwise turn a
+        # node whose children were pruned back into an internal node.
+        for bit, child in list(self.children.items()):
             
             if sum(child.symbol_count.values()) ==  0:
                 
-                del self.children[symbol]
+                del self.children[bit]
+
+                if self.tree is not None:
+                    self.tree.count_nodes(child, -1)
+                    if self.tree.journal is not None:
+                        self.tree.journal.append(('unlink', self, bit, child))
                 
                 
         #consistent with log_kt_multiplier
@@ -285,7 +449,7 @@ class CTWContextTreeNode:
         else:
             # as we update from leaf to root, thus the chirldren's probabiltiy
             # must already been updated.
-            children = sum([subnode.log_probability for _,subnode in self.children.items()])
+            children = self.log_folded + sum([subnode.log_probability for _,subnode in self.children.items()])
             # a > b -> smallest exp(log(b) - log(a))
             # a should be larger than b.
             a,b = sorted([self.log_kt,children],reverse = True)
@@ -303,25 +467,204 @@ class CTWContextTreeNode:
 # end class
     
     
-class CTWContextTree_Undo:
-    
-    '''
-    Used to store the attributes of
-    CTWContextTree, and we can revert symbols in 
-    a efficient way.That trades the computation 
-    power with storage.
-    
-    In order to revert a 24 bits sequence, assume we have 96 ctw depth.
-    we need to do 24  * 96 constant operations in the traditional appraoch. However,
-    Using the CTWContextTree_Undo class, we can revert CTWContextTree to previous state
-    within 1 constant operations.
+class BitHistory:
+    """ A bounded history of binary symbols, stored in a growable ring buffer.
+
+        The buffer is a `bytearray` holding one symbol per byte. It starts small and
+        doubles in capacity as symbols are appended, until it reaches `maxlen`. From then
+        on, appending a symbol overwrites the oldest one, as for a `deque` with a `maxlen`.
+
+        - `append()`, `extend()` and `pop()` take O(1) time per symbol.
+
+        - `context(depth)` returns the most recent `depth` symbols, most recent first,
+          in O(depth) time, independent of the length of the history.
+
+        - `truncate(length)` shrinks the history to its oldest `length` symbols in O(1) time.
+
+        While `journal` is a list, every change is recorded in it, so that `rollback()` can
+        undo the changes made since a given journal position.
+    """
+
+    # The capacity of a new history buffer.
+    initial_capacity = 1024
+
+    def __init__(self, maxlen, symbol_list = []):
+        """ Create an empty history holding at most `maxlen` symbols,
+            then append the given symbols.
+        """
+
+        assert maxlen > 0, "The maximum history length must be greater than zero."
+        self.maxlen = maxlen
+
+        # The ring buffer, the position of the oldest symbol in it, and the number of symbols held.
+        self.buffer = bytearray(min(self.initial_capacity, maxlen))
+        self.start = 0
+        self.length = 0
+
+        # The undo journal, or None if changes are not being recorded.
+        self.journal = None
+
+        self.extend(symbol_list)
+    # end def
+
+    def __eq__(self, other):
+        return isinstance(other, BitHistory) and list(self) == list(other)
+    # end def
+
+    __hash__ = None
+
+    def __iadd__(self, symbol_list):
+        self.extend(symbol_list)
+        return self
+    # end def
+
+    def __iter__(self):
+        """ Iterates over the symbols from the oldest to the most recent.
+        """
+
+        buffer = self.buffer
+        capacity = len(buffer)
+        for index in xrange(self.start, self.start + self.length):
+            yield buffer[index % capacity]
+        # end for
+    # end def
+
+    def __len__(self):
+        return self.length
+    # end def
+
+    def __repr__(self):
+        return "BitHistory(%s)" % str(list(self))
+    # end def
+
+    def append(self, symbol):
+        """ Appends a symbol, dropping the oldest symbol if the history is full.
+        """
+
+        buffer = self.buffer
+        capacity = len(buffer)
+
+        if self.length == capacity:
+            if capacity < self.maxlen:
+                # Grow the buffer, laying the symbols out from the start again.
+                self.buffer = buffer[self.start:] + buffer[:self.start] + \
+                              bytearray(min(2 * capacity, self.maxlen) - capacity)
+                self.start = 0
+                buffer = self.buffer
+                capacity = len(buffer)
+            else:
+                # Overwrite the oldest symbol.
+                if self.journal is not None:
+                    self.journal.append((buffer[self.start],))
+                # end if
+                buffer[self.start] = symbol
+                self.start = (self.start + 1) % capacity
+                return
+            # end if
+        # end if
+
+        if self.journal is not None:
+            self.journal.append(None)
+        # end if
+        buffer[(self.start + self.length) % capacity] = symbol
+        self.length += 1
+    # end def
+
+    def clear(self):
+        """ Removes all symbols.
+        """
+
+        self.truncate(0)
+        self.start = 0
+    # end def
+
+    def context(self, depth):
+        """ Returns the most recent `depth` symbols (or all of them, if there are fewer),
+            ordered from the most recent to the oldest.
+        """
+
+        count = min(depth, self.length)
+        if count == 0:
+            return b''
+        # end if
+
+        buffer = self.buffer
+        capacity = len(buffer)
+        end = (self.start + self.length) % capacity or capacity
+        if end >= count:
+            return bytes(buffer[end - count:end][::-1])
+        # end if
+
+        # The most recent symbols wrap around the end of the buffer.
+        return bytes((buffer[capacity - count + end:] + buffer[:end])[::-1])
+    # end def
+
+    def extend(self, symbol_list):
+        """ Appends each of the given symbols in turn.
+        """
+
+        for symbol in symbol_list:
+            self.append(symbol)
+        # end for
+    # end def
+
+    def pop(self):
+        """ Removes and returns the most recent symbol.
+        """
+
+        assert self.length > 0, "Cannot pop from an empty history."
+        self.length -= 1
+        symbol = self.buffer[(self.start + self.length) % len(self.buffer)]
+        if self.journal is not None:
+            self.journal.append(symbol)
+        # end if
+
+        return symbol
+    # end def
+
+    def rollback(self, position):
+        """ Undoes the changes recorded in the journal after the given journal position.
+        """
+
+        journal = self.journal
+        self.journal = None
+
+        while len(journal) > position:
+            entry = journal.pop()
+            if entry is None:
+                # An append: remove the symbol again.
+                self.length -= 1
+            elif isinstance(entry, tuple):
+                # An append that overwrote the oldest symbol: put the oldest symbol back.
+                self.length -= 1
+                self.start = (self.start - 1) % len(self.buffer)
+                self.buffer[self.start] = entry[0]
+                self.length += 1
+            elif isinstance(entry, int):
+                # A pop: append the symbol again.
+                self.append(entry)
+            else:
+                # A truncation: append the removed symbols again.
+                self.extend(entry)
+            # end if
+        # end while
+
+        self.journal = journal
+    # end def
+
+    def truncate(self, length):
+        """ Keeps only the oldest `length` symbols.
+        """
+
+        assert 0 <= length <= self.length, "The given length must be between 0 and the history length."
+        if self.journal is not None and length < self.length:
+            removed = self.context(self.length - length)
+            self.journal.append(removed[::-1])
+        # end if
+        self.length = length
+    # end def
+# end class
 
-    '''
-    
-    def __init__(self, tree):
-        
-        for field,value in tree.__dict__.items():
-            exec("self.field = deepcopy(value)")
 
 class CTWContextTree:
     """ The high-level interface to an action-conditional context tree.
@@ -345,6 +688,10 @@ class CTWContextTree:
 
         - `predict()` predicts the probability of future outcomes.
 
+        - `percept_distribution()` predicts the probability of every sequence of a given length.
+
+        - `sequence_log_probabilities()` predicts the log probabilities of a batch of sequences.
+
         - `generate_random_symbols_and_update()` samples a sequence from the
            context tree, updating the tree with each symbol as it is sampled.
 
@@ -352,15 +699,51 @@ class CTWContextTree:
            updating the tree with each symbol as it is sampled, then reverting all the
            updates so that the tree is in the same state as it was before the
            sampling.
+
+        - `checkpoint()` and `rollback()` save and restore the state of the tree
+          and its history through an undo journal.
+
+        - `enforce_node_budget()` keeps a tree created with `max_nodes` within that many nodes.
+
+        - `memory_statistics()` reports the number of nodes, per level and in total, and an
+          estimate of the memory they take.
+
+        - `save()` and `load()` write the tree to a compact binary file and read it back.
     """
 
-    def __init__(self, depth, estimate_size = None):
+    # Class attributes.
+
+    # The fraction of `max_nodes` that pruning brings the tree down to, so that the cost of
+    # choosing the nodes to evict is shared by many updates.
+    pruning_target = 0.75
+
+    def __init__(self, depth, estimate_size = None, max_nodes = 0, pruning = 'lru'):
         """ Create a context tree of specified maximum depth.
             Nodes are created as needed.
 
             - `depth`: the maximum depth of the context tree.
+            - `estimate_size`: the number of history bits needed on top of `depth`.
+            - `max_nodes`: the most nodes the tree should hold, or 0 for no limit.
+                           (See `enforce_node_budget()`.)
+            - `pruning`: how the tree is kept within `max_nodes`, one of `pruning_policies`.
         """
 
+        # The node budget, and how the tree is kept within it.
+        assert max_nodes >= 0, "The given node budget must not be negative."
+        assert pruning in pruning_policies, \
+               "The given pruning policy '%s' is not one of %s." % (pruning, pruning_policies)
+        self.max_nodes = max_nodes
+        self.pruning = pruning
+
+        # Whether the tree has been frozen by the 'freeze' policy, after which updates only
+        # extend the history.
+        self.frozen = False
+
+        # The number of symbols the tree has been updated with, which the nodes on each context
+        # path record when they are pruned by 'lru'.
+        self.clock = 0
+        self.track_visits = max_nodes > 0 and pruning == 'lru'
+
         # An list used to hold the nodes in the context tree that correspond to the current context.
         # It is important to ensure that `update_context()` is called before accessing the contents
         # of this list as they may otherwise be inaccurate.
@@ -380,58 +763,183 @@ class CTWContextTree:
             
         self.size_of_history  = estimate_size + depth
         
-        self.history = deque([],self.size_of_history)
+        self.history = BitHistory(self.size_of_history)
 
         # The root node of the context tree.
         self.root = CTWContextTreeNode(tree = self)
 
         # The size of this tree.
         self.tree_size = 1
-        
-        #whether to trade the computation power with storage
-        self.trade_off = False
-    
+
+        # The number of nodes at each depth of this tree, kept along with `tree_size`.
+        self.depth_sizes = [1] + [0] * depth
+
+        # The journal positions of the active checkpoints, oldest first. (See `checkpoint()`.)
+        self.checkpoints = []
+
+        # The undo journal, or None if there is no active checkpoint.
+        self.journal = None
+
+        # The nodes whose values have been recorded since the newest checkpoint.
+        self.journaled_nodes = None
+    # end def
+
+    def checkpoint(self):
+        """ Returns a token for the current state of the tree, which `rollback()` can restore.
+
+            From the first checkpoint on, every change is recorded in an undo journal:
+            the previous values of each node the first time it changes, the nodes that are
+            created or removed, and the changes to the history.
+            Checkpoints can be nested; rolling back to a checkpoint also discards any newer ones.
+        """
+
+        if not self.checkpoints:
+            self.journal = []
+            self.history.journal = []
+        # end if
+
+        self.checkpoints.append((len(self.journal), len(self.history.journal)))
+        self.journaled_nodes = set()
+
+        return len(self.checkpoints) - 1
+    # end def
+
+    def commit(self, token):
+        """ Keeps the changes made since the given checkpoint, and discards the checkpoint
+            along with any newer ones. Once no checkpoint remains, changes are no longer recorded.
+
+            - `token`: a token returned by `checkpoint()`.
+        """
+
+        assert 0 <= token < len(self.checkpoints), "The given checkpoint is not active."
+
+        del self.checkpoints[token:]
+        if not self.checkpoints:
+            self.end_journal()
+        # end if
+    # end def
+
+    def end_journal(self):
+        """ Stops recording changes.
+        """
+
+        self.journal = None
+        self.journaled_nodes = None
+        self.history.journal = None
+    # end def
+
+    def child(self, node, bit):
+        """ Returns the child of the given node reached by the given context bit,
+            or None if there is no such child.
+        """
+
+        return node.children.get(bit)
     # end def
-    
-    def set_tade_off(self,value):
-        '''
-        set the trade off between computation power and storage
-        only take bool value as  input. If the value is true,
-        we will use the CTWContextTree_Undo class, otherwise 
-        we use traditional approach in the revret operations.
-        
-        '''
-        
-        assert isinstance(value,bool),"invalid settings"
-        
-        self.trade_off = value
-        
-    def model_revert(self,undo_ctw):
-        '''
-        revert model to previous state
-        
-        '''
-        
-        for field,value in undo_ctw.__dict__.items():
-            exec("self.field = value")
 
     def clear(self):
         """ Clears the entire context tree including all nodes and history.
         """
 
+        if self.journal is not None:
+            self.journal.append(('clear', {'root': self.root, 'tree_size': self.tree_size,
+                                           'depth_sizes': self.depth_sizes,
+                                           'history': self.history, 'frozen': self.frozen}))
+            self.journaled_nodes = set()
+        # end if
+
         # Reset the history.
-        self.history = deque([],self.size_of_history)
+        self.history = BitHistory(self.size_of_history)
 
         # Set a new root object, and reset the tree size.
-        self.root.tree = None
-        del self.root
         self.root = CTWContextTreeNode(tree = self)
         self.tree_size = 1
+        self.depth_sizes = [1] + [0] * self.depth
+        self.frozen = False
 
         # Reset the context.
         self.context = []
     # end def
 
+    def count_nodes(self, node, change):
+        """ Adds the given change, 1 or -1, to the size counters for the given node and each
+            of its descendants, as they are linked into or unlinked from the tree.
+        """
+
+        depth_sizes = self.depth_sizes
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            self.tree_size += change
+            depth_sizes[self.node_depth(node)] += change
+            for bit in (0, 1):
+                child = self.child(node, bit)
+                if child is not None:
+                    stack.append(child)
+                # end if
+            # end for
+        # end while
+    # end def
+
+    def enforce_node_budget(self):
+        """ Brings the tree back within `max_nodes`, if it has grown past it, according to
+            the pruning policy, and returns the number of nodes evicted.
+
+            - 'lru' evicts the subtrees that have gone longest without being on the context
+              path of an update.
+            - 'low-count' evicts the nodes that have seen the fewest symbols. Since a node has
+              seen at least as many symbols as any of its descendants, these are leaves, or
+              subtrees of equally rare contexts.
+            - 'freeze' evicts nothing, but freezes the tree: from then on, updates only extend
+              the history, and the tree stops learning.
+
+            Evictions bring the tree down to `pruning_target` of its budget. An evicted node's
+            symbols are still counted by its parent's KT estimate, and its weighted probability
+            is folded into the parent's, so the probabilities of the history are unchanged.
+            Later symbols in the evicted contexts are predicted by new nodes that start empty,
+            mixed with the parent's estimate, so the tree still assigns valid probabilities.
+
+            Nodes cannot be evicted while a checkpoint is active, and `revert()` cannot undo
+            updates made before an eviction, so this should only be called between updates
+            that are kept.
+        """
+
+        if self.max_nodes == 0 or self.tree_size <= self.max_nodes:
+            return 0
+        # end if
+
+        assert self.journal is None, "Cannot prune the tree while a checkpoint is active."
+
+        if self.pruning == 'freeze':
+            self.frozen = True
+            return 0
+        # end if
+
+        size = self.tree_size
+        self.prune(int(self.max_nodes * self.pruning_target))
+
+        return size - self.tree_size
+    # end def
+
+    def eviction_key(self, node):
+        """ Returns the value by which the given node is chosen for eviction: nodes with
+            lower values are evicted first. (See `enforce_node_budget()`.)
+        """
+
+        if self.pruning == 'lru':
+            return node.visited
+        # end if
+
+        return node.symbol_count[0] + node.symbol_count[1]
+    # end def
+
+    def folded_log_probability(self, node):
+        """ Returns the summed weighted log probabilities of the children evicted from the
+            given node. See `CTWContextTreeNode.log_folded`.
+        """
+
+        return node.log_folded
+    # end def
+
     def generate_random_symbols(self, symbol_count):
         """ Returns a symbol string of a specified length by sampling from the context tree.
 
@@ -443,6 +951,55 @@ class CTWContextTree:
         return symbol_list
     # end def
     
+    def journal_node(self, node):
+        """ Records the current values of the given node in the undo journal,
+            unless they have been recorded since the newest checkpoint.
+        """
+
+        if node not in self.journaled_nodes:
+            self.journaled_nodes.add(node)
+            self.journal.append((node, node.symbol_count[0], node.symbol_count[1],
+                                 node.log_kt, node.log_probability))
+        # end if
+    # end def
+
+    @classmethod
+    def load(cls, filename):
+        """ Returns a context tree loaded from a file written by `save()`.
+
+            Loading builds a node object for every saved node. `CTWArrayContextTree.load()`
+            memory-maps the node arrays instead, which is much faster for large trees.
+
+            - `filename`: the name of the file to load.
+        """
+
+        values = map_tree_file(filename)
+        tree = cls(values['depth'], values['size_of_history'] - values['depth'],
+                   values['max_nodes'], values['pruning'])
+
+        nodes = [CTWContextTreeNode(tree, depth) for depth in values['node_depths']]
+        for index, node in enumerate(nodes):
+            node.symbol_count[0] = values['count0'][index]
+            node.symbol_count[1] = values['count1'][index]
+            node.log_kt = values['log_kt'][index]
+            node.log_probability = values['log_probability'][index]
+            node.log_folded = values['log_folded'][index]
+            for bit, children in ((0, values['child0']), (1, values['child1'])):
+                if children[index] >= 0:
+                    node.children[bit] = nodes[children[index]]
+                # end if
+            # end for
+        # end for
+
+        tree.root = nodes[0]
+        tree.tree_size = len(nodes)
+        tree.depth_sizes = list(values['depth_sizes'])
+        tree.history.extend(bytearray(values['history']))
+        tree.frozen = values['frozen']
+
+        return tree
+    # end def
+
     def maximum_likelihood_sequence(self,action_binary):
         
         '''
@@ -452,49 +1009,157 @@ class CTWContextTree:
             - 'action_binary': [[]] : the list of binary representations of actons
         '''
         
+        # All the candidates are scored in one walk over their shared prefixes.
+        log_probabilities = self.sequence_log_probabilities(action_binary)
+
         current_p = float("-INF")
         ml_action = None
-        for action in action_binary:
-            
-            p = self.predict(action)
+        for action, p in zip(action_binary, log_probabilities):
             
             if p > current_p:
                 ml_action = action
                 current_p = p
         
         return ml_action
-        
-        
+    # end def
 
-    def generate_random_symbols_and_update(self, symbol_count):
+    def generate_random_actions(self, action_binary):
+        """ Returns one of the given symbol lists, chosen at random in proportion to its
+            conditional probability, considering the history.
+
+            - `action_binary`: the list of binary representations of the candidate actions.
+        """
+
+        return random_choice_by_log_probability(action_binary, self.sequence_log_probabilities(action_binary))
+    # end def
+
+    def generate_random_symbols_and_update(self, symbol_count, cache = None):
         """ Returns a specified number of random symbols distributed according to
             the context tree statistics and update the context tree with the newly
             generated symbols.
 
             - `symbol_count`: the number of symbols to generate.
+            - `cache`: a dictionary of the predicted probabilities to sample from, filled in
+                       as they are predicted, or None. (See `sample_symbols_and_update()`.)
         """
 
-        
-        
-        sample =[]
-        
-        for index in range(symbol_count):
-            
-            # The theory is same as the Discrete Probability Mass Function
-            # if we sample infinite bits at a particular history
-            # Then the lim t->inf 1s/0s = self.predict(1) / self.predict(0),
-            # as we choose the threshold from uniform distribution.
-            # Consider the following sequence, b_1 b_2 …. b_d. 
-            # The probability of having the sequence is  P = (b_1 b_2 …. b_d | history)  
-            # and we could apply chain  rule P = (b_1 b_2 …. b_d | history)  =  
-            # (b_2 …. b_d | history b_1) *  (b_1| history)
-            #= (b_1| history) * (b_2| history b_2) * ….  (b_d | history b_1… b_(d-1) )
-            
-            sample.append(1 if self.predict(1) >= random.random() else 0)
-            
-            self.update(sample[-1])
-        
-        return sample
+        # The theory is same as the Discrete Probability Mass Function
+        # if we sample infinite bits at a particular history
+        # Then the lim t->inf 1s/0s = self.predict(1) / self.predict(0),
+        # as we choose the threshold from uniform distribution.
+        # Consider the following sequence, b_1 b_2 …. b_d. 
+        # The probability of having the sequence is  P = (b_1 b_2 …. b_d | history)  
+        # and we could apply chain  rule P = (b_1 b_2 …. b_d | history)  =  
+        # (b_2 …. b_d | history b_1) *  (b_1| history)
+        #= (b_1| history) * (b_2| history b_2) * ….  (b_d | history b_1… b_(d-1) )
+        return sample_symbols_and_update(self, symbol_count, cache)
+    # end def
+
+    def memory_statistics(self):
+        """ Returns a dictionary of the size of the tree:
+
+            - `nodes`: the number of nodes.
+            - `depth_sizes`: the number of nodes at each depth, from the root down.
+            - `bytes`: an estimate of the memory taken by the nodes.
+
+            The counts are kept as nodes are created and deleted, so this takes constant time
+            apart from copying `depth_sizes`.
+        """
+
+        return {'nodes': self.tree_size, 'depth_sizes': list(self.depth_sizes),
+                'bytes': self.tree_size * self.node_bytes()}
+    # end def
+
+    def node_bytes(self):
+        """ Returns an estimate of the memory taken by one node: the node object, its attribute
+            dictionary, its children and symbol count dictionaries, and its float values.
+        """
+
+        node = CTWContextTreeNode()
+        values = [node, node.__dict__, node.children, node.symbol_count,
+                  node.log_kt, node.log_probability, node.log_folded]
+
+        return sum([sys.getsizeof(value) for value in values])
+    # end def
+
+    def node_depth(self, node):
+        """ Returns the depth of the given node.
+        """
+
+        return node.depth
+    # end def
+
+    def node_values(self, node):
+        """ Returns the symbol counts and cached log probabilities of the given node,
+            as a tuple `(zeros, ones, log_kt, log_probability)`.
+        """
+
+        return (node.symbol_count[0], node.symbol_count[1], node.log_kt, node.log_probability)
+    # end def
+
+    def percept_distribution(self, bit_count, threshold = 0.0):
+        """ Returns the conditional probability of every sequence of `bit_count` symbols,
+            considering the history, as a NumPy vector indexed by the sequence read as a binary
+            number, first symbol most significant. (This is how `util.encode()` encodes percepts.)
+
+            The sequences are enumerated depth first over the trie of their prefixes, so the
+            work for a prefix is shared by all the sequences that begin with it: each prefix
+            costs one `predict()` and, for each branch below it, one update and rollback.
+            Branches whose probability falls below the given threshold are not explored, and
+            the sequences in them are left with probability 0.
+
+            The tree is not changed, apart from padding a history shorter than the tree depth
+            with random bits, as `predict()` does.
+
+            - `bit_count`: the length of the sequences.
+            - `threshold`: the probability below which a prefix is not explored further.
+                           (Default: 0, which explores every prefix with a nonzero probability.)
+        """
+
+        assert numpy is not None, "NumPy is needed for the percept distribution."
+        assert bit_count >= 0, "The given bit count must not be negative."
+
+        distribution = numpy.zeros(1 << bit_count)
+        if bit_count == 0:
+            distribution[0] = 1.0
+        else:
+            self.percept_distribution_below(distribution, 0, bit_count, 1.0, threshold)
+        # end if
+
+        return distribution
+    # end def
+
+    def percept_distribution_below(self, distribution, prefix, bit_count, probability, threshold):
+        """ Fills in the probabilities of the sequences in the given distribution vector that
+            begin with the given prefix, which has been added to the tree.
+            (See `percept_distribution()`.)
+
+            - `distribution`: the vector to fill in.
+            - `prefix`: the prefix, as a binary number.
+            - `bit_count`: the number of symbols left to follow the prefix (at least 1).
+            - `probability`: the probability of the prefix.
+            - `threshold`: the probability below which a prefix is not explored further.
+        """
+
+        probability_of_one = self.predict(1)
+
+        for symbol, symbol_probability in ((0, 1.0 - probability_of_one), (1, probability_of_one)):
+            branch_probability = probability * symbol_probability
+            if branch_probability <= 0.0 or branch_probability < threshold:
+                continue
+            # end if
+
+            branch = (prefix << 1) | symbol
+            if bit_count == 1:
+                distribution[branch] = branch_probability
+            else:
+                token = self.checkpoint()
+                self.update(symbol)
+                self.percept_distribution_below(distribution, branch, bit_count - 1, branch_probability,
+                                                threshold)
+                self.rollback(token)
+            # end if
+        # end for
     # end def
 
     def predict(self, symbol_list):
@@ -509,6 +1174,9 @@ class CTWContextTree:
 
             - `symbol_list` The symbol (or list of symbols) to estimate the conditional probability of.
                             0 corresponds to `rho(0 | h)` and 1 to `rho(1 | h)`.
+
+            The tree is not changed, apart from padding a history shorter than the tree depth
+            with random bits.
         """
 
         
@@ -537,32 +1205,209 @@ class CTWContextTree:
             self.update([random.randint(0,1) for i in range(difference)])
         
         h  = self.root.log_probability
-        
-        #trading the storage with computation power
-        if self.trade_off:
-            
-            undo_ctw = CTWContextTree_Undo(self)
-            
-        self.update(symbol_list)
-        
-        hy = self.root.log_probability
-        
-        if self.trade_off:
-            
-            self.model_revert(undo_ctw)
-            
+
+        # The would-be root probability is computed without touching the tree.
+        if len(symbol_list) == 1:
+            hy = self.predicted_log_probability(int(symbol_list[0]))
         else:
-            
-            self.revert(len(symbol_list))
-        
+            hy = self.predicted_log_probability_of_list(symbol_list)
+
         # log a - log b = log (a/b)
         # exp**(log a - log b) = a/b
         # transfer the log back
         p = math.exp(hy - h)
-        
+
         return p
     # end def
 
+    def predicted_log_probability(self, symbol):
+        """ Returns the weighted log probability the root node would have after an update
+            with the given symbol, without changing the tree.
+
+            The context path is walked once, from the root to the deepest existing node.
+            The would-be `log_kt` and `log_probability` of every node on the path are then
+            computed from the leaf up to the root, exactly as `update()` would, except that
+            nodes missing from the tree are treated as newly created nodes.
+
+            - `symbol`: the symbol to predict, 0 or 1.
+        """
+
+        # Find the existing nodes on the context path.
+        bits = self.history.context(self.depth)
+        path = [self.root]
+        node = self.root
+        for bit in bits:
+            node = node.children.get(bit)
+            if node is None:
+                break
+            path.append(node)
+        # end for
+
+        # Nodes below the deepest existing node would be new: their KT estimate after
+        # the update is that of a single symbol, which is also their weighted probability.
+        log_probability = log_half
+
+        # Walk back up, recomputing each existing node with its updated child.
+        for index in range(len(path) - 1, -1, -1):
+            node = path[index]
+            a = node.symbol_count[0]
+            b = node.symbol_count[1]
+            log_kt = node.log_kt + math.log(((b if symbol else a) + 0.5) / (a + b + 1))
+
+            if index == self.depth:
+                # The deepest node of the tree is always a leaf.
+                log_probability = log_kt
+            else:
+                # The child on the path now has the value just computed;
+                # the other child, if any, is unchanged.
+                children = log_probability + node.log_folded
+                sibling = node.children.get(1 - bits[index])
+                if sibling is not None:
+                    children += sibling.log_probability
+
+                a, b = (log_kt, children) if log_kt > children else (children, log_kt)
+                log_probability = log_half + a + math.log(1 + math.exp(b - a))
+            # end if
+        # end for
+
+        return log_probability
+    # end def
+
+    def predicted_log_probability_of_list(self, symbol_list):
+        """ Returns the weighted log probability the root node would have after an update
+            with the given list of symbols, without changing the tree.
+
+            The would-be node values are kept in a scratch buffer keyed by node.
+            Nodes that do not exist yet are keyed by `(parent key, context bit)`.
+
+            - `symbol_list`: the list of symbols to predict.
+        """
+
+        scratch = {}
+
+        # The current context, most recent symbol first.
+        window = list(self.history.context(self.depth))
+
+        for symbol in symbol_list:
+            symbol = int(symbol)
+
+            # Walk the context path once, recording the key and real node (if any) of each level.
+            key = node = self.root
+            path = [(key, node)]
+            for bit in window:
+                child = node.children.get(bit) if node is not None else None
+                key = child if child is not None else (key, bit)
+                node = child
+                path.append((key, node))
+            # end for
+
+            # Compute the would-be values from the leaf to the root.
+            for index in range(len(path) - 1, -1, -1):
+                key, node = path[index]
+                state = scratch.get(key)
+                if state is None:
+                    if node is None:
+                        state = [0, 0, 0.0, 0.0]
+                    else:
+                        state = [node.symbol_count[0], node.symbol_count[1],
+                                 node.log_kt, node.log_probability]
+                    scratch[key] = state
+                # end if
+
+                a, b = state[0], state[1]
+                state[2] += math.log(((b if symbol else a) + 0.5) / (a + b + 1))
+                state[symbol] += 1
+
+                if index == len(path) - 1:
+                    state[3] = state[2]
+                else:
+                    children = node.log_folded if node is not None else 0.0
+                    for bit in (0, 1):
+                        child = node.children.get(bit) if node is not None else None
+                        child_key = child if child is not None else (key, bit)
+                        if child_key in scratch:
+                            children += scratch[child_key][3]
+                        elif child is not None:
+                            children += child.log_probability
+                        # end if
+                    # end for
+
+                    a, b = (state[2], children) if state[2] > children else (children, state[2])
+                    state[3] = log_half + a + math.log(1 + math.exp(b - a))
+                # end if
+            # end for
+
+            window.insert(0, symbol)
+            del window[self.depth:]
+        # end for
+
+        return scratch[self.root][3] if scratch else self.root.log_probability
+    # end def
+
+    def prune(self, target):
+        """ Evicts nodes, in the order given by `eviction_key()`, until the tree holds at most
+            the given number of nodes. Evicting a node also evicts its descendants.
+            The root is never evicted.
+
+            - `target`: the number of nodes to keep.
+        """
+
+        # List the nodes, parents before children, with the parent, context bit and depth
+        # of each node below the root.
+        order = [self.root]
+        parents = [None]
+        bits = [None]
+        depths = [0]
+        index = 0
+        while index < len(order):
+            node = order[index]
+            for bit in (0, 1):
+                child = self.child(node, bit)
+                if child is not None:
+                    order.append(child)
+                    parents.append(node)
+                    bits.append(bit)
+                    depths.append(depths[index] + 1)
+                # end if
+            # end for
+            index += 1
+        # end while
+
+        # Evict in order of eviction key, deeper nodes first among equals.
+        candidates = sorted(xrange(1, len(order)),
+                            key = lambda position: (self.eviction_key(order[position]), -depths[position]))
+        evicted = set()
+        for position in candidates:
+            if self.tree_size <= target:
+                break
+            # end if
+            if order[position] not in evicted:
+                evicted.update(self.remove_child(parents[position], bits[position]))
+            # end if
+        # end for
+    # end def
+
+    def remove_child(self, node, bit):
+        """ Removes the child of the given node reached by the given context bit, along with
+            its descendants, folds its weighted probability into the node, and returns the
+            removed nodes.
+        """
+
+        removed = []
+        stack = [node.children.pop(bit)]
+        node.log_folded += stack[0].log_probability
+        while stack:
+            child = stack.pop()
+            removed.append(child)
+            self.depth_sizes[child.depth] -= 1
+            stack.extend(child.children.values())
+        # end while
+
+        self.tree_size -= len(removed)
+
+        return removed
+    # end def
+
     def revert(self, symbol_count = 1):
         """ Restores the context tree to its state prior to a specified number of updates.
      
@@ -571,6 +1416,12 @@ class CTWContextTree:
         
         
         assert len(self.history) >= symbol_count, "Cannot revert, symbol_count bigger than the length of history"
+
+        # A frozen tree was only updated in its history.
+        if self.frozen:
+            self.revert_history(symbol_count)
+            return None
+        # end if
         
         difference = len(self.history) - symbol_count
         
@@ -581,9 +1432,10 @@ class CTWContextTree:
         # If we revert it, we will result in a invalid log probability which bigger than 0
         # then the convergency speed will be influenced. 
         if difference < self.depth :
-            history = deepcopy(list(self.history)[:difference+1])
+            history = self.history
+            history.truncate(difference + 1)
             self.clear()
-            self.history += history
+            self.history = history
             
             return None
         
@@ -597,7 +1449,10 @@ class CTWContextTree:
             self.update_context()
             
             for node in reversed(self.context):
-                
+
+                if self.journal is not None:
+                    self.journal_node(node)
+
                 node.revert(bit)
                 
     # end def
@@ -611,7 +1466,153 @@ class CTWContextTree:
         assert history_length >= symbol_count, "The given symbol count must be greater than the history length."
 
         new_size = history_length - symbol_count
-        self.history = deque(list(self.history)[:new_size],self.size_of_history)
+        self.history.truncate(new_size)
+    # end def
+
+    def rollback(self, token):
+        """ Restores the tree and its history to their state at the given checkpoint,
+            and discards the checkpoint along with any newer ones.
+
+            The cost is proportional to the number of changes recorded since the checkpoint,
+            rather than to the number of symbols times the tree depth, as for `revert()`.
+
+            - `token`: a token returned by `checkpoint()`.
+        """
+
+        assert 0 <= token < len(self.checkpoints), "The given checkpoint is not active."
+
+        journal_position, history_position = self.checkpoints[token]
+
+        # Undo the changes, newest first, so that the oldest recorded values are the ones kept.
+        journal = self.journal
+        while len(journal) > journal_position:
+            self.undo(journal.pop())
+        # end while
+
+        self.history.rollback(history_position)
+
+        # Some of the recorded nodes may have lost their journal entries.
+        self.journaled_nodes = set()
+
+        self.commit(token)
+    # end def
+
+    def save(self, filename):
+        """ Saves the tree to a file, which `load()` can read back into either implementation.
+
+            The file holds a header, the number of nodes at each depth, the node arrays listed
+            in `file_arrays`, and the most recent `depth` symbols of the history, which are all
+            the history the tree needs to carry on predicting and updating. (See `file_header`.)
+
+            Nodes are saved breadth first, so a tree that has deleted nodes is saved compactly.
+            The tree must not have an active checkpoint.
+
+            - `filename`: the name of the file to write.
+        """
+
+        assert self.journal is None, "Cannot save the tree while a checkpoint is active."
+
+        arrays = dict((name, array(typecode)) for name, typecode in file_arrays)
+
+        # Number the nodes breadth first, so that a node's children follow it.
+        order = [self.root]
+        index = 0
+        while index < len(order):
+            node = order[index]
+            zeros, ones, log_kt, log_probability = self.node_values(node)
+            arrays['count0'].append(zeros)
+            arrays['count1'].append(ones)
+            arrays['log_kt'].append(log_kt)
+            arrays['log_probability'].append(log_probability)
+            arrays['log_folded'].append(self.folded_log_probability(node))
+            arrays['node_depths'].append(self.node_depth(node))
+            for bit in (0, 1):
+                child = self.child(node, bit)
+                if child is None:
+                    arrays['child%d' % bit].append(-1)
+                else:
+                    arrays['child%d' % bit].append(len(order))
+                    order.append(child)
+                # end if
+            # end for
+            index += 1
+        # end while
+
+        history = self.history.context(self.depth)[::-1]
+        flags = (file_frozen if self.frozen else 0) | \
+                (file_little_endian if sys.byteorder == 'little' else 0)
+
+        with open(filename, 'wb') as tree_file:
+            tree_file.write(file_header.pack(file_magic, file_version, flags,
+                                             pruning_policies.index(self.pruning), self.depth,
+                                             len(history), len(order), self.max_nodes,
+                                             self.size_of_history))
+            tree_file.write(array('Q', self.depth_sizes).tobytes())
+            for name, typecode in file_arrays:
+                tree_file.write(arrays[name].tobytes())
+            # end for
+            tree_file.write(history)
+        # end with
+    # end def
+
+    def sequence_log_probabilities(self, symbol_lists):
+        """ Returns the log conditional probabilities of the given symbol lists, considering the
+            history, as a list in the same order.
+
+            The symbol lists are arranged into a trie, which is walked depth first: each prefix
+            is added to the tree once, with an update and a rollback, however many of the lists
+            share it, and each symbol below it is scored without changing the tree.
+
+            The tree is not changed, apart from padding a history shorter than the tree depth
+            with random bits, as `predict()` does.
+
+            - `symbol_lists`: the symbol lists (or strings of '0' and '1') to score.
+        """
+
+        difference = self.depth - len(self.history)
+        if difference > 0:
+            self.update([random.randint(0, 1) for i in xrange(difference)])
+        # end if
+
+        log_probabilities = [0.0] * len(symbol_lists)
+        self.sequence_log_probabilities_below(sequence_trie(symbol_lists), 0.0, log_probabilities)
+
+        return log_probabilities
+    # end def
+
+    def sequence_log_probabilities_below(self, trie, log_probability, log_probabilities):
+        """ Fills in the log probabilities of the symbol lists in the given trie, whose prefix
+            has been added to the tree. (See `sequence_log_probabilities()`.)
+
+            - `trie`: the trie below the prefix (see `sequence_trie()`).
+            - `log_probability`: the log probability of the prefix.
+            - `log_probabilities`: the list to fill in.
+        """
+
+        for index in trie.get(None, ()):
+            log_probabilities[index] = log_probability
+        # end for
+
+        root = self.node_values(self.root)[3]
+        for symbol in (0, 1):
+            branch = trie.get(symbol)
+            if branch is None:
+                continue
+            # end if
+
+            branch_log_probability = log_probability + self.predicted_log_probability(symbol) - root
+            if len(branch) == 1 and None in branch:
+                # Only lists that end here: no need to add the symbol.
+                for index in branch[None]:
+                    log_probabilities[index] = branch_log_probability
+                # end for
+            else:
+                token = self.checkpoint()
+                self.update(symbol)
+                self.sequence_log_probabilities_below(branch, branch_log_probability, log_probabilities)
+                self.rollback(token)
+            # end if
+        # end for
     # end def
 
     def size(self):
@@ -622,6 +1623,26 @@ class CTWContextTree:
         return self.tree_size
     # end def
 
+    def undo(self, entry):
+        """ Undoes the change recorded in the given journal entry.
+        """
+
+        if len(entry) == 5:
+            # The previous values of a node.
+            node, node.symbol_count[0], node.symbol_count[1], node.log_kt, node.log_probability = entry
+        elif entry[0] == 'link':
+            # A created node: remove it.
+            self.count_nodes(entry[1].children.pop(entry[2]), -1)
+        elif entry[0] == 'unlink':
+            # A removed node: put it back.
+            entry[1].children[entry[2]] = entry[3]
+            self.count_nodes(entry[3], 1)
+        else:
+            # A cleared tree: restore the previous root and history.
+            self.__dict__.update(entry[1])
+        # end if
+    # end def
+
     def update(self, symbol_list):
         """ Updates the context tree with a new (binary) symbol, or a list of symbols.
             Recalculates the log weighted probabilities and log KT estimates for each affected node.
@@ -640,6 +1661,12 @@ class CTWContextTree:
         else:
             
             symbol_list = list(symbol_list)
+
+        # A frozen tree no longer learns.
+        if self.frozen:
+            self.update_history([int(bit) for bit in symbol_list])
+            return None
+        # end if
         
         for bit in symbol_list:
             
@@ -656,12 +1683,22 @@ class CTWContextTree:
                 continue
             
             self.update_context()
+
+            if self.track_visits:
+                self.clock += 1
+                for node in self.context:
+                    node.visited = self.clock
+                # end for
+            # end if
             
             # update the tree in reversed order,
             # because of the dependency relationship.
             
             for node in reversed(self.context):
-                
+
+                if self.journal is not None:
+                    self.journal_node(node)
+
                 node.update(bit)
                 
             self.update_history(bit)
@@ -695,14 +1732,21 @@ class CTWContextTree:
         context = [self.root]
         last_node = self.root
         
-        for bit in reversed(list(self.history)[-self.depth:]):
+        for bit in self.history.context(self.depth):
             
             # if value is 1, go left branch, otherwise right branch
             index = 1 if bit else 0
             
             if index not in context[-1].children:
                 
-                last_node.children[index] = CTWContextTreeNode(self)
+                last_node.children[index] = CTWContextTreeNode(self, len(context))
+                self.tree_size += 1
+                self.depth_sizes[len(context)] += 1
+
+                # A new node needs no recorded values: undoing its creation removes it.
+                if self.journal is not None:
+                    self.journal.append(('link', last_node, index))
+                    self.journaled_nodes.add(last_node.children[index])
                 
                 #update last node in the context list, as we create new child.
                 context[-1] = last_node
@@ -716,6 +1760,14 @@ class CTWContextTree:
         
     # end def
 
+    def update_log_probability(self, node):
+        """ Recalculates the weighted log probability of the given node.
+            See `CTWContextTreeNode.update_log_probability`.
+        """
+
+        node.update_log_probability()
+    # end def
+
     def update_history(self, symbol_list):
         """ Appends a symbol (or a list of symbols) to the tree's history without updating the tree.
 
@@ -724,9 +1776,9 @@ class CTWContextTree:
 
         # Ensure that we have a list, by making this a list if it's a single symbol.
         if type(symbol_list) != list:
-            symbol_list = [symbol_list]
+            self.history.append(symbol_list)
+        else:
+            self.history.extend(symbol_list)
         # end if
-
-        self.history += symbol_list
     # end def
 # end class
\ No newline at end of file
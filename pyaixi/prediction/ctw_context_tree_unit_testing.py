@@ -6,11 +6,15 @@ Created on Sat Sep 21 15:18:40 2019
 @author: Yan
 """
 
-from ctw_context_tree import CTWContextTree, CTWContextTreeNode
+from ctw_context_tree import BitHistory, CTWContextTree, CTWContextTreeNode
+from ctw_array_context_tree import CTWArrayContextTree
+from ctw_overlay_context_tree import CTWOverlayContextTree
 import unittest
 import random
 from collections import Counter
 import math
+import os
+import tempfile
 from copy import deepcopy
 
 #calculate log kt estimater.
@@ -156,6 +160,40 @@ def count_context(past,sequence,context,a):
     
     
 
+#the history, size and the values of every node, for either context tree backend.
+def tree_signature(tree):
+    if isinstance(tree,CTWArrayContextTree):
+        def node_signature(node):
+            children = {}
+            for bit, child in enumerate([tree.child0[node], tree.child1[node]]):
+                if child != -1:
+                    children[bit] = node_signature(child)
+            return (tree.count0[node], tree.count1[node], round(tree.log_kt[node],8),
+                    round(tree.log_probability[node],8), children)
+    else:
+        def node_signature(node):
+            return (node.symbol_count[0], node.symbol_count[1], round(node.log_kt,8),
+                    round(node.log_probability,8),
+                    dict((bit, node_signature(child)) for bit, child in node.children.items()))
+    return (list(tree.history), tree.size(), node_signature(tree.root))
+
+#the log probability of the root, for either context tree backend.
+def root_log_probability(tree):
+    if isinstance(tree,CTWArrayContextTree):
+        return tree.log_probability[tree.root]
+    return tree.root.log_probability
+
+#count the nodes reachable from the root of a context tree, at each depth.
+def tree_depth_sizes(tree):
+    depth_sizes = [0] * (tree.depth + 1)
+    stack = [(tree.root, 0)]
+    while stack:
+        node, depth = stack.pop()
+        depth_sizes[depth] += 1
+        stack.extend((child, depth + 1) for child in (tree.child(node,0), tree.child(node,1)) if child is not None)
+    return depth_sizes
+
+
 class TestCTWContextTree(unittest.TestCase):
     
     #test functionality of updating
@@ -178,6 +216,20 @@ class TestCTWContextTree(unittest.TestCase):
         p = tree.predict("0100110")  
         self.assertAlmostEqual(7/2048,p,8,"prediction wrong")
         
+    #prediction should agree with an update/revert round trip, and leave the tree untouched.
+    def test_predict_read_only(self):
+        for tree in [CTWContextTree(4), CTWArrayContextTree(4)]:
+            tree.update(random_Binarystring() + "0110")
+            for symbols in [[0],[1],[1,0,1],[0,0,1,1,0,1,1]]:
+                root = root_log_probability(tree)
+                history = list(tree.history)
+                p = tree.predict(symbols)
+                self.assertEqual(history,list(tree.history),"history changed")
+                tree.update(symbols)
+                new_root = root_log_probability(tree)
+                tree.revert(len(symbols))
+                self.assertAlmostEqual(math.exp(new_root - root),p,8,"prediction wrong")
+
     def test_generate_random_action(self):
         tree = CTWContextTree(3)
         tree.update("110")
@@ -192,18 +244,282 @@ class TestCTWContextTree(unittest.TestCase):
         
         assert t, "invalid random actions"
         
+    #sampling through a cache should sample as the tree does, and later samples from
+    #the same state should take their probabilities from the cache.
+    def test_cached_random_symbols(self):
+        random.seed(2)
+        history = "1101" + random_Binarystring()
+        base = CTWContextTree(3)
+        base.update(history)
+        def array_tree():
+            tree = CTWArrayContextTree(3)
+            tree.update(history)
+            return tree
+        for make_tree in [lambda: deepcopy(base), array_tree, lambda: CTWOverlayContextTree(base)]:
+            cache = {}
+            samples = []
+            for cached in [None, cache, cache]:
+                tree = make_tree()
+                random.seed(3)
+                samples.append((tree.generate_random_symbols_and_update(6, cached), round(tree.predict([1,0,1]),10)))
+            self.assertEqual(samples[0],samples[1],"cached sample differs")
+            self.assertEqual(samples[0],samples[2],"sample from a filled cache differs")
+            self.assertEqual(6,len(cache),"incorrect cache entries")
+            #a cache that gives every symbol after ones a probability of 1.
+            ones = dict(((2 << length) - 1, 1.0) for length in range(6))
+            self.assertEqual([1]*6,make_tree().generate_random_symbols_and_update(6, ones),"cache not used")
+
     #test functionality of revert state. By replacing the tree to previous state
     #instead of revert bit by bit.        
     def test_model_revert(self):
-        tree = CTWContextTree(3)
-        tree.set_tade_off(True)
+        for tree in [CTWContextTree(3), CTWArrayContextTree(3)]:
+            tree.update("110")
+            tree.update(random_Binarystring())
+            past_ctw = tree_signature(tree)
+            token = tree.checkpoint()
+            tree.update("0100110")
+            tree.generate_random_symbols_and_update(12)
+            tree.revert(5)
+            tree.update_history([1,0,1])
+            tree.revert_history(2)
+            tree.rollback(token)
+
+            self.assertEqual(past_ctw,tree_signature(tree),"invalid reverting")
+            self.assertEqual(None,tree.journal,"journal not stopped")
+
+    #nested checkpoints, and reverting back into the first depth bits of history.
+    def test_nested_rollback(self):
+        for tree in [CTWContextTree(6), CTWArrayContextTree(6)]:
+            tree.update("10011")
+            outer_ctw = tree_signature(tree)
+            outer = tree.checkpoint()
+            tree.update("1101001")
+            inner_ctw = tree_signature(tree)
+            inner = tree.checkpoint()
+            tree.update("0011")
+            tree.revert(9)
+            tree.rollback(inner)
+            self.assertEqual(inner_ctw,tree_signature(tree),"invalid inner reverting")
+            tree.update("01")
+            tree.rollback(outer)
+            self.assertEqual(outer_ctw,tree_signature(tree),"invalid outer reverting")
+
+    #the size counters should follow every way nodes are created and deleted.
+    def test_memory_statistics(self):
+        for backend in [CTWContextTree, CTWArrayContextTree]:
+            tree = backend(6, max_nodes = 60)
+            for epoch in range(10):
+                tree.update(random_Binarystring())
+                token = tree.checkpoint()
+                tree.update("0110100")
+                tree.revert(3)
+                tree.rollback(token)
+                tree.update("1101")
+                tree.revert(2)
+                tree.enforce_node_budget()
+                statistics = tree.memory_statistics()
+                self.assertEqual(tree_depth_sizes(tree),statistics['depth_sizes'],"incorrect depth sizes")
+                self.assertEqual(tree.size(),statistics['nodes'],"incorrect size")
+                self.assertTrue(statistics['bytes'] > 0,"no bytes estimated")
+
+    #a saved tree should load into either implementation and carry on as the original.
+    def test_save_load(self):
+        handle, filename = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            for backend in [CTWContextTree, CTWArrayContextTree]:
+                tree = backend(6, max_nodes = 80, pruning = 'low-count')
+                for epoch in range(5):
+                    tree.update(random_Binarystring())
+                    tree.enforce_node_budget()
+                tree.save(filename)
+                for loader in [CTWContextTree, CTWArrayContextTree]:
+                    loaded = loader.load(filename)
+                    self.assertEqual(tree.memory_statistics()['depth_sizes'],
+                                     loaded.memory_statistics()['depth_sizes'],"incorrect depth sizes")
+                    self.assertEqual(list(tree.history.context(6)),list(loaded.history.context(6)),"incorrect history")
+                    self.assertAlmostEqual(tree.predict("0110"),loaded.predict("0110"),8,"prediction wrong")
+                    loaded.update("0110100")
+                    loaded.revert(7)
+                    self.assertAlmostEqual(root_log_probability(tree),root_log_probability(loaded),8,"incorrect revert")
+                    random_string = random_Binarystring()
+                    loaded.update(random_string)
+                    copy = backend.load(filename)
+                    copy.update(random_string)
+                    self.assertAlmostEqual(root_log_probability(copy),root_log_probability(loaded),8,"incorrect update")
+                    self.assertEqual(tree_depth_sizes(loaded),loaded.memory_statistics()['depth_sizes'],"incorrect depth sizes")
+        finally:
+            os.remove(filename)
+
+    #batch scoring should agree with predicting each sequence, and leave the tree untouched.
+    def test_sequence_log_probabilities(self):
+        candidates = [[0,1,1,1],[0,1,0,1],[1],[0,1],[1,1,0,0,1],[0,1,0,1]]
+        for tree in [CTWContextTree(4), CTWArrayContextTree(4)]:
+            tree.update(random_Binarystring() + "0110")
+            past_ctw = tree_signature(tree)
+            for scorer in [tree, CTWOverlayContextTree(tree)]:
+                log_probabilities = scorer.sequence_log_probabilities(candidates)
+                self.assertEqual(past_ctw,tree_signature(tree),"tree changed")
+                for symbols, log_probability in zip(candidates, log_probabilities):
+                    self.assertAlmostEqual(math.log(tree.predict(symbols)),log_probability,8,"prediction wrong")
+                self.assertTrue(scorer.generate_random_actions(candidates) in candidates,"invalid random action")
+
+    #the distribution should agree with predicting each sequence, and leave the tree untouched.
+    def test_percept_distribution(self):
+        for tree in [CTWContextTree(4), CTWArrayContextTree(4)]:
+            tree.update(random_Binarystring() + "0110")
+            past_ctw = tree_signature(tree)
+            distribution = tree.percept_distribution(3)
+            self.assertEqual(past_ctw,tree_signature(tree),"tree changed")
+            self.assertAlmostEqual(1.0,distribution.sum(),8,"distribution does not sum to 1")
+            for index in range(8):
+                symbols = [(index >> shift) & 1 for shift in (2,1,0)]
+                self.assertAlmostEqual(tree.predict(symbols),distribution[index],8,"prediction wrong")
+
+            pruned = tree.percept_distribution(3, 0.2)
+            for index in range(8):
+                if pruned[index] > 0:
+                    self.assertAlmostEqual(distribution[index],pruned[index],8,"prediction wrong")
+                else:
+                    self.assertTrue(distribution[index] < 0.2,"branch pruned wrongly")
+
+    #a tree with a node budget should stay within it and still predict a distribution.
+    def test_node_budget(self):
+        for backend in [CTWContextTree, CTWArrayContextTree]:
+            for pruning in ['lru', 'low-count']:
+                tree = backend(8, max_nodes = 40, pruning = pruning)
+                for epoch in range(20):
+                    tree.update(random_Binarystring())
+                    tree.enforce_node_budget()
+                    self.assertTrue(tree.size() <= 40,"budget exceeded")
+                    self.assertEqual(sum(tree_depth_sizes(tree)),tree.size(),"incorrect size")
+                    self.assertAlmostEqual(1.0,tree.predict("0")+tree.predict("1"),8,"prediction wrong")
+                    self.assertAlmostEqual(tree.predict("0110"),CTWOverlayContextTree(tree).predict("0110"),8,"incorrect overlay")
+                    log_probability = root_log_probability(tree)
+                    tree.update("0110")
+                    tree.revert(4)
+                    self.assertAlmostEqual(log_probability,root_log_probability(tree),8,"incorrect revert")
+
+            tree = backend(8, max_nodes = 40, pruning = 'freeze')
+            while tree.enforce_node_budget() == 0 and not tree.frozen:
+                tree.update(random_Binarystring())
+            past_ctw = tree_signature(tree)[1:]
+            tree.update(random_Binarystring())
+            self.assertEqual(past_ctw,tree_signature(tree)[1:],"frozen tree changed")
+            self.assertAlmostEqual(1.0,tree.predict("0")+tree.predict("1"),8,"prediction wrong")
+
+
+
+class TestBitHistory(unittest.TestCase):
+
+    #the history should behave as a bounded deque.
+    def test_append_pop_truncate(self):
+        history = BitHistory(2000)
+        bits = [int(bit) for bit in random_Binarystring() * 200][:1500]
+        history += bits
+        self.assertEqual(bits,list(history),"incorrect append")
+        self.assertEqual(bits[-1],history.pop(),"incorrect pop")
+        history.truncate(700)
+        self.assertEqual(bits[:700],list(history),"incorrect truncate")
+        self.assertEqual(list(reversed(bits[690:700])),list(history.context(10)),"incorrect context")
+
+    #the oldest symbols are dropped once the history is full.
+    def test_maxlen(self):
+        history = BitHistory(5, [0,0,0,1,1])
+        history += [0,1]
+        self.assertEqual([0,1,1,0,1],list(history),"oldest symbols not dropped")
+        self.assertEqual([1,0,1],list(history.context(3)),"incorrect context")
+
+
+class TestCTWArrayContextTree(unittest.TestCase):
+
+    #the array backend should give the same probabilities as the node objects.
+    def test_same_as_object_tree(self):
+        tree = CTWContextTree(5)
+        array_tree = CTWArrayContextTree(5)
+        for epoch in range(5):
+            random_string = random_Binarystring()
+            tree.update(random_string)
+            array_tree.update(random_string)
+            self.assertAlmostEqual(tree.root.log_probability,
+                                   array_tree.log_probability[array_tree.root],8,"incorrect update")
+            self.assertAlmostEqual(tree.predict("0110"),array_tree.predict("0110"),8,"incorrect prediction")
+
+    def test_predict(self):
+        tree = CTWArrayContextTree(3)
         tree.update("110")
-        past_ctw =deepcopy(tree)
-        p = tree.predict("0100110")  
-        
-        assert check_fieldvalue(past_ctw,tree), "invalid reverting"
-        
-        
+        p = tree.predict("0100110")
+        self.assertAlmostEqual(7/2048,p,8,"prediction wrong")
+
+    #reverting should release the nodes created by the update.
+    def test_update_revert_size(self):
+        tree = CTWArrayContextTree(4)
+        tree.update("0110")
+        tree.update("1011")
+        size = tree.size()
+        log_probability = tree.log_probability[tree.root]
+        tree.update("0001110")
+        tree.revert(7)
+        self.assertEqual(size,tree.size(),"nodes not released")
+        self.assertAlmostEqual(log_probability,tree.log_probability[tree.root],8,"incorrect revert")
+
+
+class TestCTWOverlayContextTree(unittest.TestCase):
+
+    #an overlay should see the same probabilities as updating the tree itself,
+    #without changing the tree.
+    def test_same_as_update(self):
+        for tree in [CTWContextTree(5), CTWArrayContextTree(5)]:
+            tree.update(random_Binarystring() + "01101")
+            past_ctw = tree_signature(tree)
+            overlay = CTWOverlayContextTree(tree)
+            overlay.update("0110")
+            overlay_root = overlay.node_values(overlay.root)[3]
+            nested = CTWOverlayContextTree(overlay)
+            random_string = random_Binarystring()
+            nested.update(random_string)
+            nested_root = nested.node_values(nested.root)[3]
+            nested_history = list(nested.history)
+            nested_p = nested.predict("1101")
+            self.assertEqual(past_ctw,tree_signature(tree),"tree changed")
+
+            tree.update("0110")
+            self.assertAlmostEqual(root_log_probability(tree),overlay_root,8,"incorrect update")
+            tree.update(random_string)
+            self.assertAlmostEqual(root_log_probability(tree),nested_root,8,"incorrect nested update")
+            self.assertAlmostEqual(tree.predict("1101"),nested_p,8,"incorrect prediction")
+            self.assertEqual(list(tree.history),nested_history,"incorrect history")
+
+    def test_predict(self):
+        tree = CTWArrayContextTree(3)
+        tree.update("110")
+        p = CTWOverlayContextTree(tree).predict("0100110")
+        self.assertAlmostEqual(7/2048,p,8,"prediction wrong")
+
+    #simulating on an overlay of a frozen tree should match simulating on the tree
+    #itself under a journal: both only record the history.
+    def test_frozen_same_as_journal(self):
+        for backend in [CTWContextTree, CTWArrayContextTree]:
+            tree = backend(8, max_nodes = 40, pruning = 'freeze')
+            while tree.enforce_node_budget() == 0 and not tree.frozen:
+                tree.update(random_Binarystring())
+            past_ctw = tree_signature(tree)
+            random_string = random_Binarystring()
+
+            overlay = CTWOverlayContextTree(CTWOverlayContextTree(tree))
+            overlay.update(random_string)
+            overlay_p = overlay.predict("0110")
+            #the overlay reads older symbols from the tree, so keep its history before the tree changes.
+            overlay_history = overlay.history.context(8)
+            self.assertEqual(len(overlay.nodes),0,"frozen overlay learned")
+
+            token = tree.checkpoint()
+            tree.update(random_string)
+            self.assertAlmostEqual(tree.predict("0110"),overlay_p,8,"incorrect prediction")
+            self.assertEqual(tree.history.context(8),overlay_history,"incorrect history")
+            tree.rollback(token)
+            self.assertEqual(past_ctw,tree_signature(tree),"invalid reverting")
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
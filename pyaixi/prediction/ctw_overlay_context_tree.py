@@ -0,0 +1,515 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Defines a copy-on-write view of a context tree, used to run simulations without changing the tree.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import math
+import random
+
+# Ensure xrange is defined on Python 3.
+from six.moves import xrange
+
+from pyaixi.prediction.ctw_context_tree import log_half, random_choice_by_log_probability, \
+                                               sample_symbols_and_update, sequence_trie
+
+
+class BitHistoryOverlay:
+    """ A history that reads through to a base history, and keeps the symbols appended
+        to it in a local list.
+
+        The base history is never changed.
+    """
+
+    def __init__(self, base):
+        """ Create an empty overlay of the given base history.
+
+            - `base`: a `BitHistory`, or another `BitHistoryOverlay`.
+        """
+
+        self.base = base
+        self.maxlen = base.maxlen
+
+        # The symbols appended to this overlay, oldest first.
+        self.symbols = []
+    # end def
+
+    def __iter__(self):
+        """ Iterates over the symbols from the oldest to the most recent.
+        """
+
+        for symbol in self.base:
+            yield symbol
+        # end for
+        for symbol in self.symbols:
+            yield symbol
+        # end for
+    # end def
+
+    def __len__(self):
+        return min(len(self.base) + len(self.symbols), self.maxlen)
+    # end def
+
+    def __repr__(self):
+        return "BitHistoryOverlay(%s)" % str(list(self))
+    # end def
+
+    def append(self, symbol):
+        """ Appends a symbol.
+        """
+
+        self.symbols.append(symbol)
+    # end def
+
+    def context(self, depth):
+        """ Returns the most recent `depth` symbols (or all of them, if there are fewer),
+            ordered from the most recent to the oldest.
+        """
+
+        local = self.symbols[-depth:] if depth > 0 else []
+        local = bytes(bytearray(reversed(local)))
+        if len(local) < depth:
+            local += self.base.context(depth - len(local))
+        # end if
+
+        return local
+    # end def
+
+    def extend(self, symbol_list):
+        """ Appends each of the given symbols in turn.
+        """
+
+        self.symbols.extend(symbol_list)
+    # end def
+# end class
+
+
+class CTWOverlayContextTree:
+    """ A copy-on-write view of a context tree, for running simulations.
+
+        The overlay reads through to a base tree (a `CTWContextTree`, a `CTWArrayContextTree`,
+        or another overlay), but never changes it. Instead, the first time a simulation
+        updates a node, the node's values are copied into the local `nodes` map, and all
+        later reads and updates of that node use the copy. Nodes that do not exist in the
+        base tree are created only in the overlay. Likewise, new symbols are appended to a
+        `BitHistoryOverlay` of the base history.
+
+        Once the simulation is over, the overlay is simply thrown away, so undoing the
+        simulation costs nothing. Since the base tree is only read, any number of overlays
+        can share it.
+
+        The overlay offers the part of the `CTWContextTree` interface an agent uses while
+        simulating: `predict()`, `sequence_log_probabilities()`, `update()`, `update_history()`,
+        `generate_random_actions()`, `generate_random_symbols()` and
+        `generate_random_symbols_and_update()`.
+        It cannot be reverted or cleared.
+
+        Nodes are identified by the keys of the base tree: node objects for `CTWContextTree`,
+        node ids for `CTWArrayContextTree`. Nodes created by the overlay get new keys.
+    """
+
+    def __init__(self, base):
+        """ Create an overlay of the given base tree, with no changes yet.
+
+            - `base`: the context tree to read through to.
+        """
+
+        self.base = base
+
+        # The maximum depth of the context tree.
+        self.depth = base.depth
+
+        # The key of the root node.
+        self.root = base.root
+
+        # Whether the base tree has been frozen by the 'freeze' pruning policy, in which case
+        # the overlay, like the tree, only records history.
+        self.frozen = base.frozen
+
+        # The history, with the symbols added by this overlay.
+        self.history = BitHistoryOverlay(base.history)
+
+        # The values of the nodes changed by this overlay, as lists of
+        # `[zeros, ones, log_kt, log_probability]`, keyed by node.
+        self.nodes = {}
+
+        # The nodes created by this overlay, keyed by `(parent, context bit)`.
+        self.links = {}
+
+        # The keys of the nodes created by this overlay.
+        self.created = set()
+
+        # The keys of the nodes that correspond to the current context, from root to leaf.
+        self.context = []
+    # end def
+
+    def child(self, node, bit):
+        """ Returns the key of the child of the given node reached by the given context bit,
+            or None if there is no such child.
+        """
+
+        child = self.links.get((node, bit))
+        if child is None and node not in self.created:
+            child = self.base.child(node, bit)
+        # end if
+
+        return child
+    # end def
+
+    def folded_log_probability(self, node):
+        """ Returns the summed weighted log probabilities of the children evicted from the
+            given node. Nodes created by the overlay have had none evicted.
+        """
+
+        if node in self.created:
+            return 0.0
+        # end if
+
+        return self.base.folded_log_probability(node)
+    # end def
+
+    def generate_random_actions(self, action_binary):
+        """ Returns one of the given symbol lists, chosen at random in proportion to its
+            conditional probability. See `CTWContextTree.generate_random_actions`.
+        """
+
+        return random_choice_by_log_probability(action_binary, self.sequence_log_probabilities(action_binary))
+    # end def
+
+    def generate_random_symbols(self, symbol_count):
+        """ Returns a symbol string of a specified length by sampling from the context tree.
+            The symbols are sampled in a further overlay, which is then thrown away.
+
+            - `symbol_count`: the number of symbols to generate.
+        """
+
+        return CTWOverlayContextTree(self).generate_random_symbols_and_update(symbol_count)
+    # end def
+
+    def generate_random_symbols_and_update(self, symbol_count, cache = None):
+        """ Returns a specified number of random symbols distributed according to
+            the context tree statistics and update the context tree with the newly
+            generated symbols. See `CTWContextTree.generate_random_symbols_and_update`.
+
+            - `symbol_count`: the number of symbols to generate.
+            - `cache`: a dictionary of the predicted probabilities to sample from, or None.
+        """
+
+        return sample_symbols_and_update(self, symbol_count, cache)
+    # end def
+
+    def node_values(self, node):
+        """ Returns the symbol counts and cached log probabilities of the given node,
+            as a tuple `(zeros, ones, log_kt, log_probability)`.
+        """
+
+        values = self.nodes.get(node)
+        if values is None:
+            return self.base.node_values(node)
+        # end if
+
+        return tuple(values)
+    # end def
+
+    def predict(self, symbol_list):
+        """ Returns the conditional probability of a symbol (or a list of symbols), considering the history.
+            See `CTWContextTree.predict`.
+
+            A history shorter than the tree depth is padded with random bits in the overlay only.
+        """
+
+        if isinstance(symbol_list, int):
+            symbol_list = [symbol_list]
+        else:
+            symbol_list = list(symbol_list)
+        # end if
+
+        difference = self.depth - len(self.history)
+        if difference > 0:
+            self.update([random.randint(0, 1) for i in xrange(difference)])
+        # end if
+
+        h = self.node_values(self.root)[3]
+        if len(symbol_list) == 1:
+            hy = self.predicted_log_probability(int(symbol_list[0]))
+        else:
+            hy = self.predicted_log_probability_of_list(symbol_list)
+        # end if
+
+        return math.exp(hy - h)
+    # end def
+
+    def predicted_log_probability(self, symbol):
+        """ Returns the weighted log probability the root node would have after an update
+            with the given symbol, without changing the overlay.
+            See `CTWContextTree.predicted_log_probability`.
+        """
+
+        # Find the existing nodes on the context path.
+        bits = self.history.context(self.depth)
+        path = [self.root]
+        node = self.root
+        for bit in bits:
+            node = self.child(node, bit)
+            if node is None:
+                break
+            # end if
+            path.append(node)
+        # end for
+
+        # Nodes below the deepest existing node would be new, with probability 1/2.
+        log_probability = log_half
+
+        # Walk back up, recomputing each existing node with its updated child.
+        for index in xrange(len(path) - 1, -1, -1):
+            a, b, log_kt, _ = self.node_values(path[index])
+            log_kt += math.log(((b if symbol else a) + 0.5) / (a + b + 1))
+
+            if index == self.depth:
+                log_probability = log_kt
+            else:
+                children = log_probability + self.folded_log_probability(path[index])
+                sibling = self.child(path[index], 1 - bits[index])
+                if sibling is not None:
+                    children += self.node_values(sibling)[3]
+                # end if
+
+                a, b = (log_kt, children) if log_kt > children else (children, log_kt)
+                log_probability = log_half + a + math.log(1 + math.exp(b - a))
+            # end if
+        # end for
+
+        return log_probability
+    # end def
+
+    def predicted_log_probability_of_list(self, symbol_list):
+        """ Returns the weighted log probability the root node would have after an update
+            with the given list of symbols, without changing the overlay.
+            See `CTWContextTree.predicted_log_probability_of_list`.
+        """
+
+        scratch = {}
+
+        # The current context, most recent symbol first.
+        window = list(self.history.context(self.depth))
+
+        for symbol in symbol_list:
+            symbol = int(symbol)
+
+            # Walk the context path once. Missing nodes are keyed by (parent key, context bit).
+            key = node = self.root
+            path = [(key, node)]
+            for bit in window:
+                child = self.child(node, bit) if node is not None else None
+                key = child if child is not None else (key, bit)
+                node = child
+                path.append((key, node))
+            # end for
+
+            # Compute the would-be values from the leaf to the root.
+            for index in xrange(len(path) - 1, -1, -1):
+                key, node = path[index]
+                state = scratch.get(key)
+                if state is None:
+                    if node is None:
+                        state = [0, 0, 0.0, 0.0]
+                    else:
+                        state = list(self.node_values(node))
+                    # end if
+                    scratch[key] = state
+                # end if
+
+                a, b = state[0], state[1]
+                state[2] += math.log(((b if symbol else a) + 0.5) / (a + b + 1))
+                state[symbol] += 1
+
+                if index == len(path) - 1:
+                    state[3] = state[2]
+                else:
+                    children = self.folded_log_probability(node) if node is not None else 0.0
+                    for bit in (0, 1):
+                        child = self.child(node, bit) if node is not None else None
+                        child_key = child if child is not None else (key, bit)
+                        if child_key in scratch:
+                            children += scratch[child_key][3]
+                        elif child is not None:
+                            children += self.node_values(child)[3]
+                        # end if
+                    # end for
+
+                    a, b = (state[2], children) if state[2] > children else (children, state[2])
+                    state[3] = log_half + a + math.log(1 + math.exp(b - a))
+                # end if
+            # end for
+
+            window.insert(0, symbol)
+            del window[self.depth:]
+        # end for
+
+        return scratch[self.root][3] if scratch else self.node_values(self.root)[3]
+    # end def
+
+    def sequence_log_probabilities(self, symbol_lists):
+        """ Returns the log conditional probabilities of the given symbol lists, considering the
+            history, as a list in the same order. See `CTWContextTree.sequence_log_probabilities`.
+
+            Each shared prefix is added once, to a further overlay, which is then thrown away.
+        """
+
+        difference = self.depth - len(self.history)
+        if difference > 0:
+            self.update([random.randint(0, 1) for i in xrange(difference)])
+        # end if
+
+        log_probabilities = [0.0] * len(symbol_lists)
+        self.sequence_log_probabilities_below(sequence_trie(symbol_lists), 0.0, log_probabilities)
+
+        return log_probabilities
+    # end def
+
+    def sequence_log_probabilities_below(self, trie, log_probability, log_probabilities):
+        """ Fills in the log probabilities of the symbol lists in the given trie, whose prefix
+            has been added to this overlay. See `CTWContextTree.sequence_log_probabilities_below`.
+        """
+
+        for index in trie.get(None, ()):
+            log_probabilities[index] = log_probability
+        # end for
+
+        root = self.node_values(self.root)[3]
+        for symbol in (0, 1):
+            branch = trie.get(symbol)
+            if branch is None:
+                continue
+            # end if
+
+            branch_log_probability = log_probability + self.predicted_log_probability(symbol) - root
+            if len(branch) == 1 and None in branch:
+                for index in branch[None]:
+                    log_probabilities[index] = branch_log_probability
+                # end for
+            else:
+                overlay = CTWOverlayContextTree(self)
+                overlay.update(symbol)
+                overlay.sequence_log_probabilities_below(branch, branch_log_probability, log_probabilities)
+            # end if
+        # end for
+    # end def
+
+    def size(self):
+        """ Returns the number of nodes in the base tree and those created by the overlay.
+        """
+
+        return self.base.size() + len(self.created)
+    # end def
+
+    def update(self, symbol_list):
+        """ Updates the overlay with a new (binary) symbol, or a list of symbols,
+            copying each node from the base tree the first time it changes.
+
+            - `symbol_list`: the symbol (or list of symbols) with which to update the tree.
+        """
+
+        if isinstance(symbol_list, int):
+            symbol_list = [symbol_list]
+        else:
+            symbol_list = list(symbol_list)
+        # end if
+
+        # A frozen tree no longer learns.
+        if self.frozen:
+            self.update_history([int(bit) for bit in symbol_list])
+            return None
+        # end if
+
+        nodes = self.nodes
+
+        for bit in symbol_list:
+            bit = int(bit)
+
+            # Not enough history for a full context yet: only record the bit.
+            if len(self.history) < self.depth:
+                self.history.append(bit)
+                continue
+            # end if
+
+            bits = self.history.context(self.depth)
+            self.update_context()
+            context = self.context
+
+            # Update from the leaf to the root, because of the dependency relationships.
+            # The deepest node is always a leaf; every other node has the next node on the path
+            # as a child, and possibly a sibling of it, which this update does not change.
+            for index in xrange(len(context) - 1, -1, -1):
+                node = context[index]
+                state = nodes.get(node)
+                if state is None:
+                    state = nodes[node] = list(self.base.node_values(node))
+                # end if
+
+                a, b = state[0], state[1]
+                state[2] += math.log(((b if bit else a) + 0.5) / (a + b + 1))
+                state[bit] += 1
+
+                if index == self.depth:
+                    state[3] = state[2]
+                else:
+                    children = log_probability + self.folded_log_probability(node)
+                    sibling = self.child(node, 1 - bits[index])
+                    if sibling is not None:
+                        children += self.node_values(sibling)[3]
+                    # end if
+
+                    a, b = (state[2], children) if state[2] > children else (children, state[2])
+                    state[3] = log_half + a + math.log(1 + math.exp(b - a))
+                # end if
+                log_probability = state[3]
+            # end for
+
+            self.history.append(bit)
+        # end for
+    # end def
+
+    def update_context(self):
+        """ Calculates the keys of the nodes that correspond to the current context,
+            and stores them in `context` in order from root to leaf.
+
+            Creates the nodes in the overlay if they do not exist.
+        """
+
+        node = self.root
+        context = [node]
+
+        for bit in self.history.context(self.depth):
+            child = self.child(node, bit)
+            if child is None:
+                # A new node: a plain object makes a unique key for it.
+                child = object()
+                self.links[(node, bit)] = child
+                self.created.add(child)
+                self.nodes[child] = [0, 0, 0.0, 0.0]
+            # end if
+            context.append(child)
+            node = child
+        # end for
+
+        self.context = context
+    # end def
+
+    def update_history(self, symbol_list):
+        """ Appends a symbol (or a list of symbols) to the overlay's history without updating the tree.
+
+            - `symbol_list`: the symbol (or list of symbols) to add to the history.
+        """
+
+        if type(symbol_list) != list:
+            self.history.append(symbol_list)
+        else:
+            self.history.extend(symbol_list)
+        # end if
+    # end def
+# end class
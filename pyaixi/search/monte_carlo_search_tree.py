@@ -14,8 +14,20 @@ from __future__ import unicode_literals
 
 import os
 import math
+import collections
+import multiprocessing
 import random
 import sys
+import time
+
+from array import array
+
+# NumPy is optional: without it, every decision node uses the pure-Python UCB loop.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+# end try
 
 # Insert the package's parent directory into the system search path, so that this package can be
 # imported when the aixi.py script is run directly from a release archive.
@@ -53,17 +65,34 @@ class MonteCarloSearchNode:
 
         Each MonteCarloSearchNode maintains several bits of information:
 
+          - The type of the node (MonteCarloSearchNode.type).
+
+          - The children of the node (`MonteCarloSearchNode.children`), which `child()` looks up.
+
+        Decision nodes also hold:
+
           - The current value of the sampled expected reward
-            (`MonteCarloSearchNode.mean`, `MonteCarloSearchNode.expectation`).
+            (`MonteCarloSearchNode.mean`).
 
           - The number of times the node has been visited during the sampling
             (`MonteCarloSearchNode.visits`).
 
-          - The type of the node (MonteCarloSearchNode.type).
+          - The actions (`MonteCarloSearchNode.actions`), in a fixed order that gives each
+            action an ordinal. `children` is a list indexed by ordinal, holding the chance node
+            for each tried action, or None for an untried one. The sampled expected reward and
+            visit count of each chance node are kept in the typed arrays `child_means` and
+            `child_visits`, also indexed by ordinal, so that the UCB policy reads only flat arrays.
+            `tried` counts the tried actions.
+            If NumPy is available, nodes with at least `vector_action_count` actions keep these
+            statistics in NumPy arrays instead, and score all their actions in one vectorized
+            expression.
+
+        The children of chance nodes are stored in a dictionary indexed by observation.
+        Under progressive widening (see `sample()`), chance nodes also record the reward
+        first received with each observation (`MonteCarloSearchNode.rewards`).
+        Chance nodes also cache the model's percept distribution in `percepts` (see `sample()`).
 
-          - The children of the node (`MonteCarloSearchNode.children`).
-            The children are stored in a dictionary indexed by action (if
-            it is a decision node) or percept (if it is a chance node).
+        The nodes use `__slots__`, so they have no per-instance attribute dictionary.
 
         The `MonteCarloSearchNode.sample` method is used to sample from the current node and
         the `MonteCarloSearchNode.selectAction` method is used to select an action according
@@ -75,6 +104,14 @@ class MonteCarloSearchNode:
     # Exploration constant for the UCB action policy.
     exploration_constant = math.sqrt(2.0)
 
+    # The number of actions from which a decision node uses NumPy arrays and vectorized UCB
+    # selection, if NumPy is available. Below this, the overhead of NumPy outweighs the loop.
+    vector_action_count = 48
+
+    # The attributes of a node. Chance nodes only use `type`, `children`, `rewards` and `percepts`.
+    __slots__ = ('type', 'children', 'rewards', 'percepts', 'mean', 'visits', 'actions', 'child_means',
+                 'child_visits', 'tried')
+
     # Instance methods.
 
     def __init__(self, nodetype):
@@ -86,72 +123,480 @@ class MonteCarloSearchNode:
         assert nodetype in nodetype_enum, "The given value %s is a not a valid node type." % str(nodetype)
         self.type = nodetype
 
-        # The children of this node.
-        # The symbols used as keys at each level may be either action or observation,
-        # depending on what type of node this is.
-        self.children = {}
+        if nodetype == chance_node:
+            # The children of this node, keyed by observation.
+            self.children = {}
+
+            # The reward received with each observation, when widening is used.
+            self.rewards = None
+
+            # The cached percept bit probabilities of the model at this node, keyed by the rewards
+            # received on the way here, once sampled. Key None holds the agent's `search_count`
+            # when they were cached, since the model changes between searches.
+            self.percepts = None
+            return
+        # end if
 
         # The sampled expected reward of this node.
         self.mean = 0.0
 
         # The number of times this node has been visited during sampling.
         self.visits = 0
+
+        # The actions and the per-action slots are allocated by `allocate_actions()`,
+        # once the actions are known.
+        self.actions = None
+        self.children = None
+        self.child_means = None
+        self.child_visits = None
+        self.tried = 0
+    # end def
+
+    def action_statistics(self):
+        """ Returns a list of `(action, visits, mean)` tuples for the tried actions of this
+            decision node, in action order.
+        """
+
+        assert self.type == decision_node
+
+        if self.actions is None:
+            return []
+        # end if
+
+        return [(self.actions[ordinal], int(self.child_visits[ordinal]), float(self.child_means[ordinal]))
+                for ordinal in range(len(self.actions)) if self.children[ordinal] is not None]
+    # end def
+
+    def add_action_statistics(self, action, visits, mean):
+        """ Merges the given visits and mean reward into the statistics of the given action
+            of this decision node, trying the action if it was untried.
+
+            - `action`: the action to add statistics for.
+            - `visits`: the number of visits to add.
+            - `mean`: the mean reward over those visits.
+        """
+
+        assert self.actions is not None, "The actions have not been allocated."
+
+        ordinal = self.actions.index(action)
+        if self.children[ordinal] is None:
+            self.children[ordinal] = MonteCarloSearchNode(chance_node)
+            self.tried += 1
+        # end if
+
+        old_visits = self.child_visits[ordinal]
+        if visits > 0:
+            self.child_means[ordinal] = (self.child_means[ordinal] * old_visits + mean * visits) / \
+                                        (old_visits + visits)
+            self.child_visits[ordinal] = old_visits + visits
+        # end if
+    # end def
+
+    def allocate_actions(self, actions):
+        """ Allocates the per-action slots of this decision node for the given actions,
+            unless they have already been allocated.
+
+            - `actions`: the sequence of all actions, as given by `Agent.generate_all_actions()`.
+        """
+
+        if self.actions is None:
+            self.actions = tuple(actions)
+            count = len(self.actions)
+            self.children = [None] * count
+            if numpy is not None and count >= self.vector_action_count:
+                self.child_means = numpy.zeros(count)
+                self.child_visits = numpy.zeros(count, dtype = numpy.int64)
+            else:
+                self.child_means = array('d', [0.0] * count)
+                self.child_visits = array('l', [0] * count)
+            # end if
+        # end if
+    # end def
+
+    def best_action(self):
+        """ Returns the tried action of this decision node with the highest mean reward,
+            or None if no action has been tried.
+        """
+
+        best_action = None
+        best_mean = None
+        for action, visits, mean in self.action_statistics():
+            if best_mean is None or mean > best_mean:
+                best_action, best_mean = action, mean
+            # end if
+        # end for
+
+        return best_action
+    # end def
+
+    def child(self, key):
+        """ Returns the child of this node for the given action (for a decision node) or
+            observation (for a chance node), or None if there is no such child.
+
+            - `key`: the action or observation.
+        """
+
+        if self.type == chance_node:
+            return self.children.get(key)
+        # end if
+
+        if self.actions is None or key not in self.actions:
+            return None
+        # end if
+
+        return self.children[self.actions.index(key)]
+    # end def
+
+    def choose_observation(self):
+        """ Returns the observation of one of the children of this chance node, chosen at
+            random in proportion to the visits of the children. Children that have not been
+            visited yet count as visited once.
+        """
+
+        assert self.type == chance_node and self.children, "The chance node has no children."
+
+        observations = list(self.children)
+        weights = [max(self.children[observation].visits, 1) for observation in observations]
+
+        pick = random.random() * sum(weights)
+        for observation, weight in zip(observations, weights):
+            pick -= weight
+            if pick < 0:
+                return observation
+            # end if
+        # end for
+
+        return observations[-1]
     # end def
 
-    def sample(self, agent, horizon):
+    def sample(self, agent, horizon, reward_range = None, widening = None, transpositions = None):
         """
         Performs one iteration of the MC tree loop: select, rollout, update.
-        Returns the accumulated reward below this node.
+        Returns the accumulated reward below this node, which must be a decision node.
+
+        The tree is walked down in a loop rather than by recursion, recording the nodes
+        on the way, the action ordinal taken at each decision node, and the reward received
+        on leaving each node. The rewards are then backed up along the recorded path, from
+        the deepest node to this one, in a second loop. The statistics are exactly those of
+        the recursive formulation in Algorithm 2 of [Veness, 2011], but the number of Python
+        frames does not grow with the horizon.
+
+        A chance node's statistics are kept by its parent decision node (see the class
+        documentation), which is the node before it on the path.
+
+        Each simulation starts from the same model, and is undone afterwards, so within one
+        search the model is in the same state at every visit to a chance node along the same
+        path. Since decision nodes are reached by observation alone, paths to a chance node can
+        differ only in the rewards received on the way. Chance nodes therefore keep a cache of
+        the model's percept bit probabilities for each sequence of rewards they are reached by
+        (see `MC_AIXI_CTW_Agent.generate_percept_and_update()`). The caches are filled in lazily
+        as percepts are sampled, and later percepts are sampled from them. The model is still
+        updated with each sampled percept. (Nodes shared through a transposition table can be
+        reached by other paths too, through other model states, and share their caches between
+        them, which makes the cache an approximation there.) The cache is bypassed if the
+        agent's `percept_caching` is off (the 'mc-percept-cache' option).
+
+        With progressive widening, a chance node visited `n` times may have at most
+        `k * n ** alpha` children. While it has fewer, a percept is sampled from the model
+        as usual; once it has that many, one of the existing children is chosen instead
+        (see `choose_observation()`), and the model is updated with its observation and
+        reward (see `MC_AIXI_CTW_Agent.replay_percept_and_update()`). This keeps chance nodes with huge observation spaces from turning into
+        wide layers of nodes that are visited only once.
+
+        With a transposition table, a chance node that needs a new decision child first
+        looks up a decision node with the same remaining horizon and the same model context
+        (see `MC_AIXI_CTW_Agent.model_context()`), and shares it if there is one, so that the
+        search tree becomes a graph. Since the remaining horizon falls at every step, the
+        graph has no cycles.
 
             - `agent`: the agent doing the sampling
             - `horizon`: how many steps into the future to sample
+            - `reward_range`: the agent's range of reward, if already known
+            - `widening`: the progressive widening parameters `(k, alpha)`,
+                          or None to add a child for every new observation
+            - `transpositions`: the `TranspositionTable` to share decision nodes through, or None
         """
 
+        assert self.type == decision_node, "Sampling starts from a decision node."
+
+        if reward_range is None:
+            reward_range = agent.range_of_reward()
+        # end if
+
+        # The path holds at most one chance and one decision node per step of the horizon,
+        # plus the node at which the walk ends.
+        path = [None] * (2 * horizon + 1)
+        ordinals = [0] * (2 * horizon + 1)
+        rewards = [0.0] * (2 * horizon + 1)
+        depth = 0
+
         reward_sum = 0.0
+        node = self
 
-        if horizon == 0:
-            assert self.type == decision_node
-            return 0.0
+        # The rewards received so far, which key the percept caches of chance nodes.
+        reward_path = ()
 
-        elif self.type == chance_node: #Sample Percept if this is a chance_node
-            # sample or from ρ(or|h)
-            observation, reward = agent.generate_percept_and_update()
-            # create node hor if it is an unvisited child.
-            if not (observation in self.children):
-                self.children[observation] = MonteCarloSearchNode(decision_node)
+        while True:
+            if horizon == 0:
+                # The end of the horizon: this node receives nothing, and is not updated.
+                assert node.type == decision_node
+                break
             # end if
-            child = self.children[observation]
-            reward_sum = reward + child.sample(agent, horizon - 1)
 
-        elif self.visits == 0: #Rollout if decision_node hasnt been visited
-            reward_sum = agent.playout(horizon)
+            path[depth] = node
 
-        else: #Select Action if this is a decision_node
-            action = self.select_action(agent, horizon)
-            agent.model_update_action(action)
-            reward_sum = self.children[action].sample(agent, horizon)
-        # end if
+            if node.type == chance_node: #Sample Percept if this is a chance_node
+                widened = True
+                if widening is not None and node.children:
+                    # The chance node's visits are kept by its parent, the node before it.
+                    visits = path[depth - 1].child_visits[ordinals[depth - 1]]
+                    widened = len(node.children) < widening[0] * visits ** widening[1]
+                # end if
+
+                if widened and not agent.percept_caching:
+                    # sample or from ρ(or|h)
+                    observation, reward = agent.generate_percept_and_update()
+                elif widened:
+                    # sample or from ρ(or|h), through the cache of this node.
+                    if node.percepts is None or node.percepts[None] != agent.search_count:
+                        node.percepts = {None: agent.search_count}
+                    # end if
+                    percept_cache = node.percepts.get(reward_path)
+                    if percept_cache is None:
+                        percept_cache = node.percepts[reward_path] = {}
+                    # end if
+                    observation, reward = agent.generate_percept_and_update(percept_cache)
+                else:
+                    # revisit an existing child hor, updating the model as a sampled percept would.
+                    observation = node.choose_observation()
+                    reward = node.rewards[observation]
+                    agent.replay_percept_and_update(observation, reward)
+                # end if
+
+                # create node hor if it is an unvisited child.
+                child = node.children.get(observation)
+                if child is None:
+                    if transpositions is not None and horizon > 1:
+                        # The decision node after this percept has `horizon - 1` steps left.
+                        key = (horizon - 1, agent.model_context())
+                        child = transpositions.get(key)
+                        if child is None:
+                            child = MonteCarloSearchNode(decision_node)
+                            transpositions.put(key, child)
+                        # end if
+                    else:
+                        child = MonteCarloSearchNode(decision_node)
+                    # end if
+                    node.children[observation] = child
+                    if widening is not None:
+                        if node.rewards is None:
+                            node.rewards = {}
+                        # end if
+                        node.rewards[observation] = reward
+                    # end if
+                # end if
+                rewards[depth] = reward
+                reward_path += (reward,)
+                node = child
+                horizon -= 1
+
+            elif node.visits == 0: #Rollout if decision_node hasnt been visited
+                reward_sum = agent.playout(horizon)
+                rewards[depth] = 0.0
+                depth += 1
+                break
+
+            else: #Select Action if this is a decision_node
+                ordinal = node.select_ordinal(agent, horizon, reward_range)
+                agent.model_update_action(node.actions[ordinal])
+                ordinals[depth] = ordinal
+                rewards[depth] = 0.0
+                node = node.children[ordinal]
+            # end if
+
+            depth += 1
+        # end while
 
-        # update node
-        self.mean = (reward_sum + self.mean * self.visits)/(self.visits + 1)
-        self.visits = self.visits + 1
+        # Back the rewards up the path, updating each node.
+        for index in range(depth - 1, -1, -1):
+            node = path[index]
+            reward_sum = rewards[index] + reward_sum
+            if node.type == chance_node:
+                parent = path[index - 1]
+                ordinal = ordinals[index - 1]
+                visits = parent.child_visits[ordinal]
+                parent.child_means[ordinal] = (reward_sum + parent.child_means[ordinal] * visits)/(visits + 1)
+                parent.child_visits[ordinal] = visits + 1
+            else:
+                node.mean = (reward_sum + node.mean * node.visits)/(node.visits + 1)
+                node.visits = node.visits + 1
+            # end if
+        # end for
 
         return reward_sum
         # NOTE: it is (observation, reward) in Algorithm 2 of [Veness, 2011]
     # end def
 
-    def sample_iterations(self, agent, horizon, iterations):
+    def is_decided(self, agent, horizon, remaining):
+        """ Returns whether the action with the best mean reward at this decision node would
+            still have the best mean after the given number of further samples, whatever
+            rewards they return.
+
+            The best action's mean can at most fall to what it would be if every remaining
+            sample went to it and returned the minimum reward at every step, and any other
+            action's mean can at most rise to what it would be if every remaining sample went
+            to that action and returned the maximum reward at every step.
+
+             - `agent`: the agent doing the sampling
+             - `horizon`: how many steps into the future each sample covers
+             - `remaining`: how many more samples could be taken
+        """
+
+        assert self.type == decision_node
+
+        # An untried action could turn out to be the best one.
+        if self.actions is None or self.tried < len(self.actions):
+            return False
+        # end if
+
+        lowest_return = horizon * agent.minimum_reward()
+        highest_return = horizon * agent.maximum_reward()
+
+        means = self.child_means
+        visits = self.child_visits
+        best = max(range(len(means)), key = lambda ordinal: means[ordinal])
+        best_low = (means[best] * visits[best] + remaining * lowest_return) / (visits[best] + remaining)
+
+        for ordinal in range(len(means)):
+            if ordinal != best:
+                child_high = (means[ordinal] * visits[ordinal] + remaining * highest_return) / \
+                             (visits[ordinal] + remaining)
+                if child_high >= best_low:
+                    return False
+                # end if
+            # end if
+        # end for
+
+        return True
+    # end def
+
+    def sample_iterations(self, agent, horizon, iterations, deadline = None, early_stop = False,
+                          widening = None, transpositions = None):
         """ Performs sampling for many iterations at this node.
+            Returns the number of iterations performed.
 
             - `agent`: the agent doing the sampling
             - `horizon`: how many steps into the future to sample
-            - `iterations`: how many iterations to perform
+            - `iterations`: how many iterations to perform, or None to sample until the deadline
+            - `deadline`: the `time.time()` value at which to stop sampling, or None for no deadline
+            - `early_stop`: whether to stop as soon as the remaining iterations, or the iterations
+                            the remaining time allows at the rate so far, could no longer change
+                            which action has the best mean (see `is_decided()`)
+            - `widening`: the progressive widening parameters `(k, alpha)`, or None (see `sample()`)
+            - `transpositions`: the `TranspositionTable` to share decision nodes through, or None
+        """
+
+        assert iterations is not None or deadline is not None, \
+               "Either a number of iterations or a deadline is needed."
+
+        # The reward range does not change during a search, so it is looked up only once.
+        reward_range = agent.range_of_reward()
+
+        start = time.time()
+        done = 0
+        while iterations is None or done < iterations:
+            # The model is restored even if the simulation is interrupted.
+            agent.set_savestate()
+            try:
+                self.sample(agent, horizon, reward_range, widening, transpositions)
+            finally:
+                agent.restore_savestate()
+            # end try
+            done += 1
+
+            now = time.time() if deadline is not None else None
+            if deadline is not None and now >= deadline:
+                break
+            # end if
+
+            if early_stop and self.type == decision_node:
+                if iterations is not None:
+                    remaining = iterations - done
+                else:
+                    remaining = 0
+                # end if
+                if deadline is not None:
+                    # Estimate the iterations that fit in the time left from the rate so far.
+                    affordable = done * (deadline - now) / max(now - start, 1e-9)
+                    remaining = affordable if iterations is None else min(remaining, affordable)
+                # end if
+
+                if self.is_decided(agent, horizon, remaining):
+                    break
+                # end if
+            # end if
+        # end while
+
+        return done
+    # end def
+
+    def scale_visits(self, factor):
+        """ Multiplies the visit counts of this node and its descendants by the given factor,
+            rounding down, and removes the descendants that are left with no visits.
+            The means are kept, so scaled nodes keep their estimates but carry less weight.
+
+             - `factor`: the factor to scale visit counts by, between 0 and 1.
         """
 
-        agent.set_savestate()
-        for i in range(iterations):
-            self.sample(agent, horizon)
-            agent.restore_savestate()
+        assert self.type == decision_node
+
+        # Walk the tree with an explicit stack, so that deep trees do not exhaust the recursion limit.
+        # The visits of each node are scaled by its parent, before the node is pushed.
+        # Decision nodes shared through a transposition table are scaled only once.
+        self.visits = int(self.visits * factor)
+        stack = [self]
+        scaled = set([id(self)])
+        while stack:
+            node = stack.pop()
+            if node.type == decision_node:
+                if node.actions is None:
+                    continue
+                # end if
+
+                for ordinal, child in enumerate(node.children):
+                    if child is None:
+                        continue
+                    # end if
+
+                    visits = int(node.child_visits[ordinal] * factor)
+                    node.child_visits[ordinal] = visits
+                    if visits == 0:
+                        # The action becomes untried again.
+                        node.children[ordinal] = None
+                        node.child_means[ordinal] = 0.0
+                        node.tried -= 1
+                    else:
+                        stack.append(child)
+                    # end if
+                # end for
+            else:
+                for key, child in list(node.children.items()):
+                    if id(child) not in scaled:
+                        scaled.add(id(child))
+                        child.visits = int(child.visits * factor)
+                        if child.visits > 0:
+                            stack.append(child)
+                        # end if
+                    # end if
+                    if child.visits == 0:
+                        del node.children[key]
+                        if node.rewards is not None:
+                            del node.rewards[key]
+                        # end if
+                    # end if
+                # end for
+            # end if
+        # end while
     # end def
 
     def select_action(self, agent, horizon):
@@ -161,48 +606,480 @@ class MonteCarloSearchNode:
              - `horizon`: how many steps into the future to sample
         """
 
+        return self.actions[self.select_ordinal(agent, horizon)]
+    # end def
+
+    def select_ordinal(self, agent, horizon, reward_range = None):
+        """ Returns the ordinal of an action selected according to UCB policy.
+
+            While there are untried actions, one of them is chosen uniformly at random, and
+            a chance node is added for it. After that, the action with the highest UCB score
+            is chosen, the first one in action order if several are tied. A tried action that
+            has no visits yet (such as one merged in with no visits) scores highest.
+
+             - `agent`: the agent which is doing the sampling.
+             - `horizon`: how many steps into the future to sample
+             - `reward_range`: the agent's range of reward, if already known
+        """
+
         assert self.type == decision_node
 
-        explored_actions = self.children.keys()
-        all_actions = agent.generate_all_actions()
-        untried_actions = list(set(all_actions) - set(explored_actions))
+        self.allocate_actions(agent.generate_all_actions())
+        children = self.children
+        count = len(children)
+
+        if self.tried < count:  # If there are untried actions
+            # choose a random untried action, by skipping the tried ones.
+            skip = int(random.random() * (count - self.tried))
+            for ordinal in range(count):
+                if children[ordinal] is None:
+                    if skip == 0:
+                        break
+                    # end if
+                    skip -= 1
+                # end if
+            # end for
 
-        if untried_actions:  # If there are untried actions
-            action = random.choice(untried_actions) # choose a random untried action
-            self.children[action] = MonteCarloSearchNode(chance_node) # add it as a new MCTS node
-            return action # return this action
+            children[ordinal] = MonteCarloSearchNode(chance_node) # add it as a new MCTS node
+            self.tried += 1
+            return ordinal # return this action
 
         else: # No untried actions. Use UCB to find the best action.
-            assert len(untried_actions) == 0, "All children should have been visited."
+            means = self.child_means
+            visits = self.child_visits
+            if reward_range is None:
+                reward_range = agent.range_of_reward()
+            # end if
+            scale = horizon * reward_range
+            log_visits = math.log(self.visits)
+            exploration_constant = self.exploration_constant
 
-            action_ucb = {}
-            reward_range = agent.range_of_reward()
-            for action in all_actions:
-                child = self.children[action]
-                action_ucb[action] = (child.mean / (horizon * reward_range)
-                    + self.exploration_constant * math.sqrt(math.log(self.visits) / child.visits))
-            # end for
+            if numpy is not None and count >= self.vector_action_count:
+                # Score every action at once; argmax returns the first of any tied maxima.
+                unvisited = numpy.flatnonzero(visits == 0)
+                if len(unvisited) > 0:
+                    return int(unvisited[0])
+                # end if
+                ucb = means / scale + exploration_constant * numpy.sqrt(log_visits / visits)
+                return int(numpy.argmax(ucb))
+            # end if
 
             # now pick the action with the highest UCB score.
-            best_action = max(action_ucb, key=action_ucb.get)
-            return best_action
+            best_ordinal = 0
+            best_ucb = None
+            for ordinal in range(count):
+                if visits[ordinal] == 0:
+                    return ordinal
+                # end if
+                ucb = means[ordinal] / scale + exploration_constant * math.sqrt(log_visits / visits[ordinal])
+                if best_ucb is None or ucb > best_ucb:
+                    best_ordinal, best_ucb = ordinal, ucb
+                # end if
+            # end for
+
+            return best_ordinal
         # end if
     # end def
 
 # end class
 
 
-def mcts_planning(agent, horizon, iterations):
+class TranspositionTable:
+    """ A bounded table of search tree decision nodes, keyed by the remaining horizon and
+        the model context at the node, for sharing nodes between paths that lead to the
+        same predictive state. When full, the least recently used node is evicted.
+
+        The table counts its lookups (`TranspositionTable.lookups`) and the lookups that
+        found a node (`TranspositionTable.hits`).
+    """
+
+    def __init__(self, capacity):
+        """ Create an empty table that holds at most the given number of nodes.
+
+            - `capacity`: the largest number of nodes to keep.
+        """
+
+        assert capacity > 0, "The transposition table capacity must be positive."
+        self.capacity = capacity
+
+        # The nodes, from the least to the most recently used.
+        self.entries = collections.OrderedDict()
+
+        # The number of lookups, and of lookups that found a node.
+        self.hits = 0
+        self.lookups = 0
+    # end def
+
+    def __len__(self):
+        return len(self.entries)
+    # end def
+
+    def clear(self):
+        """ Removes all the nodes from the table. The lookup counts are kept.
+        """
+
+        self.entries.clear()
+    # end def
+
+    def get(self, key):
+        """ Returns the node stored under the given key, marking it as the most recently used,
+            or None if there is no such node.
+
+            - `key`: a `(remaining horizon, model context)` tuple.
+        """
+
+        self.lookups += 1
+        node = self.entries.pop(key, None)
+        if node is not None:
+            self.hits += 1
+            self.entries[key] = node
+        # end if
+
+        return node
+    # end def
+
+    def put(self, key, node):
+        """ Stores the given node under the given key as the most recently used node,
+            evicting the least recently used node if the table is full.
+
+            - `key`: a `(remaining horizon, model context)` tuple.
+            - `node`: the decision node to store.
+        """
+
+        self.entries.pop(key, None)
+        self.entries[key] = node
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last = False)
+        # end if
+    # end def
+# end class
+
+
+def mcts_planning(agent, horizon, iterations, mc_tree = None, deadline = None, early_stop = False,
+                  widening = None, transpositions = None):
     """ Run the ρUCT planning algorithm for a given number of iterations with a
         given horizon distance, and return the best action found.
 
         - `agent`: the agent doing the sampling
         - `horizon`: how many cycles into the future to sample
-        - `iterations`: how many samples to take
+        - `iterations`: how many samples to take, or None to sample until the deadline
+        - `mc_tree`: the decision node to search from, which may hold statistics from
+                     earlier searches. (Default: a new, empty decision node.)
+        - `deadline`: the `time.time()` value at which to stop sampling (Default: None, no deadline)
+        - `early_stop`: whether to stop once the best action can no longer change
+                        (See `MonteCarloSearchNode.sample_iterations()`.)
+        - `widening`: the progressive widening parameters `(k, alpha)` for chance nodes,
+                      or None for no widening (See `MonteCarloSearchNode.sample()`.)
+        - `transpositions`: the `TranspositionTable` to share decision nodes through,
+                            or None for a tree without sharing
     """
+    if mc_tree is None:
+        mc_tree = MonteCarloSearchNode(decision_node)
+    # end if
+    mc_tree.sample_iterations(agent, horizon, iterations, deadline, early_stop, widening, transpositions)
+    best_action = mc_tree.best_action()
+
+    return best_action
+# end def
+
+
+def parallel_mcts_worker(agent, arguments):
+    """ Runs one independent ρUCT search on the given agent, which is a worker's copy.
+        Returns the number of iterations performed, and the visits and mean reward of each
+        action at the root, as a dictionary of `(visits, mean)` tuples.
+
+        - `agent`: the worker's copy of the agent.
+        - `arguments`: a tuple of the horizon, the number of iterations (or None), the deadline
+                       (or None), whether to stop early, the widening parameters (or None),
+                       the transposition table capacity (or 0 for none), and the random seed.
+
+        The worker's transposition table lookups and hits are returned too, as a third element.
+    """
+    horizon, iterations, deadline, early_stop, widening, capacity, seed = arguments
+    random.seed(seed)
+
+    transpositions = TranspositionTable(capacity) if capacity > 0 else None
     mc_tree = MonteCarloSearchNode(decision_node)
-    mc_tree.sample_iterations(agent, horizon, iterations)
-    best_action = max([(action,node.mean) for action,node in mc_tree.children.items()], key=lambda x: x[1])[0]
+    agent.searching = True
+    try:
+        done = mc_tree.sample_iterations(agent, horizon, iterations, deadline, early_stop, widening,
+                                         transpositions)
+    finally:
+        agent.searching = False
+    # end try
+
+    lookups = (transpositions.lookups, transpositions.hits) if transpositions is not None else (0, 0)
+    return (done, dict((action, (visits, mean)) for action, visits, mean in mc_tree.action_statistics()), lookups)
+# end def
+
+
+def parallel_search_worker(agent, connection):
+    """ The main loop of a `ParallelSearchPool` worker process. Receives messages of the
+        real model updates since the last message, the real environment's valid actions and
+        finished flag, a function and its arguments, replays the updates on its copy of the
+        agent, sets the environment values on its copy of the environment, and sends back the
+        function's result (or the exception it raised), until it receives None.
+
+        - `agent`: the worker's copy of the agent, inherited when the worker was forked.
+        - `connection`: the worker's end of the pipe to the pool.
+    """
+
+    # The worker's copy starts as a plain agent: no kept search tree, and no pool of its own.
+    agent.search_tree = None
+    agent.search_pool = None
+    agent.searching = False
+
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        # end if
+
+        updates, environment, function, arguments = message
+        try:
+            for update in updates:
+                if update[0] == 'action':
+                    agent.model_update_action(update[1])
+                else:
+                    agent.model_update_percept(update[1], update[2])
+                # end if
+            # end for
+
+            # The search reads these from the environment, and the worker's copy of the
+            # environment is never stepped.
+            agent.environment.valid_actions, agent.environment.is_finished = environment
+            result = function(agent, arguments)
+        except Exception as error:
+            result = error
+        # end try
+        connection.send(result)
+    # end while
+
+    connection.close()
+# end def
+
+
+class ParallelSearchPool:
+    """ A set of worker processes, forked once from an agent, that search copies of the agent
+        for root-parallel ρUCT (see `parallel_mcts_planning()`).
+
+        Forking a process costs more than a search at typical horizons, so the workers are kept
+        for the agent's lifetime instead of being forked for each search. Each worker keeps
+        its copy of the agent in step with the real one by replaying the real model updates:
+        the agent records each of them with `record()`, and the updates recorded since the last
+        call of `run()` are sent to every worker before its next task.
+
+        The workers' copies of the environment are not stepped, so the values of the real
+        environment that the search reads, its valid actions and finished flag, are sent
+        with each task too.
+
+        The workers are daemon processes, so they end with the process that forked them.
+    """
+
+    def __init__(self, agent, workers):
+        """ Forks the given number of workers, each with a copy of the agent as it is now.
+            Raises ValueError where processes cannot be forked.
+
+            - `agent`: the agent to search with.
+            - `workers`: the number of worker processes.
+        """
+
+        assert workers > 0, "The number of worker processes must be positive."
+
+        try:
+            context = multiprocessing.get_context('fork')
+        except (AttributeError, ValueError):
+            raise ValueError("Processes cannot be forked on this platform.")
+        # end try
+
+        # The real model updates not yet sent to the workers.
+        self.updates = []
+
+        # The real environment, whose valid actions and finished flag are sent with each task.
+        self.environment = agent.environment
+
+        # The worker processes, and the pool's end of the pipe to each.
+        self.processes = []
+        self.connections = []
+        for index in range(workers):
+            connection, worker_connection = context.Pipe()
+            process = context.Process(target = parallel_search_worker, args = (agent, worker_connection))
+            process.daemon = True
+            process.start()
+            worker_connection.close()
+            self.processes.append(process)
+            self.connections.append(connection)
+        # end for
+    # end def
+
+    def __len__(self):
+        return len(self.processes)
+    # end def
+
+    def close(self):
+        """ Stops the worker processes.
+        """
+
+        for connection in self.connections:
+            try:
+                connection.send(None)
+                connection.close()
+            except (IOError, OSError):
+                pass
+            # end try
+        # end for
+        for process in self.processes:
+            process.join(1)
+            if process.is_alive():
+                process.terminate()
+            # end if
+        # end for
+
+        self.processes = []
+        self.connections = []
+    # end def
+
+    def record(self, update):
+        """ Records a real model update of the agent, to replay on the workers' copies.
+
+            - `update`: `('action', action)` or `('percept', observation, reward)`.
+        """
+
+        self.updates.append(update)
+    # end def
+
+    def run(self, function, tasks):
+        """ Calls `function(agent, task)` for each of the given tasks, one task per worker,
+            with each worker's copy of the agent, and returns the results in task order.
+            Raises the first exception a worker raised.
+
+            If the call is interrupted, the workers may be left part way through a task, so
+            the pool is closed.
+
+            - `function`: a module-level function, so that it can be sent to the workers.
+            - `tasks`: the arguments for each call, at most one per worker.
+        """
+
+        assert len(tasks) <= len(self.connections), "There are more tasks than workers."
+
+        updates, self.updates = self.updates, []
+        environment = (list(self.environment.valid_actions), self.environment.is_finished)
+        try:
+            # Every worker replays the updates, including the ones without a task this time.
+            for index, connection in enumerate(self.connections):
+                if index < len(tasks):
+                    connection.send((updates, environment, function, tasks[index]))
+                else:
+                    connection.send((updates, environment, parallel_idle_task, None))
+                # end if
+            # end for
+            results = [connection.recv() for connection in self.connections][:len(tasks)]
+        except BaseException:
+            self.close()
+            raise
+        # end try
+
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+            # end if
+        # end for
+
+        return results
+    # end def
+# end class
+
+
+def parallel_idle_task(agent, arguments):
+    """ The task of a worker that only has to replay the real model updates.
+    """
+
+    return None
+# end def
+
+
+def parallel_mcts_planning(agent, horizon, iterations, workers, mc_tree = None, deadline = None,
+                           early_stop = False, widening = None, transpositions = None, pool = None):
+    """ Run root-parallel ρUCT: split the iterations between several worker processes,
+        each running an independent search with its own random seed, merge the visits and
+        mean rewards of each action at the roots, and return the best action found.
+
+        The workers search their own copies of the agent and its context tree, kept in a
+        `ParallelSearchPool`. Where processes cannot be forked, the search runs serially instead.
+
+        - `agent`: the agent doing the sampling
+        - `horizon`: how many cycles into the future to sample
+        - `iterations`: how many samples to take, in total, or None to sample until the deadline
+        - `workers`: how many worker processes to use
+        - `mc_tree`: the decision node to add the merged root statistics to.
+                     (Default: a new, empty decision node.)
+        - `deadline`: the `time.time()` value at which to stop sampling (Default: None, no deadline)
+        - `early_stop`: whether each worker stops once its best action can no longer change
+        - `widening`: the progressive widening parameters `(k, alpha)`, or None
+        - `transpositions`: a `TranspositionTable`, or None. Each worker uses its own empty
+                            table of the same capacity, and their lookups and hits are added
+                            to this table's counts.
+        - `pool`: the `ParallelSearchPool` of the agent, whose copies must be in step with it.
+                  (Default: a pool forked for this search only, and closed afterwards.)
+    """
+
+    if mc_tree is None:
+        mc_tree = MonteCarloSearchNode(decision_node)
+    # end if
+
+    own_pool = pool is None
+    if own_pool:
+        try:
+            pool = ParallelSearchPool(agent, workers)
+        except ValueError:
+            return mcts_planning(agent, horizon, iterations, mc_tree, deadline, early_stop, widening,
+                                 transpositions)
+        # end try
+    # end if
+
+    # Share the iterations out as evenly as possible, and give each worker its own seed.
+    workers = min(workers, len(pool))
+    if iterations is not None:
+        workers = max(1, min(workers, iterations))
+        shares = [iterations // workers + (1 if index < iterations % workers else 0)
+                  for index in range(workers)]
+    else:
+        shares = [None] * workers
+    # end if
+    capacity = transpositions.capacity if transpositions is not None else 0
+    tasks = [(horizon, share, deadline, early_stop, widening, capacity, random.getrandbits(32))
+             for share in shares]
+
+    try:
+        results = pool.run(parallel_mcts_worker, tasks)
+    finally:
+        if own_pool:
+            pool.close()
+        # end if
+    # end try
+
+    # Merge the root statistics into the given node: the visits add up, and the means are
+    # weighted by visits.
+    mc_tree.allocate_actions(agent.generate_all_actions())
+    for done, result, (lookups, hits) in results:
+        for action, (visits, mean) in result.items():
+            mc_tree.add_action_statistics(action, visits, mean)
+        # end for
+        mc_tree.visits += done
+        if transpositions is not None:
+            transpositions.lookups += lookups
+            transpositions.hits += hits
+        # end if
+    # end for
+
+    # The root's mean is the visit-weighted mean of its merged children.
+    statistics = mc_tree.action_statistics()
+    child_visits = sum(visits for action, visits, mean in statistics)
+    if child_visits > 0:
+        mc_tree.mean = sum(visits * mean for action, visits, mean in statistics) / child_visits
+    # end if
+
+    best_action = mc_tree.best_action()
 
     return best_action
 # end def
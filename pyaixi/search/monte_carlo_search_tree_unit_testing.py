@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the Monte Carlo search tree.
+"""
+
+from pyaixi.agents.mc_aixi_ctw import MC_AIXI_CTW_Agent, MC_AIXI_CTW_Undo
+from pyaixi.environments.coin_flip import CoinFlip
+from pyaixi.environments.extended_tiger import ExtendedTiger
+from pyaixi.environments.kuhn_poker import KuhnPoker
+from pyaixi.search.monte_carlo_search_tree import MonteCarloSearchNode, chance_node, decision_node
+import unittest
+import random
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+#an agent on a coin flip environment that has seen a few real cycles.
+def coin_flip_agent(**options):
+    return search_agent(CoinFlip({'coin-flip-p': 0.7}), **options)
+
+#an agent on the given environment that has seen a few real cycles of random actions.
+def search_agent(environment, **options):
+    random.seed(3)
+    agent_options = {'agent-horizon': 3, 'ct-depth': 8, 'mc-simulations': 20}
+    agent_options.update(options)
+    agent = MC_AIXI_CTW_Agent(environment, agent_options)
+    agent.model_update_percept(environment.observation, environment.reward)
+    for cycle in range(6):
+        action = random.choice(environment.valid_actions)
+        observation, reward = environment.perform_action(action)
+        agent.model_update_action(action)
+        agent.model_update_percept(observation, reward)
+    #samples are taken in search mode, as in `MC_AIXI_CTW_Agent.search()`.
+    agent.searching = True
+    return agent
+
+#the state of an agent's model.
+def agent_model_signature(agent):
+    return (agent.age, agent.total_reward, agent.last_update, agent.history_size(), agent.context_tree.size(),
+            list(agent.context_tree.history), [round(agent.context_tree.predict(symbols),10)
+                                               for symbols in ([0], [1], [0,1,1,0], [1,1,1,0,0])])
+
+#the recursive formulation of `MonteCarloSearchNode.sample()`, from Algorithm 2 of
+#[Veness, 2011], on the same nodes, drawing random numbers in the same order.
+def recursive_sample(node, agent, horizon):
+    if horizon == 0:
+        return 0.0
+    elif node.type == chance_node:
+        observation, reward = agent.generate_percept_and_update()
+        if observation not in node.children:
+            node.children[observation] = MonteCarloSearchNode(decision_node)
+        return reward + recursive_sample(node.children[observation], agent, horizon - 1)
+    elif node.visits == 0:
+        reward_sum = agent.playout(horizon)
+    else:
+        ordinal = node.select_ordinal(agent, horizon)
+        agent.model_update_action(node.actions[ordinal])
+        reward_sum = recursive_sample(node.children[ordinal], agent, horizon)
+        visits = node.child_visits[ordinal]
+        node.child_means[ordinal] = (reward_sum + node.child_means[ordinal] * visits) / (visits + 1)
+        node.child_visits[ordinal] = visits + 1
+    node.mean = (reward_sum + node.mean * node.visits) / (node.visits + 1)
+    node.visits += 1
+    return reward_sum
+
+#the chance nodes of a search tree.
+def chance_nodes(node):
+    nodes = []
+    for child in (node.children or []):
+        if child is not None:
+            nodes.append(child)
+            for decision in child.children.values():
+                nodes.extend(chance_nodes(decision))
+    return nodes
+
+#the visits, means and shape of a search tree.
+def search_tree_signature(node):
+    if node.type == chance_node:
+        return dict((observation, search_tree_signature(child)) for observation, child in node.children.items())
+    children = [None if child is None else search_tree_signature(child) for child in (node.children or [])]
+    return (node.visits, round(node.mean,10), node.action_statistics(), children)
+
+#the part of an agent that action selection uses, with a wide action space.
+class WideAgent:
+    def __init__(self, count):
+        self.count = count
+    def generate_all_actions(self):
+        return list(range(self.count))
+    def range_of_reward(self):
+        return 4
+
+
+class TestSample(unittest.TestCase):
+
+    #the iterative sampler should build the same tree as the recursive one.
+    def test_same_as_recursive(self):
+        for environment_class in [CoinFlip, ExtendedTiger, KuhnPoker]:
+            for horizon in [1, 2, 5]:
+                trees = []
+                for sample in [MonteCarloSearchNode.sample, recursive_sample]:
+                    random.seed(7)
+                    agent = search_agent(environment_class({}), **{'agent-horizon': horizon})
+                    random.seed(11)
+                    root = MonteCarloSearchNode(decision_node)
+                    for iteration in range(150):
+                        agent.set_savestate()
+                        sample(root, agent, horizon)
+                        agent.restore_savestate()
+                    trees.append(search_tree_signature(root))
+                self.assertEqual(150,trees[0][0],"incorrect visits")
+                self.assertEqual(trees[1],trees[0],"tree differs from the recursive sampler")
+
+    #a sample that revisits percepts under progressive widening should leave the model
+    #as it found it, however the model is restored.
+    def test_widened_sample_reverts(self):
+        for mode in ['journal', 'overlay', 'revert']:
+            agent = search_agent(KuhnPoker({}), **{'learning-period': 2, 'ct-simulation': mode if mode != 'revert' else 'journal'})
+            root = MonteCarloSearchNode(decision_node)
+            for iteration in range(60):
+                signature = agent_model_signature(agent)
+                if mode == 'revert':
+                    #undo by reverting the changed bits, rather than by a checkpoint or overlay.
+                    undo = MC_AIXI_CTW_Undo(agent)
+                    root.sample(agent, agent.horizon, widening = (1, 0))
+                    agent.model_revert(undo)
+                else:
+                    agent.set_savestate()
+                    root.sample(agent, agent.horizon, widening = (1, 0))
+                    agent.restore_savestate()
+                self.assertEqual(signature,agent_model_signature(agent),"model not reverted")
+            #with at most one child per chance node, later visits revisit it.
+            chance = root.child(root.best_action())
+            self.assertEqual(1,len(chance.children),"chance node widened")
+            self.assertTrue(root.action_statistics()[0][1] > 1,"no percept revisited")
+
+    #with 'mc-percept-cache' off, chance nodes should sample from the model without caching;
+    #without a transposition table, the cache gives the same tree.
+    def test_percept_cache_option(self):
+        trees = []
+        for caching in ['1', '0']:
+            random.seed(7)
+            agent = search_agent(KuhnPoker({}), **{'mc-percept-cache': caching, 'agent-horizon': 4})
+            random.seed(11)
+            root = MonteCarloSearchNode(decision_node)
+            root.sample_iterations(agent, agent.horizon, 200)
+            caches = [node.percepts for node in chance_nodes(root)]
+            if caching == '1':
+                self.assertTrue(any(cache is not None for cache in caches),"cache not used")
+            else:
+                self.assertEqual([None] * len(caches),caches,"cache used when disabled")
+            trees.append(search_tree_signature(root))
+        self.assertEqual(trees[0],trees[1],"cache changed the search")
+
+
+class TestSelectOrdinal(unittest.TestCase):
+
+    #the ordinal picked by the vectorized UCB policy and the scalar loop.
+    def select_both(self, node, agent):
+        vector_action_count = MonteCarloSearchNode.vector_action_count
+        children, tried = list(node.children), node.tried
+        random.seed(5)
+        vector = node.select_ordinal(agent, 3)
+        #trying an untried action changes the node, so undo that.
+        node.children, node.tried = children, tried
+        MonteCarloSearchNode.vector_action_count = 10 ** 9
+        try:
+            random.seed(5)
+            scalar = node.select_ordinal(agent, 3)
+        finally:
+            MonteCarloSearchNode.vector_action_count = vector_action_count
+        return vector, scalar
+
+    #the vectorized UCB policy should pick the same action as the scalar loop,
+    #including among tied actions and actions without visits.
+    def test_vector_same_as_scalar(self):
+        if numpy is None:
+            self.skipTest("NumPy is not available")
+        agent = WideAgent(64)
+        for trial in range(200):
+            node = MonteCarloSearchNode(decision_node)
+            node.allocate_actions(agent.generate_all_actions())
+            self.assertTrue(isinstance(node.child_means, numpy.ndarray),"node should be vectorized")
+            for action in agent.generate_all_actions():
+                #few distinct values, so that there are ties.
+                node.add_action_statistics(action, random.choice([1, 2, 4]), random.choice([0.0, 1.5, 3.0]))
+            if trial % 4 == 1:
+                #a tried action without visits.
+                node.child_visits[random.randrange(64)] = 0
+            elif trial % 4 == 2:
+                #untried actions.
+                for ordinal in random.sample(range(64), 3):
+                    node.children[ordinal] = None
+                    node.child_visits[ordinal] = 0
+                    node.child_means[ordinal] = 0.0
+                    node.tried -= 1
+            node.visits = int(node.child_visits.sum()) + 1
+            vector, scalar = self.select_both(node, agent)
+            self.assertEqual(scalar,vector,"vectorized selection differs")
+            if trial % 4 == 1:
+                self.assertEqual(0,node.child_visits[vector],"unvisited action not chosen")
+
+
+class TestSampleIterations(unittest.TestCase):
+
+    #sampling until a deadline should stop at the first iteration past it.
+    def test_deadline(self):
+        agent = coin_flip_agent()
+        root = MonteCarloSearchNode(decision_node)
+        start = time.time()
+        done = root.sample_iterations(agent, agent.horizon, None, deadline = start + 0.05)
+        elapsed = time.time() - start
+        self.assertTrue(done > 1,"too few iterations")
+        self.assertEqual(done,root.visits,"incorrect visits")
+        self.assertTrue(0.05 <= elapsed < 0.05 + 0.25,"deadline not respected")
+
+        agent = coin_flip_agent(**{'search-time-ms': 50, 'mc-simulations': 10 ** 9})
+        agent.searching = False
+        start = time.time()
+        agent.search()
+        self.assertTrue(time.time() - start < 0.05 + 0.25,"search time not respected")
+
+    #a root whose best action cannot change should stop after one iteration,
+    #unless early stopping is off.
+    def test_early_stop(self):
+        agent = coin_flip_agent()
+        lowest = agent.horizon * agent.minimum_reward()
+        highest = agent.horizon * agent.maximum_reward()
+        for early_stop, expected in [(True, 1), (False, 50)]:
+            root = MonteCarloSearchNode(decision_node)
+            root.allocate_actions(agent.generate_all_actions())
+            root.add_action_statistics(root.actions[0], 10000, highest)
+            root.add_action_statistics(root.actions[1], 10000, lowest)
+            root.visits = 20000
+            self.assertTrue(root.is_decided(agent, agent.horizon, 49),"root should be decided")
+            done = root.sample_iterations(agent, agent.horizon, 50, early_stop = early_stop)
+            self.assertEqual(expected,done,"incorrect early stop")
+
+        #a new root has untried actions, so it is not decided.
+        root = MonteCarloSearchNode(decision_node)
+        self.assertTrue(root.sample_iterations(agent, agent.horizon, 50, early_stop = True) > 1,"stopped too early")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -40,8 +40,8 @@ def choice(seq):
 
 def decode(symbol_list, bit_count):
     """ Decodes the value encoded on the end of a list of symbols.
-        Each symbol is a bit in the binary representation of the value, with more significant
-        bits at the end of the list.
+        Each symbol is a bit in the binary representation of the value, with the most significant
+        bit first, as produced by `encode()`.
 
         - `symbol_list` - the list of symbols to decode from.
         - `bit_count` - the number of bits from the end of the symbol list to decode.
@@ -49,49 +49,114 @@ def decode(symbol_list, bit_count):
     assert bit_count > 0, "The given number of bits (%d) is invalid." % bit_count
     assert bit_count <= len(symbol_list), "The given number of bits (%d) is greater than the length of the symbol list. (%d)" % (bit_count, len(symbol_list))
 
-    # Take the last `bit_count` number of symbols from the end of the given symbol list.
-    bits = symbol_list[-bit_count:]
-
-    # Reverse the list of bits, and make a string out of them.
-    bits.reverse()
-    bit_string = ''.join(map(str, bits))
+    # Shift each of the last `bit_count` symbols into the value, most significant bit first.
+    value = 0
+    for bit in symbol_list[-bit_count:]:
+        value = (value << 1) | int(bit)
+    # end for
 
-    # Return the bit string as an integer via the built-in int command, telling it that the number in the string is binary/base 2.
-    return int(bit_string, 2)
+    return value
 # end def
 
 def encode(integer_symbol, bit_count):
-    """ Returns an updated version of the given symbol list with the given symbol encoded into binary.
+    """ Returns the given symbol encoded into binary, as a list of `bit_count` symbols
+        with the most significant bit first.
 
-        - `symbol_list` - the list onto which to encode the value.
         - `integer_symbol` - the integer value to be encoded.
-        - `bit_count` - the number of bits from the end of the symbol list to decode.
+        - `bit_count` - the number of bits to encode the value with.
     """
     assert type(integer_symbol) == int and integer_symbol >= 0, "The given symbol must be an integer greater than or equal to zero."
 
-    # Convert the symbol into a bit string.
-    bit_string = bin(integer_symbol)
+    # Check that the number of bits is enough to hold the value.
+    assert integer_symbol >> bit_count == 0, \
+           "The given %d bits to encode with is not enough to encode %d bits." % \
+               (bit_count, bits_required(integer_symbol))
 
-    # Strip off any '0b' prefix.
-    if bit_string.startswith('0b'):
-        bit_string = bit_string[2:]
-    # end if
+    # Shift each bit out of the value, most significant bit first.
+    return [(integer_symbol >> shift) & 1 for shift in xrange(bit_count - 1, -1, -1)]
+# end def
 
-    # Convert the string into a list of integers.
-    bits = [int(bit) for bit in list(bit_string)]
+class EncodingSchema:
+    """ The binary encoding of an environment's actions and percepts, worked out once for
+        the environment, so that encoding and decoding need not ask the environment again.
 
-    # Check that the number of bits is not bigger than the given bit count.
-    bits_length = len(bits)
-    assert bit_count >= bits_length, \
-           "The given %d bits to encode with is not enough to encode %d bits." % \
-               (bit_count, bits_length)
+        - `action_bits`, `observation_bits`, `reward_bits` and `percept_bits` are the number of
+          bits used for each kind of value.
 
-    # Calculate how many bits we need to pad the bit string with, if any, and pad with zeros.
-    pad_list = [0 for i in xrange(0, bit_count - bits_length)]
-    # Return the newly created bit list, with the zero padding first.
-    symbol_list = pad_list + bits
-    return symbol_list
-# end def
+        - `action_symbols` maps each valid action to its encoding, as a tuple of symbols.
+
+        Values are encoded with the most significant bit first (see `encode()`), and a percept
+        is encoded as its reward followed by its observation.
+    """
+
+    def __init__(self, environment):
+        """ Work out the encoding for the given environment.
+
+            - `environment`: the environment whose actions and percepts are to be encoded.
+        """
+
+        self.action_bits = environment.action_bits()
+        self.observation_bits = environment.observation_bits()
+        self.reward_bits = environment.reward_bits()
+        self.percept_bits = self.observation_bits + self.reward_bits
+
+        # The encoding of each action.
+        self.action_symbols = dict((action, tuple(encode(action, self.action_bits)))
+                                   for action in environment.valid_actions)
+
+        # The mask that takes the observation out of a decoded percept.
+        self.observation_mask = (1 << self.observation_bits) - 1
+    # end def
+
+    def decode_action(self, symbol_list):
+        """ Returns the action decoded from the given list of symbols.
+
+            - `symbol_list`: the symbol list to decode the action from.
+        """
+
+        return decode(symbol_list, self.action_bits)
+    # end def
+
+    def decode_percept(self, symbol_list):
+        """ Returns the percept decoded from the beginning of the given list of symbols,
+            as a tuple of observation and reward.
+
+            - `symbol_list`: the symbol list to decode the percept from.
+        """
+
+        assert len(symbol_list) >= self.percept_bits, \
+               "The given symbol list isn't long enough to contain a percept."
+
+        # The reward is in the high bits of the percept, and the observation in the low bits.
+        percept = decode(symbol_list[:self.percept_bits], self.percept_bits)
+        return (percept & self.observation_mask, percept >> self.observation_bits)
+    # end def
+
+    def encode_action(self, action):
+        """ Returns the given action encoded as a list of symbols.
+
+            - `action`: the action to encode.
+        """
+
+        symbols = self.action_symbols.get(action)
+        if symbols is None:
+            return encode(action, self.action_bits)
+        # end if
+
+        return list(symbols)
+    # end def
+
+    def encode_percept(self, observation, reward):
+        """ Returns the given percept (an observation, reward pair) encoded as a list of symbols.
+
+            - `observation`: the observation part of the percept to encode.
+            - `reward`: the reward part of the percept to encode.
+        """
+
+        assert observation >> self.observation_bits == 0, "The given observation is too large to encode."
+        return encode((reward << self.observation_bits) | observation, self.percept_bits)
+    # end def
+# end class
 
 def enum(*sequential, **named):
     """ Define an enumeration type helper, since the operation of this codebase depends heavily on enumeration types.
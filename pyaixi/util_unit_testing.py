@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the helper functions.
+"""
+
+from pyaixi import util
+from pyaixi.environment import Environment
+from pyaixi.environments.kuhn_poker import KuhnPoker
+import unittest
+
+
+#an environment with multi-bit actions, observations and rewards.
+class WideEnvironment(Environment):
+    def __init__(self, options = {}):
+        Environment.__init__(self, options = options)
+        self.valid_actions = list(range(6))
+        self.valid_observations = list(range(38))
+        self.valid_rewards = list(range(11))
+
+
+class TestEncoding(unittest.TestCase):
+
+    #values are encoded with the most significant bit first.
+    def test_bit_order(self):
+        self.assertEqual([1,1,0],util.encode(6,3),"incorrect encoding")
+        self.assertEqual([0,0,1,1,0],util.encode(6,5),"incorrect encoding")
+        self.assertEqual(6,util.decode([1,1,0],3),"incorrect decoding")
+        self.assertEqual(6,util.decode([1,0,1,1,0],3),"decoding should read the end of the list")
+
+    def test_round_trip(self):
+        for bit_count in range(1,9):
+            for value in range(2 ** bit_count):
+                self.assertEqual(value,util.decode(util.encode(value,bit_count),bit_count),"incorrect round trip")
+
+    #every action and percept should decode to itself through the schema.
+    def test_schema_round_trip(self):
+        for environment in [WideEnvironment(), KuhnPoker()]:
+            schema = util.EncodingSchema(environment)
+            for action in environment.valid_actions:
+                symbols = schema.encode_action(action)
+                self.assertEqual(schema.action_bits,len(symbols),"incorrect action length")
+                self.assertEqual(action,schema.decode_action(symbols),"incorrect action round trip")
+            for observation in environment.valid_observations:
+                for reward in environment.valid_rewards:
+                    symbols = schema.encode_percept(observation,reward)
+                    self.assertEqual(schema.percept_bits,len(symbols),"incorrect percept length")
+                    self.assertEqual((observation,reward),schema.decode_percept(symbols),"incorrect percept round trip")
+                    self.assertEqual(symbols,util.encode(reward,schema.reward_bits) +
+                                     util.encode(observation,schema.observation_bits),"reward should come first")
+
+
+if __name__ == '__main__':
+    unittest.main()
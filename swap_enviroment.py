@@ -5,6 +5,7 @@ Created on Fri Oct  4 20:07:34 2019
 
 @author: Yan
 """
+from pyaixi import util
 from pyaixi.environment import Environment
 from pyaixi.environments import *
 import inspect 
@@ -35,15 +36,17 @@ def load(environment_title,agent,options):
             break
         
     environment = environment_class()
-    options["action-bits"] = environment.action_bits()
-    options["observation-bits"] = environment.observation_bits()
-    options["percept-bits"] = environment.percept_bits()
-    options["reward-bits"] = environment.reward_bits()
+    schema = util.EncodingSchema(environment)
+    options["action-bits"] = schema.action_bits
+    options["observation-bits"] = schema.observation_bits
+    options["percept-bits"] = schema.percept_bits
+    options["reward-bits"] = schema.reward_bits
     options["max-action"] = environment.maximum_action()
     options["max-observation"] = environment.maximum_observation()
     options["max-reward"] = environment.maximum_reward()
     
-    agent.environment = environment
+    # Rebuilds the agent's encoding schema for the new environment.
+    agent.set_environment(environment)
     agent.options = options
     
     print()